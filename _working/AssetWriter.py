@@ -0,0 +1,343 @@
+"""Contains `AssetWriter` and `IncrementalWriter`, what the `export_*` functions in ItemParser write their files through.
+Also `BlobStore` and `BlobWriter` for sharing identical files between game versions,
+`CompressingWriter` for writing precompressed copies next to them, and `QueuedWriter` for writing on a thread of its own."""
+
+from concurrent.futures import ThreadPoolExecutor, Future
+from gzip import compress as gzip_compress
+from hashlib import file_digest, sha256
+from json import load as json_load, dumps as json_dumps
+from os import makedirs, remove, replace, getpid, walk, cpu_count
+from os.path import join as path_join, dirname, isfile, relpath, splitext
+from queue import Queue
+from threading import Lock, Thread, get_ident
+from typing import Callable, NamedTuple
+try:
+    from brotli import compress as brotli_compress # Optional, only .gz files get written without it
+except ImportError:
+    brotli_compress = None
+
+def hash_file (filePath:str) -> str:
+    "Returns the hex sha256 of the contents of the given file"
+    with open(filePath, 'rb') as fin:
+        return file_digest(fin, "sha256").hexdigest()
+
+class WriteReport (NamedTuple):
+    "How many files an `IncrementalWriter` touched, see `IncrementalWriter.finish`"
+    added : int
+    changed : int
+    removed : int
+    unchanged : int
+
+class AssetWriter:
+    "Writes every file every time. The default for the `export_*` functions"
+
+    def write (self, path:str, text:str) -> bool:
+        "Writes `text` as utf-8 to the file at `path`, see `write_bytes`"
+        return self.write_bytes(path, text.encode('utf-8'))
+
+    def write_bytes (self, path:str, data:bytes) -> bool:
+        "Writes `data` to the file at `path`, making its folder if needed. Returns whether the file was written"
+        AssetWriter.atomic_write(path, data)
+        return True
+
+    @staticmethod
+    def atomic_write (path:str, data:bytes):
+        "Writes `data` to a temp file next to `path` and renames it over `path`"
+        makedirs(dirname(path) or '.', exist_ok=True)
+        tmp = f"{path}.{getpid()}.{get_ident()}.tmp"
+        with open(tmp, 'wb') as fout:
+            fout.write(data)
+        replace(tmp, path)
+
+    def finish (self) -> WriteReport|None:
+        "Call me once all exports are done"
+        return None
+
+class IncrementalWriter (AssetWriter):
+    """Only writes files whose contents changed since the last run, and deletes any that weren't written this run.
+    Keeps a manifest of 'relative path' -> 'sha256' in `targetDir`, Jekyll skips it since it starts with a dot.
+    Every write goes to a temp file first and is renamed into place, so an interrupted run never leaves half a file.
+    `keep` is for runs that only write some of the files, like with fewer stages. A file from last run that it's true for,
+    by its path relative to `targetDir`, stays in the manifest and on disk even if it wasn't written this time."""
+    MANIFEST = ".manifest.json"
+
+    def __init__(self, targetDir:str, keep:Callable[[str],bool]=lambda rel: False) -> None:
+        self.__targetDir = targetDir
+        self.__keep = keep
+        self.__manifestPath = path_join(targetDir, IncrementalWriter.MANIFEST)
+        self.__old :dict[str,str] = {}
+        if isfile(self.__manifestPath):
+            with open(self.__manifestPath, encoding='utf-8') as fin:
+                self.__old = json_load(fin)
+        self.__new :dict[str,str] = {}
+        self.__added = self.__changed = self.__unchanged = 0
+
+    def write_bytes (self, path:str, data:bytes) -> bool:
+        digest = sha256(data).hexdigest()
+        rel = relpath(path, self.__targetDir).replace('\\', '/')
+        self.__new[rel] = digest
+        if not isfile(path):
+            self.__added += 1
+        elif self.__old.get(rel) == digest:
+            self.__unchanged += 1
+            return False
+        elif rel not in self.__old: # Not in the manifest yet, check what's already there
+            with open(path, 'rb') as fin:
+                if sha256(fin.read()).hexdigest() == digest:
+                    self.__unchanged += 1
+                    return False
+            self.__changed += 1
+        else:
+            self.__changed += 1
+        IncrementalWriter.atomic_write(path, data)
+        return True
+
+    def finish (self) -> WriteReport:
+        "Deletes the files from last run that weren't written this run, saves the manifest, and reports what happened"
+        removed = 0
+        for rel in self.__old.keys() - self.__new.keys():
+            if self.__keep(rel):
+                self.__new[rel] = self.__old[rel]
+            elif isfile(p := path_join(self.__targetDir, rel)):
+                remove(p)
+                removed += 1
+        manifest = dict(sorted(self.__new.items()))
+        IncrementalWriter.atomic_write(self.__manifestPath, json_dumps(manifest, indent=0).encode('utf-8'))
+        report = WriteReport(self.__added, self.__changed, removed, self.__unchanged)
+        print("Exported %4d files: %d added, %d changed, %d removed, %d unchanged" % (
+            len(self.__new), report.added, report.changed, report.removed, report.unchanged
+        ))
+        return report
+# end IncrementalWriter
+
+class BlobStore:
+    """Files under `blobDir` named by the hash of their contents, so a file that's the same in every version is stored once.
+    Also keeps `memo` of 'whatever made it' -> hash, so work whose result is already stored can be skipped, see `save`.
+    `put` is safe to call from several threads at once."""
+    HASH_LENGTH = 32
+    "Hex digits of sha256 kept in blob names"
+    MEMO = "memo.json"
+
+    def __init__(self, blobDir:str, writer:AssetWriter|None=None) -> None:
+        "New blobs are written through `writer`, like a `CompressingWriter`"
+        self.blobDir = blobDir
+        self.__writer = writer or AssetWriter()
+        self.memo :dict[str,str] = {}
+        if isfile(p := path_join(blobDir, BlobStore.MEMO)):
+            with open(p, encoding='utf-8') as fin:
+                self.memo = json_load(fin)
+        self.__lock = Lock()
+        self.__seen :set[tuple[str,str]] = set()
+        self.added = self.reused = 0
+
+    def path (self, hash:str, ext:str) -> str:
+        return f"{self.blobDir}/{hash[:2]}/{hash}.{ext}"
+
+    def has (self, hash:str, ext:str) -> bool:
+        return isfile(self.path(hash, ext))
+
+    def put (self, data:bytes, ext:str) -> str:
+        "Stores `data` if it isn't already, returns its hash"
+        hash = sha256(data).hexdigest()[:BlobStore.HASH_LENGTH]
+        with self.__lock: # So two threads putting the same thing don't both write it
+            new = (hash, ext) not in self.__seen and not self.has(hash, ext)
+            self.__seen.add((hash, ext))
+            if new: self.added += 1
+            else: self.reused += 1
+        if new:
+            self.__writer.write_bytes(self.path(hash, ext), data)
+        return hash
+
+    def save (self):
+        "Saves `memo`, dropping anything pointing at a blob that's gone"
+        self.memo = {k : h for k, h in self.memo.items() if any(self.has(h, e) for e in ("json", "png"))}
+        AssetWriter.atomic_write(path_join(self.blobDir, BlobStore.MEMO), json_dumps(self.memo, indent=0).encode('utf-8'))
+
+    def prune (self, manifestPaths:list[str]) -> int:
+        "Deletes every blob none of the `BlobWriter` manifests at `manifestPaths` use, returns how many"
+        used :set[str] = set()
+        for p in manifestPaths:
+            with open(p, encoding='utf-8') as fin:
+                used.update(f"{h}{splitext(rel)[1]}" for rel, h in json_load(fin)["files"].items())
+        removed = 0
+        for dir, _, files in walk(self.blobDir):
+            for f in files:
+                if f not in (BlobStore.MEMO, CompressingWriter.SKIPPED) and f.removesuffix(".gz").removesuffix(".br") not in used:
+                    remove(path_join(dir, f))
+                    removed += 1
+        return removed
+# end BlobStore
+
+class BlobWriter (AssetWriter):
+    """Sends every file under one of the `blobbed` folders to `store` instead, everything else goes through `inner`.
+    `finish` writes a manifest of 'path relative to `assetsDir`' -> hash through `inner`, default.js's `asset_url` reads it.
+    `keep` works like it does for `IncrementalWriter`, by path relative to `assetsDir`, on the files of the last manifest."""
+    MANIFEST = "BlobManifest.json"
+
+    def __init__(self, store:BlobStore, assetsDir:str, manifestPath:str, blobbed:list[str], inner:AssetWriter|None=None,
+                 keep:Callable[[str],bool]=lambda rel: False) -> None:
+        self.__store = store
+        self.__assetsDir = assetsDir
+        self.__manifestPath = manifestPath
+        self.__blobbed :Callable[[str],bool] = lambda rel: any(rel.startswith(b.rstrip('/')+'/') for b in blobbed)
+        self.__inner = inner or AssetWriter()
+        self.__files :dict[str,str] = {}
+        self.__kept :dict[str,str] = {}
+        if isfile(manifestPath):
+            with open(manifestPath, encoding='utf-8') as fin:
+                self.__kept = {rel : h for rel, h in json_load(fin)["files"].items() if keep(rel)}
+
+    def write_bytes (self, path:str, data:bytes) -> bool:
+        rel = relpath(path, self.__assetsDir).replace('\\', '/')
+        if not self.__blobbed(rel):
+            return self.__inner.write_bytes(path, data)
+        self.__files[rel] = self.__store.put(data, splitext(rel)[1][1:])
+        return False # The blob might be new, but nothing at `path` was written
+
+    def add (self, path:str, hash:str):
+        "Lists a blob that was put in the store some other way, like images"
+        self.__files[relpath(path, self.__assetsDir).replace('\\', '/')] = hash
+
+    def finish (self) -> WriteReport|None:
+        files = self.__kept | self.__files
+        self.__inner.write(self.__manifestPath, json_dumps(
+            {"blobs" : relpath(self.__store.blobDir, self.__assetsDir).replace('\\', '/'), "files" : dict(sorted(files.items()))},
+            separators=(',', ':')
+        ))
+        print("Stored %4d blobs: %d new, %d already stored" % (
+            self.__store.added + self.__store.reused, self.__store.added, self.__store.reused
+        ))
+        self.__store.added = self.__store.reused = 0
+        return self.__inner.finish()
+# end BlobWriter
+
+class CompressionReport (NamedTuple):
+    "Sizes of the files a `CompressingWriter` compressed of one file type, in bytes. `br` is 0 without brotli"
+    files : int
+    raw : int
+    gz : int
+    br : int
+
+class CompressingWriter (AssetWriter):
+    """Writes through `inner`, and for files ending in one of `extensions` that `inner` actually wrote, or whose compressed
+    copies are missing, also writes '.gz' and '.br' copies at maximum compression, for hosts that serve those as they are.
+    Compression happens on `workers` threads, None meaning one per core, while the exports keep going.
+    Copies that wouldn't be smaller aren't kept, and `finish` deletes any under `targetDir` whose file is gone."""
+    LEVELS :dict[str,int] = {"gz" : 9, "br" : 11}
+    MIN_BYTES :int = 256
+    "Files smaller than this are left alone, their headers would be most of it"
+    SKIPPED = ".compress-skipped.json"
+    "In `targetDir`, 'relative path' -> the copies that weren't kept for not being smaller, so they don't count as missing"
+
+    def __init__(self, inner:AssetWriter, targetDir:str, extensions:tuple[str,...]=("json", "bin"), workers:int|None=None) -> None:
+        self.__inner = inner
+        self.__targetDir = targetDir
+        self.__extensions = tuple(f".{e}" for e in extensions)
+        self.__pool = ThreadPoolExecutor(max_workers=workers or cpu_count() or 1) # zlib and brotli let go of the GIL
+        self.__pending :list[tuple[str,Future[tuple[str,int,int,int,list[str]]]]] = []
+        self.__lock = Lock() # BlobStore can write from several threads
+        self.__skippedPath = path_join(targetDir, CompressingWriter.SKIPPED)
+        self.__skipped :dict[str,list[str]] = {}
+        if isfile(self.__skippedPath):
+            with open(self.__skippedPath, encoding='utf-8') as fin:
+                self.__skipped = json_load(fin)
+        self.report :dict[str,CompressionReport] = {}
+        "What the last `finish` compressed, by file extension"
+
+    @staticmethod
+    def __compress (path:str, data:bytes) -> tuple[str,int,int,int,list[str]]:
+        "Writes or removes the copies of one file, returns (extension, raw size, .gz size, .br size, the kinds not kept)"
+        sizes = {"gz" : 0, "br" : 0}
+        dropped :list[str] = []
+        for kind, compress in (
+            ("gz", lambda d: gzip_compress(d, CompressingWriter.LEVELS["gz"], mtime=0)), # no mtime, so the same file gives the same bytes
+            ("br", None if brotli_compress is None else lambda d: brotli_compress(d, quality=CompressingWriter.LEVELS["br"])),
+        ):
+            if compress is None: continue
+            packed = compress(data)
+            if len(packed) < len(data):
+                AssetWriter.atomic_write(f"{path}.{kind}", packed)
+                sizes[kind] = len(packed)
+            else:
+                if isfile(f"{path}.{kind}"): remove(f"{path}.{kind}")
+                sizes[kind] = len(data) # what gets served instead
+                dropped.append(kind)
+        return splitext(path)[1][1:], len(data), sizes["gz"], sizes["br"], dropped
+
+    def __missing (self, path:str) -> bool:
+        "Whether a copy of `path` that was kept last time isn't there anymore"
+        skipped = self.__skipped.get(relpath(path, self.__targetDir).replace('\\', '/'), [])
+        kinds = ("gz",) if brotli_compress is None else ("gz", "br")
+        return any(k not in skipped and not isfile(f"{path}.{k}") for k in kinds)
+
+    def write_bytes (self, path:str, data:bytes) -> bool:
+        written = self.__inner.write_bytes(path, data)
+        if len(data) >= CompressingWriter.MIN_BYTES and path.endswith(self.__extensions) and (written or self.__missing(path)):
+            with self.__lock:
+                self.__pending.append((path, self.__pool.submit(CompressingWriter.__compress, path, data)))
+        return written
+
+    def finish (self) -> WriteReport|None:
+        "Finishes `inner`, waits for the compression and stops its threads, deletes orphaned copies and prints a report by file type"
+        report = self.__inner.finish()
+        totals :dict[str,CompressionReport] = {}
+        for path, fut in self.__pending:
+            ext, raw, gz, br, dropped = fut.result()
+            t = totals.get(ext, CompressionReport(0, 0, 0, 0))
+            totals[ext] = CompressionReport(t.files + 1, t.raw + raw, t.gz + gz, t.br + br)
+            rel = relpath(path, self.__targetDir).replace('\\', '/')
+            if dropped: self.__skipped[rel] = dropped
+            else: self.__skipped.pop(rel, None)
+        self.__pending.clear()
+        self.__pool.shutdown()
+        orphans = 0
+        for dir, _, files in walk(self.__targetDir):
+            for f in files:
+                if f.endswith((".gz", ".br")) and not isfile(path_join(dir, f[:-3])):
+                    remove(path_join(dir, f))
+                    orphans += 1
+        self.__skipped = {rel : k for rel, k in sorted(self.__skipped.items()) if isfile(path_join(self.__targetDir, rel))}
+        AssetWriter.atomic_write(self.__skippedPath, json_dumps(self.__skipped, indent=0).encode('utf-8'))
+        self.report = totals
+        if not totals: print("Compressed    0 files, nothing changed")
+        for ext, t in totals.items():
+            print("Compressed %4d .%s files: %9d bytes raw, %9d gzip (%4.1f%%), %s" % (
+                t.files, ext, t.raw, t.gz, 100*t.gz/max(t.raw, 1),
+                "no brotli" if brotli_compress is None else "%9d brotli (%4.1f%%)" % (t.br, 100*t.br/max(t.raw, 1))
+            ))
+        if orphans: print("Deleted %d compressed copies of files that are gone" % orphans)
+        return report
+# end CompressingWriter
+
+class QueuedWriter (AssetWriter):
+    """Hands every file to `inner` on a thread of its own, in order, through a queue of at most `maxQueued` files,
+    so the exports get on with the next file while the disk catches up. A full queue holds them back until there's room.
+    `write_bytes` can't know yet if `inner` wrote the file, so this goes outside anything that asks, like `CompressingWriter`.
+    `finish` waits for the queue, raises whatever `inner` raised, then finishes `inner`. Only finish it once"""
+
+    def __init__(self, inner:AssetWriter, maxQueued:int=256) -> None:
+        self.__inner = inner
+        self.__queue :Queue[tuple[str,bytes]|None] = Queue(maxQueued)
+        self.__error :BaseException|None = None
+        self.__thread = Thread(target=self.__drain, name="QueuedWriter", daemon=True)
+        self.__thread.start()
+
+    def __drain (self):
+        while (job := self.__queue.get()) is not None:
+            if self.__error is not None: continue # keep taking them, so `write_bytes` never blocks forever
+            try:
+                self.__inner.write_bytes(*job)
+            except BaseException as e:
+                self.__error = e
+
+    def write_bytes (self, path:str, data:bytes) -> bool:
+        if self.__error is not None: raise self.__error
+        self.__queue.put((path, data))
+        return True
+
+    def finish (self) -> WriteReport|None:
+        self.__queue.put(None)
+        self.__thread.join()
+        if self.__error is not None: raise self.__error
+        return self.__inner.finish()
+# end QueuedWriter
@@ -0,0 +1,79 @@
+"Contains `pack_rects`, a MaxRects rectangle packer used for building sprite atlases, see `ImageDownloader.download_icon_atlas`."
+
+from typing import NamedTuple
+
+class Placement (NamedTuple):
+    "Where a rectangle ended up, see `pack_rects`"
+    sheet : int
+    "Index of the sheet it's on"
+    x : int
+    y : int
+    w : int
+    h : int
+
+Rect = tuple[int,int,int,int]
+"(x,y,w,h)"
+
+class __Sheet:
+    "A single sheet being packed, keeps the maximal free rectangles left on it"
+
+    def __init__(self, size:int) -> None:
+        self.free :list[Rect] = [(0, 0, size, size)]
+
+    def find (self, w:int, h:int) -> tuple[int,int,Rect]|None:
+        "Best short side fit, returns (short side leftover, long side leftover, spot) or None if it can't fit"
+        best :tuple[int,int,Rect]|None = None
+        for fx, fy, fw, fh in self.free:
+            if w <= fw and h <= fh:
+                dw, dh = fw-w, fh-h
+                score = (min(dw, dh), max(dw, dh), (fx, fy, w, h))
+                if best is None or score[:2] < best[:2]:
+                    best = score
+        return best
+
+    def place (self, r:Rect):
+        "Takes `r` out of every free rectangle it overlaps, keeping the free list maximal"
+        x, y, w, h = r
+        split :list[Rect] = []
+        for f in self.free:
+            fx, fy, fw, fh = f
+            if x >= fx+fw or x+w <= fx or y >= fy+fh or y+h <= fy:
+                split.append(f)
+                continue
+            if x > fx: split.append((fx, fy, x-fx, fh))
+            if x+w < fx+fw: split.append((x+w, fy, fx+fw-x-w, fh))
+            if y > fy: split.append((fx, fy, fw, y-fy))
+            if y+h < fy+fh: split.append((fx, y+h, fw, fy+fh-y-h))
+        # Drop any free rectangle that's inside another
+        split = list(set(split))
+        self.free = [
+            a for a in split
+            if not any(
+                a != b and b[0] <= a[0] and b[1] <= a[1] and a[0]+a[2] <= b[0]+b[2] and a[1]+a[3] <= b[1]+b[3]
+                for b in split
+            )
+        ]
+# end __Sheet
+
+def pack_rects (sizes:dict[str,tuple[int,int]], sheetSize:int, padding:int=1) -> dict[str,Placement]:
+    """Packs rectangles of the given 'id' -> (w,h) `sizes` onto as few `sheetSize` square sheets as it can,
+    using MaxRects with best short side fit, biggest rectangles first.
+    `padding` is left empty to the right and bottom of each rectangle so neighbours don't bleed when scaled.
+    Returns 'id' -> Placement in the same order as `sizes`."""
+    sheets :list[__Sheet] = []
+    placed :dict[str,Placement] = {}
+    for id, (w, h) in sorted(sizes.items(), key=lambda kv: (-max(kv[1]), -min(kv[1]), kv[0])):
+        pw, ph = w+padding, h+padding
+        if pw > sheetSize or ph > sheetSize:
+            raise ValueError(f"'{id}' is {w}x{h}, too big for a {sheetSize}x{sheetSize} sheet")
+        for i, sheet in enumerate(sheets):
+            if (found := sheet.find(pw, ph)) is not None: break
+        else:
+            sheets.append(__Sheet(sheetSize))
+            i, sheet = len(sheets)-1, sheets[-1]
+            found = sheet.find(pw, ph)
+        assert found is not None
+        x, y, _, _ = found[2]
+        sheet.place((x, y, pw, ph))
+        placed[id] = Placement(i, x, y, w, h)
+    return {id : placed[id] for id in sizes.keys()}
@@ -2,6 +2,7 @@
 from typing import NamedTuple, Required, Self, TypedDict, Final, Literal, TypeVar, Any, Iterator
 from collections import defaultdict
 from os.path import join as path_join
+from re import compile as re_compile, IGNORECASE
 from xml.etree.ElementTree import Element
 
 _PT = TypeVar("_PT")
@@ -19,6 +20,18 @@ def maybe (obj :_PT|None) -> _PT|Nothing:
     "Returns a falsy `Nothing` object if `obj` is None, effectively working as the save-navigation operator"
     return Nothing() if obj is None else obj
 
+def find_child (e:Element, tag:str) -> Element|None:
+    "The last child of `e` with `tag`, tags are sometimes repeated and the last one wins, else the first with it in lowercase"
+    return l[-1] if (l := e.findall(tag)) else e.find(tag.lower())
+
+__MOD_DIR = re_compile(r"%ModDir(?::([^%]+))?%", IGNORECASE)
+
+def expand_mod_dir (path:str, ownDir:str, modDirs:dict[str,str]) -> str:
+    """Replaces the `%ModDir%` mods start their paths with by `ownDir`, the folder of the mod the path is from,
+    and `%ModDir:<name>%` by the folder of the mod with that name in `modDirs`. Folders are relative to Barotrauma"""
+    if "%" not in path: return path
+    return __MOD_DIR.sub(lambda m: ownDir if m[1] is None else modDirs.get(m[1], m[0]), path)
+
 class ContentPackage (NamedTuple):
     """Can be 'Vanilla' or any other mod package for example,
     every content package is basically a list of URIs to xml files that contain various resources.
@@ -31,12 +44,16 @@ class ContentPackage (NamedTuple):
     afflictions :list[str]
     structures :list[str]
     npc_sets :list[str]
+    texts :list[str]
+    dir :str
+    "Folder the package is in relative to Barotrauma, empty for the core package"
     # Theres more types but I dont care about them rn, add 'em when you want
 
     @classmethod
-    def from_Element(cls, e:Element) -> Self:
+    def from_Element(cls, e:Element, dir:str="", modDirs:dict[str,str]={}) -> Self:
+        """`dir` and `modDirs` are for mods, see `expand_mod_dir`, their paths are expanded to be relative to Barotrauma"""
         def get_files (type:str) -> list[str]:
-            return [j for j in [i.get("file","") for i in e.findall(type)] if j!=""]
+            return [expand_mod_dir(j, dir, modDirs) for j in [i.get("file","") for i in e.findall(type)] if j!=""]
         name = e.get("name","")
         if name == "": raise ValueError("Invalid name or no name found")
         version = e.get("gameversion","").replace(".","-")
@@ -48,9 +65,27 @@ class ContentPackage (NamedTuple):
             characters=  get_files("Character"),
             afflictions= get_files("Afflictions"),
             structures= get_files("Structure"),
-            npc_sets= get_files("NPCSets")
+            npc_sets= get_files("NPCSets"),
+            texts= get_files("Text"),
+            dir=dir
         )
 
+class Provenance (NamedTuple):
+    "Where the element an item was built from came from, see `merge_provenance` in ItemParser"
+    package :str
+    "Name of the content package whose element won"
+    url :str
+    "File the winning element is in"
+    overrides :list[str]
+    "Files with an earlier element of the same identifier that this one replaced, in load order"
+    parent :str|None
+    "File the winning element of its `variantof` is in, None if it isn't a variant"
+
+    @property
+    def files (self) -> list[str]:
+        "Every file the item has to be rebuilt for if it changes"
+        return [self.url] if self.parent is None else [self.url, self.parent]
+
 
 # <Clear/>
 # price can be alone
@@ -117,6 +152,9 @@ LISTED_DEFAULT_LISTING = DefaultListing(
     requiresUnlock= False
 )
 
+LISTING_ATTRIBUTES :Final[tuple[tuple[str,str],...]] = tuple((k, k.lower()) for k in DEFAULT_LISTING.keys())
+"(`Listing` key, its attribute on a 'Price' element), in the order `Listing` has them"
+
 def Element_to_Listing (e:Element) -> Listing:
     def parse_str (obj:str) -> int|float|bool|str:
         if obj.lower() == 'true': return True
@@ -128,8 +166,8 @@ def Element_to_Listing (e:Element) -> Listing:
         return obj
     kwargs :dict[str,Any] = {
         k : parse_str(x)
-        for k in DEFAULT_LISTING.keys()
-        if (x := e.get(k.lower()))
+        for k, a in LISTING_ATTRIBUTES
+        if (x := e.get(a))
     }
     if (x := e.findall('Reputation')):
         kwargs['repRequired'] = {
@@ -143,19 +181,20 @@ PricingInfo = defaultdict[str, Listing]
 
 def Element_to_PricingInfo (parent:Element|None) -> PricingInfo | None:
     if parent is None: return None
-    if parent.tag != "Price" : raise ValueError(f"Expected a 'Price' element but was '{parent.tag}'")
+    if parent.tag.lower() != "price" : raise ValueError(f"Expected a 'Price' element but was '{parent.tag}'")
     default = Element_to_Listing(parent)
     rf = parent.get('requiredfaction')
-    req = Element('Reputation', {'faction': r, 'min': '20'}) if (r := parent.get('requiredfaction')) else None
-    pinfo :defaultdict[str, Listing] = defaultdict(lambda: default)
+    pinfo :defaultdict[str, Listing] = defaultdict(default.copy) # not a lambda, so it can be pickled
     for p in parent.findall('Price'):
         if (id := p.get('storeidentifier','')):
-            if req is not None: p.append(req)
-            pinfo[id.removeprefix('merchant')] = Element_to_Listing(p)
+            listing = Element_to_Listing(p)
+            if rf: listing['repRequired'] = (listing.get('repRequired') or {}) | {rf: 20} # same as a <Reputation> child
+            pinfo[id.removeprefix('merchant')] = listing
     # TODO: a `<Clear/>` within a price tag... wth do we do?
     return pinfo
 
 def get_price_from_PricingInfo (p:PricingInfo, merchant:str="default") -> float:
+    "The buying price of a single item from a single `merchant`, use a `PriceMatrix` for anything more than that"
     m = p[merchant]
     d = maybe(p.default_factory)() or {}
     basePrice = m.get("basePrice") or d.get('basePrice') or DEFAULT_LISTING["basePrice"]
@@ -175,7 +214,7 @@ class Deconstructable (NamedTuple):
     def from_Element (cls, e:Element|None) -> Self|None:
         "Expects Deconstruct Element `e`, returns None if `e` is None"
         if e is None: return None
-        if e.tag != "Deconstruct": raise ValueError(f"Expected 'Deconstruct' Element but was '{e.tag}'")
+        if e.tag.lower() != "deconstruct": raise ValueError(f"Expected 'Deconstruct' Element but was '{e.tag}'")
         time = e.get("time", "")
         if time=="": raise KeyError("ASFASREFER") # TODO: me
         items = e.findall("Item")
@@ -230,6 +269,9 @@ class Recipe (NamedTuple):
 Colour = tuple[float,float,float]
 WHITE = (1.0, 1.0, 1.0)
 
+ROOTED_DIRS :Final[tuple[str,...]] = ("Content/", "LocalMods/", "WorkshopMods/")
+"Texture paths starting with one of these are relative to Barotrauma, others to the folder of their file. Mods expand to theirs"
+
 class Texture (NamedTuple):
     """Stores information needed to fetch a texture image for an item.
     Used for InventoryIcon and Sprite."""
@@ -246,7 +288,7 @@ class Texture (NamedTuple):
         `dir` should be the rel path to where the Element was found"""
         tex = e.get("texture", "")
         if tex == "": raise KeyError("Expected a 'texture' attribute but not found")
-        if not tex.startswith("Content/"):
+        if not tex.startswith(ROOTED_DIRS):
             tex = path_join(dir, tex)
         rect = e.get("sourcerect", "")
         if rect != "":
@@ -268,7 +310,7 @@ class InventoryIcon (Texture):
     def from_Element (cls, e:Element|None, dir:str, colour:Colour|None=None) -> Self|None:
         "Same as Texture.from_Element(). Expects an 'InventoryIcon' Element, it may be None in which case None is returned"
         if e is None: return None
-        if e.tag != "InventoryIcon": raise ValueError(f"Expected an 'InventoryIcon' Element but was '{e.tag}'")
+        if e.tag.lower() != "inventoryicon": raise ValueError(f"Expected an 'InventoryIcon' Element but was '{e.tag}'")
         return super().from_Element(e, dir, colour)
 
 class Sprite (Texture):
@@ -280,6 +322,91 @@ class Sprite (Texture):
         if e.tag.lower() != "sprite": raise ValueError(f"Expected an 'Sprite' Element but was '{e.tag}'")
         return super().from_Element(e, dir, colour)
 
+ITEM_CHILD_TAGS :Final[frozenset[str]] = frozenset({
+    "sprite", "inventoryicon", "geneticmaterial", "price", "deconstruct", "fabricate"
+})
+"Lowercased tags of the child elements `Item.from_Element` reads, anything else under an item can be thrown away"
+
+OWN_ATTRIBUTES :Final[frozenset[str]] = frozenset({"identifier", "variantof", "nameidentifier", "descriptionidentifier", "dir", "file"})
+"Lowercased attributes a variant never takes from its parent, 'dir' and 'file' being the ones `fetch_xml_elements` adds"
+REPLACED_TAGS :Final[frozenset[str]] = frozenset({"fabricate"})
+"Lowercased tags where a variant having any replaces all of its parent's, each one is a recipe of its own"
+
+def merge_variant (e:Element, parent:Element) -> Element:
+    """A new element of `e` with what it leaves out filled in from `parent`, the element it's a `variantof`. Neither is changed.
+    Missing attributes come from the parent, ignoring case. A child the parent has and `e` has none of is copied over,
+    with the parent's folder in '__dir' so its textures still resolve. Where both have one, `e`'s last one of that tag gets
+    the attributes it's missing from the parent's first one, and its children too if it has none, see `REPLACED_TAGS`.
+    Children that don't need changing are shared rather than copied, so nothing should change the merged element either."""
+    def attributes (own:Element, other:Element, skip:frozenset[str]=frozenset()) -> dict[str,str]:
+        ownKeys = {k.lower() for k in own.keys()} | skip
+        return {k : v for k, v in other.items() if k.lower() not in ownKeys} | dict(own.items())
+    merged = Element(e.tag, attributes(e, parent, OWN_ATTRIBUTES))
+    merged.text = e.text
+    last :dict[str,Element] = {c.tag.lower() : c for c in e}
+    first :dict[str,Element] = {}
+    for c in parent:
+        first.setdefault(c.tag.lower(), c)
+    for c in e:
+        tag = c.tag.lower()
+        if c is not last[tag] or tag in REPLACED_TAGS or (p := first.get(tag)) is None:
+            merged.append(c)
+            continue
+        child = Element(c.tag, attributes(c, p, frozenset({"__dir"}))) # it's still `e`'s child, in `e`'s folder
+        child.text, child.tail = c.text, c.tail
+        child.extend(list(c) or list(p))
+        merged.append(child)
+    for c in parent:
+        if c.tag.lower() not in last:
+            if c.get("__dir") is None: # not `copy(c)`, that would share its attribute dict
+                child = Element(c.tag, c.attrib, __dir=parent.get("dir", ""))
+                child.text, child.tail = c.text, c.tail
+                child.extend(c)
+                c = child
+            merged.append(c)
+    return merged
+
+class VariantResolver:
+    """Construct me with 'identifier' -> element, like `fetch_xml_elements` gives. `resolver[id]` is the element of `id`
+    merged with every `variantof` above it, however deep, see `merge_variant`. Each one is worked out once, on first use.
+    The elements given are never changed. If a chain loops back on itself every element on the loop is taken as it is,
+    whichever one was asked for first, with a warning."""
+
+    def __init__(self, elements:dict[str,Element]) -> None:
+        self.elements = elements
+        self.__merged :dict[str,Element] = {}
+
+    def ancestors (self, id:str) -> list[str]:
+        "What `id` is a variant of, and what that is a variant of and so on, nearest first. Stops at a loop or a missing one"
+        chain :list[str] = []
+        at = self.elements[id].get("variantof", "")
+        while at in self.elements and at != id and at not in chain:
+            chain.append(at)
+            at = self.elements[at].get("variantof", "")
+        return chain
+
+    def __getitem__ (self, id:str) -> Element:
+        if (done := self.__merged.get(id)) is not None: return done
+        chain :list[str] = [] # walked up from `id` until something already merged, or the top
+        at :str = id
+        while at not in self.__merged:
+            if at in chain: # a loop, nothing on it has a parent
+                loop = chain[chain.index(at):]
+                print("Warning: variantof loops through %s" % " -> ".join(loop + [at]))
+                for l in loop:
+                    self.__merged[l] = self.elements[l]
+                chain = chain[:chain.index(at)]
+                break
+            chain.append(at)
+            at = self.elements[at].get("variantof", "")
+            if at not in self.elements: break
+        for c in reversed(chain):
+            pid = self.elements[c].get("variantof", "")
+            parent = self.__merged.get(pid) if pid in self.elements else None
+            self.__merged[c] = self.elements[c] if parent is None else merge_variant(self.elements[c], parent)
+        return self.__merged[id]
+# end VariantResolver
+
 class Item (NamedTuple):
     "Contains all important information relavent for a given item"
     id : str
@@ -303,45 +430,37 @@ class Item (NamedTuple):
     sprite : Sprite
     "Info for how to get the in game sprite texture for this item"
 
+    @staticmethod
+    def text_ids (e:Element, variantOf:Element|None = None) -> list[str]:
+        """The text ids `from_Element` looks up the name and description of `e` with. Genetic materials also get the id
+        of their type's name, that replaces '[type]' in the name, and what replaces '[value]' in the description.
+        `variantOf` works the same as for `from_Element`."""
+        if variantOf is not None: e = merge_variant(e, variantOf)
+        id = e.get("identifier", "")
+        ids = [f"entityname.{e.get('nameidentifier', id)}", f"entitydescription.{e.get('descriptionidentifier', id)}"]
+        if (g := find_child(e, "GeneticMaterial")) is not None:
+            ids += [g.get("nameidentifier", ""), f"{g.get('tooltipvaluemin', '')}-{g.get('tooltipvaluemax', '')}"]
+        return ids
+
     @classmethod
-    def from_Element (cls, e:Element, texts:dict[str,str], variantOf:Element|None = None) -> Self|None:
+    def from_Element (cls, e:Element, texts:dict[str,list[str]], variantOf:Element|None = None) -> Self|None:
         """Parses the given Element and constructs an Item object.
-        `texts` is for i18n as 'text id' -> 'text', see fetch_language().
+        `texts` is for i18n as 'text id' -> 'texts', see fetch_language().
         Returns None if `e` is invalid, meaning a valid Item could not be created.
-        If the item is a variation of another item, pass in `variantOf`."""
+        If the item is a variation of another item, pass in `variantOf`, already merged with its own parents if it has any.
+        `VariantResolver` does both, and neither `e` nor `variantOf` is changed, see `merge_variant`."""
         # e.tag NOT guaranteed to be Item for whatever reason, see Medical folder
         dir = e.get("dir", "") # dir is supplied by me, used for sprites/icons
         if dir == "": return None
-        def fetch (target:str) -> Element | None:
-            i = l[-1] if (l := e.findall(target)) else None # catch for weird edge case of duplicate tags, take last
-            if i is None: i = e.find(target.lower())
-            if i is None:
-                if variantOf is None: return None
-                j = variantOf.find(target)
-                if j is None: j = variantOf.find(target.lower())
-                if j is None: return None
-                j.set('__dir', variantOf.get('dir',''))
-                return j
-            if variantOf is not None:
-                j = variantOf.find(target)
-                if j is None: j = variantOf.find(target.lower())
-                if j is not None:
-                    if not len(i):
-                        i.extend(iter(j)) # Update i with j's children if i doesnt have any
-                    ik = i.keys()
-                    for jk, ji in j.items():
-                        if jk not in ik:
-                            i.set(jk, ji) # Set attribute from variantOf if parent doesnt have it
-            return i
-        # end func
-        e_sprite = fetch("Sprite")
-        e_icon = fetch("InventoryIcon")
+        if variantOf is not None: e = merge_variant(e, variantOf)
+        e_sprite = find_child(e, "Sprite")
+        e_icon = find_child(e, "InventoryIcon")
         if e_sprite is None: return None
         id :str = e.get("identifier") or e.get("file","")+f"_{hash(e)}"
         name :str = texts.get(f"entityname.{e.get('nameidentifier', id)}", [id])[0]
         desc :str = texts.get(f"entitydescription.{e.get('descriptionidentifier', id)}", [""])[0] #or texts.get(f"entitydescription.{id}", "")
         def backup_get (target:str, default:str)->str:
-            return e.get(target.lower()) or e.get(target) or maybe(variantOf).get(target.lower()) or maybe(variantOf).get(target) or default
+            return e.get(target.lower()) or e.get(target) or default
         cat :str = backup_get("Category", "None")
         # with suppress(AttributeError): # Handle Genetic Material genericism
         name, desc = (lambda g: (
@@ -350,10 +469,10 @@ class Item (NamedTuple):
                 (g.get("nameidentifier",''))),
             (lambda v0,v1: desc.replace("[value]", f"{v0}-{v1}"))
             (g.get("tooltipvaluemin",''), g.get("tooltipvaluemax",''))
-        ))(fetch("GeneticMaterial") or {})
+        ))(g if (g := find_child(e, "GeneticMaterial")) is not None else {}) # an element without children is falsy
         e_t :str = backup_get("Tags", "")
-        e_p :Element|None = fetch("Price")
-        e_f :list[Element] = e.findall("Fabricate") or maybe(variantOf).findall("Fabricate") or []
+        e_p :Element|None = find_child(e, "Price")
+        e_f :list[Element] = e.findall("Fabricate")
         def parse_colour (key:str) -> Colour|None:
             valueStr = backup_get(key, "")
             if valueStr=="": return None
@@ -368,7 +487,7 @@ class Item (NamedTuple):
             id=id, name=name, desc=desc, category=cat,
             tags= [s.strip() for s in e_t.split(",")],
             priceInfo=Element_to_PricingInfo(e_p),
-            deconsTo= Deconstructable.from_Element(fetch("Deconstruct")),
+            deconsTo= Deconstructable.from_Element(find_child(e, "Deconstruct")),
             recipes= [r for r in [Recipe.from_Element(f) for f in e_f] if r is not None],
             icon= InventoryIcon.from_Element(e_icon, maybe(e_icon).get('__dir') or dir, _ic),
             sprite= Sprite.from_Element(e_sprite, e_sprite.get('__dir') or dir, _sc)
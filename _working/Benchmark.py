@@ -0,0 +1,240 @@
+"""Contains `write_synthetic_install`, a made up Barotrauma install of whatever size is asked for, and `bench_stages`,
+which times each stage of `ItemParser.main` on an install. Neither needs the game, Steam or the internet, so `bench_main`
+runs anywhere: `python _working/Benchmark.py [items] [workers]`."""
+
+from os import makedirs
+from os.path import dirname, join as path_join
+from random import Random
+from struct import pack
+from time import perf_counter
+from typing import Callable, Final, NamedTuple, TypeVar
+from xml.sax.saxutils import escape, quoteattr
+from zlib import compress, crc32
+try:
+    from resource import getrusage, RUSAGE_SELF # Not on Windows
+except ImportError:
+    getrusage = None
+
+_T = TypeVar("_T")
+
+LANGUAGES :Final[list[str]] = [
+    "English", "German", "French", "Russian", "Polish", "Castilian Spanish", "Latinamerican Spanish", "Brazilian Portuguese",
+    "Simplified Chinese", "Traditional Chinese", "Japanese", "Korean", "Turkish",
+]
+"The game's own language folders, `SyntheticSpec.languages` takes the first few"
+CATEGORIES :Final[list[str]] = ["Material", "Equipment", "Medical", "Weapon", "Diving", "Electrical", "Fuel", "Misc"]
+
+class SyntheticSpec (NamedTuple):
+    "How much `write_synthetic_install` makes, every `...Every` of 0 means none"
+    items :int = 2000
+    "Items, variants included"
+    itemsPerFile :int = 250
+    variantEvery :int = 10
+    "Every n-th item is a `variantof` the one before it, only overriding its price and tags"
+    priceEvery :int = 2
+    recipeEvery :int = 3
+    deconEvery :int = 3
+    iconEvery :int = 2
+    "Every n-th item has an InventoryIcon as well as its Sprite, cut by sheetindex instead of sourcerect"
+    merchants :int = 8
+    sheets :int = 8
+    sheetSize :int = 1024
+    spriteSize :int = 64
+    languages :int = 3
+    version :str = "1.0.0.0"
+    seed :int = 0
+
+def __png (width:int, height:int, rows:list[bytes]) -> bytes:
+    "An RGBA PNG of the given rows of pixels, each `width`*4 bytes, written with just zlib"
+    def chunk (kind:bytes, data:bytes) -> bytes:
+        return pack(">I", len(data)) + kind + data + pack(">I", crc32(kind + data))
+    raw = b"".join(b"\0" + r for r in rows) # filter type 0 on every row
+    return b"".join([
+        b"\x89PNG\r\n\x1a\n",
+        chunk(b"IHDR", pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)),
+        chunk(b"IDAT", compress(raw, 6)),
+        chunk(b"IEND", b""),
+    ])
+
+def __sheet (spec:SyntheticSpec, rng:Random) -> bytes:
+    "A sprite sheet of solid squares with a clear 1 pixel border each, `spec.spriteSize` apart"
+    s, cells = spec.spriteSize, spec.sheetSize // spec.spriteSize
+    clear = bytes(4)
+    rows :list[bytes] = []
+    for _ in range(cells):
+        colours = [bytes([rng.randrange(256), rng.randrange(256), rng.randrange(256), 255]) for _ in range(cells)]
+        edge = clear * spec.sheetSize
+        inner = b"".join(clear + c*(s-2) + clear for c in colours)
+        rows += [edge] + [inner]*(s-2) + [edge]
+    return __png(spec.sheetSize, spec.sheetSize, rows)
+
+def __item_xml (n:int, spec:SyntheticSpec, rng:Random, merchants:list[str]) -> str:
+    "The `<Item>` element of the `n`th item"
+    id = f"synth{n}"
+    cells = spec.sheetSize // spec.spriteSize
+    sheet, slot = n % spec.sheets, (n // spec.sheets) % (cells*cells)
+    texture = f"Content/Items/Synthetic/sheet{sheet}.png"
+    tags = ",".join(["smallitem", f"synthtag{n%17}"] + (["mediumitem"] if n%5 == 0 else []))
+    price = ""
+    if spec.priceEvery and n % spec.priceEvery == 0:
+        stores = "".join(
+            f'<Price storeidentifier="merchant{m}" multiplier="{rng.choice(["0.9","1","1.1","1.25"])}"'
+            f' minavailable="{rng.randrange(0,4)}" maxavailable="{rng.randrange(4,12)}" sold="{rng.choice(["true","false"])}"/>'
+            for m in rng.sample(merchants, min(3, len(merchants)))
+        )
+        price = f'<Price baseprice="{rng.randrange(5, 5000)}" soldeverywhere="false">{stores}</Price>'
+    if spec.variantEvery and n % spec.variantEvery == spec.variantEvery-1 and n > 0:
+        return f'<Item identifier="{id}" variantof="synth{n-1}" tags="{tags},variant">{price}</Item>'
+    priced = range(0, n, spec.priceEvery or 1) # what recipes are made of has a price, or filter_items would drop it
+    earlier = [f"synth{m}" for m in rng.sample(priced, min(len(priced), 3))] # only ever earlier items, so trees end
+    fabricate = ""
+    if spec.recipeEvery and n % spec.recipeEvery == 0 and earlier:
+        required = "".join(f'<RequiredItem identifier="{e}" amount="{rng.randrange(1,4)}"/>' for e in earlier)
+        fabricate = (f'<Fabricate suitablefabricators="fabricator" requiredtime="{rng.randrange(5,60)}" amount="{rng.choice([1,1,1,2,4])}">'
+            f'<RequiredSkill identifier="mechanical" level="{rng.randrange(0,60)}"/>{required}</Fabricate>')
+    decon = ""
+    if spec.deconEvery and n % spec.deconEvery == 0 and earlier:
+        decon = f'<Deconstruct time="10">{"".join(f"<Item identifier={quoteattr(e)}/>" for e in earlier[:2])}</Deconstruct>'
+    icon = ""
+    if spec.iconEvery and n % spec.iconEvery == 0:
+        icon = (f'<InventoryIcon texture="{texture}" sheetindex="{slot%cells},{slot//cells}"'
+            f' sheetelementsize="{spec.spriteSize},{spec.spriteSize}" origin="0.5,0.5"/>')
+    colour = f' inventoryiconcolor="{rng.randrange(256)},{rng.randrange(256)},{rng.randrange(256)},255"' if n % 7 == 0 else ""
+    return (
+        f'<Item identifier="{id}" category="{CATEGORIES[n % len(CATEGORIES)]}" tags="{tags}" cargocontaineridentifier="metalcrate"'
+        f' scale="0.5" impactsoundtag="impact_metal_light"{colour}>'
+        f'<Sprite texture="{texture}" sourcerect="{slot%cells*spec.spriteSize},{slot//cells*spec.spriteSize},{spec.spriteSize},{spec.spriteSize}" depth="0.55" origin="0.5,0.5"/>'
+        f'{icon}{price}{fabricate}{decon}'
+        f'<Body width="{spec.spriteSize-4}" height="{spec.spriteSize-4}" density="20"/>'
+        f'<Holdable slots="Any,RightHand,LeftHand" aimpos="35,-10" handle1="0,0" msg="ItemMsgPickUpSelect">'
+        f'<StatusEffect type="OnUse" target="This" Condition="-1"><Sound file="Content/Items/Synthetic/use.ogg"/></StatusEffect>'
+        f'</Holdable></Item>'
+    )
+
+def write_synthetic_install (rootDir:str, spec:SyntheticSpec=SyntheticSpec()) -> list[str]:
+    """Writes a Barotrauma install with nothing but `spec.items` made up items into `rootDir`, laid out like the game's:
+    a Vanilla content package listing the item, text and npc set files, sprite sheets, and texts in `spec.languages` languages.
+    The same `spec` always writes the same files. Returns the item ids"""
+    rng = Random(spec.seed)
+    def write (rel:str, data:str|bytes):
+        makedirs(dirname(path_join(rootDir, rel)), exist_ok=True)
+        with open(path_join(rootDir, rel), 'wb') as fout:
+            fout.write(data.encode('utf-8') if isinstance(data, str) else data)
+    merchants = [f"merchant{m}" for m in range(spec.merchants)]
+    ids = [f"synth{n}" for n in range(spec.items)]
+    itemFiles :list[str] = []
+    for f in range(0, spec.items, spec.itemsPerFile):
+        rel = f"Content/Items/Synthetic/synthetic{f // spec.itemsPerFile}.xml"
+        write(rel, "<Items>\n" + "\n".join(__item_xml(n, spec, rng, merchants) for n in range(f, min(f+spec.itemsPerFile, spec.items))) + "\n</Items>")
+        itemFiles.append(rel)
+    for s in range(spec.sheets):
+        write(f"Content/Items/Synthetic/sheet{s}.png", __sheet(spec, rng))
+    write("Content/NPCSets/Merchants.xml", '<npcsets><npcset identifier="outpostnpcs">' + "".join(
+        f'<npc identifier="{m}" campaigninteractiontype="Store" skilllevel="20"/>' for m in merchants + ["merchanttutorial"]
+    ) + '<npc identifier="securitynpc"/></npcset></npcsets>')
+    textFiles :list[str] = []
+    for lang in LANGUAGES[:spec.languages]:
+        rel = f"Content/Texts/{lang}/{lang.replace(' ', '')}Vanilla.xml"
+        write(rel, f'<infotexts language="{lang}" nativename="{lang}" translatedname="{lang}">\n' + "\n".join(
+            f"<entityname.{id}>{escape(lang)} Item {n}</entityname.{id}>"
+            f"<entitydescription.{id}>{escape(lang)} description of item {n}, it does something or other.</entitydescription.{id}>"
+            for n, id in enumerate(ids)
+        ) + "\n</infotexts>")
+        textFiles.append(rel)
+    write("Content/ContentPackages/Vanilla.xml",
+        f'<contentpackage name="Vanilla" gameversion="{spec.version}" corepackage="true">\n' + "\n".join(
+            [f'<Item file="{f}"/>' for f in itemFiles] + [f'<Text file="{f}"/>' for f in textFiles] + ['<NPCSets file="Content/NPCSets/Merchants.xml"/>']
+        ) + "\n</contentpackage>")
+    return ids
+
+class StageResult (NamedTuple):
+    "How long one stage took and how much it held onto at once, see `bench_stages`"
+    stage :str
+    seconds :float
+    count :int
+    "Items, or elements or texts, that went through it"
+    peakBytes :int
+    "Most memory traced during it, -1 if it wasn't measured"
+
+def bench_stages (rootDir:str, targetDir:str, workers:int|None=1, stream:bool=False, images:bool=True, memory:bool=True) -> list[StageResult]:
+    """Runs each stage of `ItemParser.main` on the install in `rootDir`, writing everything into `targetDir`.
+    With `memory`, each stage is run a second time under tracemalloc for its peak, so tracing doesn't slow the timed run."""
+    from tracemalloc import start, stop, get_traced_memory, reset_peak
+    from ItemParser import (
+        fetch_content_package, fetch_merchants, fetch_xml_elements, fetch_language, fetch_languages, fetch_language_names,
+        fetch_items, filter_items, fetch_text_ids, text_keys, export_items_to_json, export_item_bundles, export_default_price_info,
+        export_items_to_searchDoc, export_items_to_searchIndex, export_items_to_viewlist, export_items_to_viewbin, export_text_shards,
+    )
+    from BaroInterface import Item
+    from RecipeGraph import RecipeGraph
+    from PriceMatrix import PriceMatrix
+    results :list[StageResult] = []
+    def stage (name:str, work:Callable[[],_T], count:int|None=None) -> _T:
+        t = perf_counter()
+        out = work()
+        took = perf_counter() - t
+        peak = -1
+        if memory:
+            start()
+            reset_peak()
+            work()
+            peak = get_traced_memory()[1]
+            stop()
+        results.append(StageResult(name, took, len(out) if count is None else count, peak)) # type: ignore , count is given when out has no len
+        return out
+    package = fetch_content_package(rootDir, "Vanilla")
+    merchants = fetch_merchants(rootDir, package.npc_sets)
+    xmlItems = stage("fetch_xml_elements", lambda: fetch_xml_elements(rootDir, package.items, workers, stream))
+    texts = stage("fetch_language", lambda: fetch_language(rootDir, "English", stream))
+    def parse_items () -> dict[str,Item]:
+        items = fetch_items(xmlItems, texts)
+        filter_items(items)
+        return items
+    items = stage("fetch_items", parse_items)
+    n = len(items)
+    out = f"{targetDir}/json"
+    stage("export_items_to_json", lambda: export_items_to_json(items, out), n)
+    stage("export_item_bundles", lambda: export_item_bundles(items, out), n)
+    stage("export_default_price_info", lambda: export_default_price_info(f"{out}/DefaultListing.json", merchants), len(merchants))
+    stage("export_items_to_searchDoc", lambda: export_items_to_searchDoc(items, f"{out}/SearchDoc.json"), n)
+    stage("export_items_to_searchIndex", lambda: export_items_to_searchIndex(items, f"{out}/SearchIndex.json"), n)
+    stage("export_items_to_viewlist", lambda: export_items_to_viewlist(items, f"{out}/ViewItemsList.json"), n)
+    stage("export_items_to_viewbin", lambda: export_items_to_viewbin(items, f"{out}/ViewItemsList.bin"), n)
+    stage("RecipeGraph.export_trees", lambda: RecipeGraph(items).export_trees(f"{out}/CraftingTrees.json"), n)
+    stage("PriceMatrix.export", lambda: PriceMatrix(items, merchants).export(f"{out}/PriceMatrix.json"), n)
+    if len(languages := fetch_language_names(rootDir)) > 1:
+        textIds = fetch_text_ids(xmlItems)
+        shards = stage("fetch_languages", lambda: fetch_languages(rootDir, languages, text_keys(items, textIds), workers, stream), n*len(languages))
+        stage("export_text_shards", lambda: export_text_shards(items, textIds, shards, out), n*len(languages))
+    if images:
+        from ItemImageDownloader import ImageDownloader
+        imgdl = ImageDownloader(rootDir, workers)
+        stage("ImageDownloader.download_icons", lambda: imgdl.download_icons(items, f"{targetDir}/images/icons"), n)
+        stage("ImageDownloader.download_sprites", lambda: imgdl.download_sprites(items, f"{targetDir}/images/sprites"), n)
+        stage("ImageDownloader.download_icon_atlas", lambda: imgdl.download_icon_atlas(items, f"{targetDir}/images/atlas"), n)
+    return results
+
+def print_stages (results:list[StageResult]):
+    "`bench_stages` as a table, with the peak resident memory of the whole process last"
+    print("%-36s %9s %9s %12s %10s" % ("stage", "count", "seconds", "per second", "peak MB"))
+    for r in results:
+        print("%-36s %9d %9.3f %12.0f %10s" % (
+            r.stage, r.count, r.seconds, r.count/r.seconds if r.seconds else 0, "-" if r.peakBytes < 0 else "%.1f" % (r.peakBytes/2**20)
+        ))
+    print("%-36s %9s %9.3f" % ("total", "", sum(r.seconds for r in results)))
+    if getrusage is not None:
+        print("Peak resident memory %.1f MB" % (getrusage(RUSAGE_SELF).ru_maxrss/2**10)) # KiB on Linux
+
+def bench_main (items:int=2000, workers:int=1):
+    "Writes a `SyntheticSpec` install of `items` items into a temporary folder and prints how long each stage takes on it"
+    from tempfile import TemporaryDirectory
+    with TemporaryDirectory() as tmp:
+        spec = SyntheticSpec(items=items)
+        t = perf_counter()
+        write_synthetic_install(f"{tmp}/Barotrauma", spec)
+        print("Wrote %d synthetic items in %.2fs" % (items, perf_counter() - t))
+        print_stages(bench_stages(f"{tmp}/Barotrauma", f"{tmp}/assets", workers))
+
+if __name__ == "__main__":
+    from sys import argv
+    bench_main(*(int(a) for a in argv[1:3]))
@@ -0,0 +1,180 @@
+"Contains a single class `ItemCache`, an on-disk cache of the Items built from each content file so unchanged files don't get re-parsed."
+
+from hashlib import sha256
+from glob import glob
+from json import dumps as json_dumps
+from os import makedirs, replace
+from os.path import join as path_join, isfile
+from pickle import load as pickle_load, dump as pickle_dump, HIGHEST_PROTOCOL
+from typing import Final, NamedTuple
+from xml.etree.ElementTree import Element
+from BaroInterface import Item, ContentPackage, Provenance, VariantResolver
+from ItemParser import fetch_xml_files, fetch_language, merge_provenance, mod_dirs
+from PathIndex import path_index
+from AssetWriter import hash_file
+from Profiler import Profiler
+
+class CacheEntry (NamedTuple):
+    "Everything built from a single content file, see `ItemCache`"
+    items : dict[str, Item|None]
+    "'identifier' -> Item for every element the file defines, in file order. None if it wasn't a valid Item"
+    parents : dict[str, tuple[str,str]|None]
+    """'variantof identifier' -> (url, content hash) of the file that defined it when the items were built, None if nothing did.
+    Has every element above a variant, its parent's parent and so on, since a change to any of them changes the variant"""
+    variantOf : dict[str, str]
+    "'identifier' -> its 'variantof identifier', for the elements that are variants"
+    textIds : dict[str, list[str]]
+    "'identifier' -> `Item.text_ids` for every element"
+    textsHash : str
+    "Hash of the texts of every text id in `textIds` when the items were built, see `ItemCache.texts_hash`"
+    langHash : str
+    "Hash of every language file it was last checked against, if they're the same again `textsHash` doesn't need checking"
+
+class ItemCache:
+    """Construct me with the directory to keep the cache in, then use `fetch_items` in place of
+    `fetch_xml_elements`, `fetch_language` and `fetch_items` from ItemParser.
+    Entries are keyed by a file's path and its contents, the files holding any `variantof` parents are checked on every load.
+    So are the texts its items use, a change to any other text, like in most game updates, keeps the entry."""
+    FORMAT :Final[int] = 5
+    "Bump me whenever `CacheEntry` or any of the Barotrauma classes change shape"
+
+    def __init__(self, cacheDir:str) -> None:
+        self.__cacheDir = cacheDir
+        makedirs(cacheDir, exist_ok=True)
+
+    def __path (self, url:str, fileHash:str) -> str:
+        key = sha256(f"{ItemCache.FORMAT}\0{url}\0{fileHash}".encode()).hexdigest()
+        return path_join(self.__cacheDir, key+".pickle")
+
+    @staticmethod
+    def texts_hash (textIds:dict[str,list[str]], texts:dict[str,list[str]]) -> str:
+        "Hash of what `texts` has for the text ids in `textIds`, the ones `Item.from_Element` reads, see `text_keys` in ItemParser"
+        keys = sorted({k for ids in textIds.values() for k in ids[:3] if k != ""})
+        return sha256(json_dumps([[k, texts.get(k)] for k in keys]).encode()).hexdigest()
+
+    def __load (self, path:str) -> CacheEntry|None:
+        if not isfile(path): return None
+        try:
+            with open(path, 'rb') as fin:
+                return pickle_load(fin)
+        except Exception: # A corrupt or out-dated entry is just a miss
+            return None
+
+    def __save (self, path:str, entry:CacheEntry):
+        with open(path+".tmp", 'wb') as fout:
+            pickle_dump(entry, fout, HIGHEST_PROTOCOL)
+        replace(path+".tmp", path)
+
+    def fetch_items (self, rootDir:str, URLs:list[str], langName:str, workers:int|None=1, stream:bool=False, profiler:Profiler|None=None) -> dict[str,Item]:
+        """Same result as `fetch_items(fetch_xml_elements(rootDir, URLs), fetch_language(rootDir, langName))`,
+        but only parses and builds the files that changed since they were last cached.
+        `workers`, `stream` and `profiler` are passed on to `fetch_xml_files` and `fetch_language` for those."""
+        return self.__fetch(rootDir, URLs, langName, workers, stream, profiler=profiler)[0]
+
+    def fetch_package_items (self, rootDir:str, packages:list[ContentPackage], langName:str, workers:int|None=1, stream:bool=False, profiler:Profiler|None=None) -> tuple[dict[str,Item],dict[str,Provenance],dict[str,list[str]]]:
+        """Same as `fetch_items` over every package in load order, see `fetch_package_elements` in ItemParser.
+        Entries are per file, so after a mod changes only its files get parsed again, and any variants of its items.
+        Also gives what `fetch_text_ids` in ItemParser would for the items."""
+        sources :list[tuple[str,str]] = [(p.name, url) for p in packages for url in p.items]
+        items, entries = self.__fetch(
+            rootDir, [url for _, url in sources], langName, workers, stream,
+            mod_dirs(packages), [url for p in packages for url in p.texts], profiler
+        )
+        provenance = merge_provenance(sources, [
+            [(id, entries[url].variantOf.get(id, "")) for id in entries[url].items.keys()] for _, url in sources
+        ])
+        textIds :dict[str,list[str]] = {}
+        for _, url in sources:
+            textIds.update(entries[url].textIds)
+        return items, {id : provenance[id] for id in items.keys()}, {id : textIds[id] for id in items.keys()}
+
+    def __fetch (self, rootDir:str, URLs:list[str], langName:str, workers:int|None=1, stream:bool=False,
+                 modDirs:dict[str,str]={}, modTexts:list[str]=[], profiler:Profiler|None=None) -> tuple[dict[str,Item],dict[str,CacheEntry]]:
+        "`fetch_items`, also giving back the entry of each file"
+        index = path_index(rootDir)
+        hashes :dict[str,str] = {url : hash_file(index.resolve(url)) for url in URLs}
+        langFiles = sorted(glob(rootDir+"/Content/Texts/"+langName+"/*.xml")) + [index.resolve(url) for url in modTexts]
+        langHash = sha256("".join(hash_file(p) for p in langFiles).encode()).hexdigest()
+        paths :dict[str,str] = {url : self.__path(url, hashes[url]) for url in URLs}
+        entries :dict[str,CacheEntry|None] = {url : self.__load(paths[url]) for url in URLs}
+        loaded :list[dict[str,list[str]]] = []
+        def texts () -> dict[str,list[str]]:
+            "Only parsed if something needs them"
+            if not loaded: loaded.append(fetch_language(rootDir, langName, stream, modTexts, profiler))
+            return loaded[0]
+        # Parse whatever is missing, we need their identifiers to know who wins an override
+        elements :dict[str,list[Element]] = {}
+        def parse (urls:list[str]):
+            for url, elms in zip(urls, fetch_xml_files(rootDir, urls, workers, stream, modDirs, profiler)):
+                elements[url] = elms
+        parse([url for url in URLs if entries[url] is None])
+        def winners () -> dict[str,str]:
+            "'identifier' -> url of the last file to define it"
+            return {
+                id : url
+                for url in URLs
+                for id in (
+                    [e.get("identifier","") for e in elements[url]] if entries[url] is None
+                    else entries[url].items.keys() # type: ignore , checked just above
+                )
+            }
+        # Throw out entries whose variant parents now come from somewhere else
+        owner = winners()
+        def is_fresh (url:str) -> bool:
+            if (entry := entries[url]) is None: return False
+            for pid, dep in entry.parents.items():
+                at = owner.get(pid)
+                if dep != (None if at is None else (at, hashes[at])): return False
+            if entry.langHash == langHash: return True
+            if entry.textsHash != ItemCache.texts_hash(entry.textIds, texts()): return False
+            entries[url] = entry._replace(langHash=langHash) # so these language files don't get parsed for it again
+            self.__save(paths[url], entries[url]) # type: ignore , just set
+            return True
+        stale :list[str] = [url for url in URLs if not is_fresh(url)]
+        if not stale:
+            print("Loaded all %d files from the cache" % len(URLs))
+        else:
+            print("Rebuilding %d of %d files" % (len(stale), len(URLs)))
+            parse([url for url in stale if url not in elements])
+            # The winning element of everything a stale item inherits from, however far up, parsing files as we go
+            byId :dict[str,dict[str,Element]] = {}
+            def winner (id:str) -> Element:
+                if owner[id] not in byId: byId[owner[id]] = {e.get("identifier","") : e for e in elements[owner[id]]}
+                return byId[owner[id]][id]
+            wanted :set[str] = set()
+            above :set[str] = {pid for url in stale for e in elements[url] if (pid := e.get("variantof","")) in owner}
+            while above - wanted:
+                wanted |= above
+                parse(sorted({owner[pid] for pid in above} - elements.keys(), key=URLs.index))
+                above = {ppid for pid in above if (ppid := winner(pid).get("variantof","")) in owner}
+            variants = VariantResolver({pid : winner(pid) for pid in wanted})
+            for url in stale:
+                built :dict[str,Item|None] = {}
+                parents :dict[str,tuple[str,str]|None] = {}
+                variantOf :dict[str,str] = {}
+                textIds :dict[str,list[str]] = {}
+                for e in elements[url]:
+                    id, pid = e.get("identifier",""), e.get("variantof","")
+                    chain = [pid] + variants.ancestors(pid) if pid in owner else []
+                    if pid != "":
+                        variantOf[id] = pid
+                        top = variants.elements[chain[-1]].get("variantof","") if chain else pid
+                        if top != "" and top not in owner: parents[top] = None
+                    for a in chain:
+                        parents[a] = (owner[a], hashes[owner[a]])
+                    parent = variants[pid] if chain and id not in chain else None # on a loop it's taken as it is, like VariantResolver does
+                    built[id] = (
+                        Item.from_Element(e, texts(), parent) if profiler is None
+                        else profiler.item(e, lambda e: Item.from_Element(e, texts(), parent))
+                    )
+                    textIds[id] = Item.text_ids(e, parent)
+                entries[url] = CacheEntry(built, parents, variantOf, textIds, ItemCache.texts_hash(textIds, texts()), langHash)
+                self.__save(paths[url], entries[url]) # type: ignore , just set
+        # Merge in load order, same as fetch_xml_elements, so the last one wins
+        merged :dict[str,Item|None] = {}
+        for url in URLs:
+            merged.update(entries[url].items) # type: ignore , all filled in by now
+        items :dict[str,Item] = {id : i for id, i in merged.items() if i is not None}
+        print("Parsed out %4d Items" % len(items))
+        return items, entries # type: ignore , all filled in by now
+# end ItemCache
@@ -1,56 +1,149 @@
-"Contains a single class `ImageDownloader`, use the public methods for fetching Icons and Sprites. It will cache sprite sheets so try to do it in batches."
+"Contains `ImageDownloader`, use the public methods for fetching Icons and Sprites. It keeps decoded sprite sheets in a bounded `SheetCache` so try to do it in batches."
 
-from functools import cache
-from os import makedirs, remove, listdir
-from os.path import split as path_split, isdir, isfile, join as path_join
-from typing import Final
+from collections import OrderedDict, deque
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, Future
+from os import makedirs, remove, cpu_count
+from typing import Callable, Final, Iterator, TypeVar
 from BaroInterface import Texture, Colour, Item, WHITE
+from AtlasPacker import pack_rects
+from PathIndex import path_to, path_index
+from AssetWriter import AssetWriter, BlobStore, hash_file
 from glob import glob
-from re import compile
-from numpy import multiply # Epic math
-from cv2 import resize, imread, imwrite, IMREAD_UNCHANGED # OpenCV image editing tools, yes its a bit overkill, bite me
+from numpy import ( # Epic math
+    multiply, zeros, empty, clip, rint, arange, array, minimum, maximum, uint8, uint16, float64
+)
+from numpy.typing import NDArray
+from cv2 import ( # OpenCV image editing tools, yes its a bit overkill, bite me
+    resize, imread, imwrite, imencode, cvtColor, LUT, IMREAD_UNCHANGED, COLOR_GRAY2BGR, COLOR_GRAY2BGRA, COLOR_BGR2BGRA
+)
 from cv2.typing import MatLike
 
-def __validate_path (target:str) -> str:
-    "recursive helper function for `path_to`"
-    if isdir(target): return target
-    head, tail = path_split(target)
-    if head=='':
-        raise IOError(f"Invalid directory '{target}'")
-    head = __validate_path(head)
-    re_tail = compile('(?i)'+tail)
-    candidates = listdir(head)
-    for test in candidates:
-        if m := re_tail.match(test):
-            return head+'/'+m[0]
-    raise IOError(f"Invalid directory '{tail}' at '{head}'")
-
-def path_to (targetPath:str) -> str:
-    "Will attempt to find the file at the given path. Checks for case-sensitivity"
-    targetPath = targetPath.replace('\\', '/') # modern windows is fine with forward-slashes 
-    if isfile(targetPath): return targetPath
-    head, tail = path_split(targetPath)
-    head = __validate_path(head)
-    re_tail = compile('(?i)'+tail)
-    candidates = listdir(head)
-    for test in candidates:
-        if (m := re_tail.match(test)):
-            return head + '/' + m[0]
-    raise IOError(f"Invalid file name '{tail}' at '{head}'")
+def colour_image (img:MatLike, colour:Colour) -> MatLike:
+    """The original per-image tint, promotes `img` to float64 and leaves `imwrite` to round it back.
+    Kept as the reference `bench_main` checks `tint_batch` against."""
+    if colour != WHITE:
+        c = list(colour)
+        c.reverse() # RGB -> BGR
+        return multiply(img[:,:], [*c, 1.0])
+    return img
+
+@lru_cache(maxsize=256)
+def tint_lut (colour:Colour) -> NDArray[uint8]:
+    """A (1,256,4) BGRA look up table that multiplies by `colour`, rounded and saturated the same way
+    `imwrite` does to the float output of `colour_image`. Alpha is left alone."""
+    c = array([*reversed(colour), 1.0]) # RGB -> BGR, and alpha
+    return clip(rint(arange(256, dtype=float64)[:,None] * c), 0, 255).astype(uint8).reshape(1, 256, 4)
+
+def premultiply (img:MatLike) -> MatLike:
+    "Returns a copy of BGRA `img` with its colour multiplied by its alpha, staying in 8 bit"
+    out = img.copy()
+    a = img[:,:,3:4].astype(uint16)
+    out[:,:,:3] = (img[:,:,:3] * a + 127) // 255
+    return out
+
+def tint_batch (imgs:list[MatLike], colour:Colour, premultiplied:bool=False) -> list[MatLike]:
+    """Tints all of `imgs` with `colour` in one go, staying in 8 bit the whole way.
+    If `premultiplied` the BGRA images are un-premultiplied first, see `premultiply`.
+    Every image is flattened into one column of pixels so the whole batch is a single look up, whatever their sizes."""
+    if not imgs: return imgs
+    imgs = [i if i.ndim == 3 else cvtColor(i, COLOR_GRAY2BGR) for i in imgs]
+    channels = imgs[0].shape[2]
+    if any(i.shape[2] != channels for i in imgs): # Can't happen from a single sheet, but just in case
+        return [tint_batch([i], colour, premultiplied)[0] for i in imgs]
+    flat = empty((sum(i.shape[0]*i.shape[1] for i in imgs), 1, channels), uint8)
+    views :list[MatLike] = []
+    start = 0
+    for i in imgs:
+        n = i.shape[0] * i.shape[1]
+        views.append(flat[start:start+n].reshape(i.shape))
+        views[-1][...] = i # Crops are views into the sheet, this is the only copy made
+        start += n
+    if premultiplied and channels == 4:
+        a = flat[:,:,3:4].astype(uint16)
+        flat[:,:,:3] = minimum((flat[:,:,:3].astype(uint16) * 255 + a//2) // maximum(a, 1), 255)
+    if colour != WHITE:
+        LUT(flat, tint_lut(colour)[:,:,:channels].copy(), dst=flat) # flat is already a copy, no need for another
+    return views
+
+_R = TypeVar("_R")
+"Generic return type"
+_T = TypeVar("_T")
+
+def batch_pixels (things:list[_T], pixels:Callable[[_T],int], budget:int) -> Iterator[list[_T]]:
+    "Splits `things` into runs whose `pixels` add up to about `budget`, anything bigger than it gets a run to itself"
+    batch :list[_T] = []
+    total = 0
+    for t in things:
+        if batch and total + pixels(t) > budget:
+            yield batch
+            batch, total = [], 0
+        batch.append(t)
+        total += pixels(t)
+    if batch: yield batch
+
+class SheetCache:
+    """Least recently used cache of decoded sprite sheets, keeps their total size under `budget` bytes.
+    The sheet just asked for is always kept, even if it alone is over budget."""
+
+    def __init__(self, load:Callable[[str], MatLike], budget:int) -> None:
+        self.__load = load
+        self.__budget = budget
+        self.__sheets :OrderedDict[str, MatLike] = OrderedDict()
+        self.__size = 0
+
+    def get (self, path:str) -> MatLike:
+        "Returns the sheet at `path`, loading it and evicting the least recently used ones if needed"
+        if (img := self.__sheets.get(path)) is not None:
+            self.__sheets.move_to_end(path)
+            return img
+        img = self.__load(path)
+        self.__sheets[path] = img
+        self.__size += img.nbytes
+        while self.__size > self.__budget and len(self.__sheets) > 1:
+            _, old = self.__sheets.popitem(last=False)
+            self.__size -= old.nbytes
+        return img
+
+    def __contains__ (self, path:str) -> bool:
+        return path in self.__sheets
+
+    @property
+    def size (self) -> int:
+        "Total bytes of the sheets held"
+        return self.__size
+
+    @property
+    def budget (self) -> int:
+        "Most bytes of sheets to hold, see the constructor"
+        return self.__budget
+
+    def clear (self):
+        self.__sheets.clear()
+        self.__size = 0
+# end SheetCache
 
 class ImageDownloader:
-    "Construct me with the rootDir in order to call `download_sprites/icons`"
+    """Construct me with the rootDir in order to call `download_sprites/icons`.
+    Items are handled sheet by sheet, each sheet is decoded once and its items are cropped, coloured and written on
+    `workers` threads, None meaning one per core. Decoded sheets are kept in a `SheetCache` of `cacheBytes`,
+    and that budget covers the sheets queued work still needs as well, see `__by_sheet`."""
     ICON_SIZE :Final[int] = 64
+    BATCH_PIXELS :Final[int] = 128*128*8
+    "Roughly how many pixels of the same sheet and colour are tinted in one go, see `__by_sheet`"
 
-    def __init__(self, rootDir:str) -> None:
-        self.__rootDir = rootDir
+    def __init__(self, rootDir:str, workers:int|None=None, cacheBytes:int=512*2**20) -> None:
+        self.__paths = path_index(rootDir)
+        self.__workers = workers or cpu_count() or 1
+        self.__sheets = SheetCache(self.__read_img, cacheBytes)
+        self.peakBytes = 0
+        "Most bytes of decoded sheets held at once by the cache and the queued work together, since construction"
 
-    @cache
-    def __get_img (self, filePath:str) -> MatLike:
-        "Fetches the given sprite sheet, also caches it for re-use"
-        target = path_join(self.__rootDir, filePath)
-        act = path_to(target)
+    def __read_img (self, filePath:str) -> MatLike:
+        "Reads the given sprite sheet, see `__sheets` for the cached version"
+        act = self.__paths.resolve(filePath)
         img = imread(act, IMREAD_UNCHANGED)
+        if img is None: raise IOError(f"Failed to read image '{act}'")
         return img
 
     def __prepare_folder (self, dir:str):
@@ -70,51 +163,162 @@ class ImageDownloader:
         """Crops the given opencv `img` using the given xywh `rect`, returns the result"""
         return img[rect[1]:rect[1]+rect[3], rect[0]:rect[0]+rect[2]]
 
+    def __by_sheet (self, textures:dict[str,Texture], work:Callable[[MatLike,list[tuple[str,Texture]]],list[_R]]) -> dict[str,_R]:
+        """Calls `work(sheet, batch)` on the thread pool for batches of (id, texture) sharing a sheet and a colour,
+        `work` returns one result per texture in `batch`. Goes one sheet at a time, sheets are decoded here while
+        the pool works on the previous ones. Queued work holds on to its sheet even once the cache let go of it,
+        so after each decode the oldest work is waited on until those sheets and the cache fit the cache's budget.
+        Returns 'id' -> whatever `work` returned for it, in the same order as `textures`."""
+        groups :dict[str, dict[Colour, list[tuple[str,Texture]]]] = {}
+        for id, tex in textures.items():
+            groups.setdefault(tex.path, {}).setdefault(tex.colour, []).append((id, tex))
+        results :dict[str,_R] = {}
+        pending :deque[tuple[str,MatLike,list[tuple[str,Texture]],Future[list[_R]]]] = deque()
+        def collect (path:str, sheet:MatLike, batch:list[tuple[str,Texture]], fut:Future[list[_R]]):
+            for (id, _), r in zip(batch, fut.result(), strict=True):
+                results[id] = r
+        def held () -> int:
+            "Bytes of the cached sheets, plus the ones only queued work still has"
+            evicted = {p : s.nbytes for p, s, _, _ in pending if p not in self.__sheets}
+            return self.__sheets.size + sum(evicted.values())
+        with ThreadPoolExecutor(max_workers=self.__workers) as pool:
+            for path, byColour in groups.items():
+                sheet = self.__sheets.get(path)
+                self.peakBytes = max(self.peakBytes, held())
+                while pending and held() > self.__sheets.budget:
+                    collect(*pending.popleft())
+                for group in byColour.values():
+                    for batch in batch_pixels(group, lambda t: t[1].rect[2]*t[1].rect[3], ImageDownloader.BATCH_PIXELS):
+                        pending.append((path, sheet, batch, pool.submit(work, sheet, batch)))
+                while len(pending) > 4*self.__workers: # Keep the queue short as well
+                    collect(*pending.popleft())
+            for job in pending:
+                collect(*job)
+        return {id : results[id] for id in textures.keys()}
+
+    def __sprites (self, sheet:MatLike, batch:list[tuple[str,Texture]]) -> list[MatLike]:
+        "The coloured sprites of `batch` cut out of `sheet`, they all share a colour"
+        return tint_batch([self.__crop(sheet, tex.rect) for _, tex in batch], batch[0][1].colour)
+
+    def __icons (self, sheet:MatLike, batch:list[tuple[str,Texture]]) -> list[MatLike]:
+        """Same as `__sprites` but shrunk to fit an icon.
+        Sheets with alpha are resized premultiplied so the colour of see-through pixels doesn't bleed into the edges."""
+        alpha = sheet.ndim == 3 and sheet.shape[2] == 4
+        return tint_batch([
+            resize(
+                premultiply(crop) if alpha else crop,
+                self.__get_resize(tex))
+            for _, tex in batch
+            for crop in [self.__crop(sheet, tex.rect)]
+        ], batch[0][1].colour, premultiplied=alpha)
+
     @staticmethod
-    def __colour_image (img:MatLike, colour:Colour) -> MatLike:
-        if colour != WHITE:
-            c = list(colour)
-            c.reverse() # RGB -> BGR
-            return multiply(img[:,:], [*c, 1.0])
-        return img
+    def __icon_texture (item:Item) -> Texture:
+        "An item's icon, or its sprite if it doesn't have one"
+        return item.icon if item.icon is not None else item.sprite
 
     def download_sprites (self, items:dict[str,Item], targetDir:str) -> bool:
         "Attempts to download the sprites for the given `items`, looking in `self.rootDir`, exporting to `targetDir`"
         self.__prepare_folder(targetDir)
-        return all(
-            imwrite(
-                f"{targetDir}/{id}.png",
-                self.__colour_image(
-                    self.__crop(
-                        self.__get_img(item.sprite.path),
-                        item.sprite.rect),
-                    item.sprite.colour)
-            ) for id, item in items.items()
-        )    
+        return all(self.__by_sheet(
+            {id : item.sprite for id, item in items.items()},
+            lambda sheet, batch: [
+                imwrite(f"{targetDir}/{id}.png", img)
+                for (id, _), img in zip(batch, self.__sprites(sheet, batch))
+            ]
+        ).values())
 
     def download_icons (self, items:dict[str,Item], targetDir:str) -> bool:
         "Attempts to download the icons for the given `items`, same as download_icons, but backs up to resized sprites if needed"
         self.__prepare_folder(targetDir)
-        return all(
-            imwrite(
-                f"{targetDir}/{id}.png",
-                self.__colour_image(
-                    resize(
-                        self.__crop(
-                            self.__get_img(item.icon.path),
-                            item.icon.rect),
-                        self.__get_resize(item.icon)),
-                    item.icon.colour),
-            ) if item.icon is not None else
-            imwrite(
-                f"{targetDir}/{id}.png",
-                self.__colour_image(
-                    resize(
-                        self.__crop(
-                            self.__get_img(item.sprite.path),
-                            item.sprite.rect),
-                        self.__get_resize(item.sprite)),
-                    item.sprite.colour)
-            ) for id, item in items.items()
+        return all(self.__by_sheet(
+            {id : self.__icon_texture(item) for id, item in items.items()},
+            lambda sheet, batch: [
+                imwrite(f"{targetDir}/{id}.png", img)
+                for (id, _), img in zip(batch, self.__icons(sheet, batch))
+            ]
+        ).values())
+
+    def store_icons (self, items:dict[str,Item], store:BlobStore) -> dict[str,str]:
+        """Same icons as `download_icons`, but put in `store` as PNGs, returns 'id' -> blob hash.
+        An icon cut from the same rect of the same sheet contents with the same colour as a previous run is looked up
+        in `store.memo` instead, so only icons whose sheet changed get decoded and encoded again."""
+        textures = {id : self.__icon_texture(item) for id, item in items.items()}
+        sheets = {path : hash_file(self.__paths.resolve(path)) for path in {t.path for t in textures.values()}}
+        keys = {id : f"icon{ImageDownloader.ICON_SIZE}:{sheets[t.path]}:{t.rect}:{tuple(t.colour)}" for id, t in textures.items()}
+        known = {id : store.memo[k] for id, k in keys.items() if k in store.memo and store.has(store.memo[k], "png")}
+        made = self.__by_sheet(
+            {id : t for id, t in textures.items() if id not in known},
+            lambda sheet, batch: [store.put(imencode(".png", img)[1].tobytes(), "png") for img in self.__icons(sheet, batch)]
+        )
+        for id, hash in made.items():
+            store.memo[keys[id]] = hash
+        return {id : known[id] if id in known else made[id] for id in textures.keys()}
+
+    def download_icon_atlas (self, items:dict[str,Item], targetDir:str, sheetSize:int=2048, padding:int=1, writer:AssetWriter|None=None) -> bool:
+        """Same icons as `download_icons`, but packed onto as few `sheetSize` square sheets as will fit them.
+        Writes the sheets as 'atlas<n>.png' and, through `writer`, an 'atlas.json' of
+        `{"sheets": [file names], "icons": {id: [sheet index, x, y, w, h]}}`, see `atlas_icon_style` in default.js."""
+        self.__prepare_folder(targetDir)
+        icons :dict[str,MatLike] = self.__by_sheet(
+            {id : self.__icon_texture(item) for id, item in items.items()},
+            lambda sheet, batch: [self.__as_bgra(img) for img in self.__icons(sheet, batch)]
         )
+        placed = pack_rects({id : (i.shape[1], i.shape[0]) for id, i in icons.items()}, sheetSize, padding)
+        sheets = [zeros((sheetSize, sheetSize, 4), uint8) for _ in range(1 + max((p.sheet for p in placed.values()), default=-1))]
+        for id, p in placed.items():
+            sheets[p.sheet][p.y:p.y+p.h, p.x:p.x+p.w] = icons[id]
+        # Trim the unused bottom of each sheet, the last one especially is usually mostly empty
+        names :list[str] = [f"atlas{n}.png" for n in range(len(sheets))]
+        ok = all(
+            imwrite(f"{targetDir}/{name}", sheet[:max(p.y+p.h for p in placed.values() if p.sheet==n)])
+            for n, (name, sheet) in enumerate(zip(names, sheets))
+        )
+        (writer or AssetWriter()).write(f"{targetDir}/atlas.json", '{"sheets":[%s],"icons":{%s}}' % (
+            ",".join(f'"{n}"' for n in names),
+            ",".join(f'"{id}":[{p.sheet},{p.x},{p.y},{p.w},{p.h}]' for id, p in placed.items())
+        ))
+        return ok
+
+    @staticmethod
+    def __as_bgra (img:MatLike) -> MatLike:
+        "Converts whatever OpenCV read or `tint_batch` made into 8 bit BGRA, so it can go on an atlas sheet"
+        if img.dtype != uint8:
+            img = clip(img, 0, 255).astype(uint8)
+        if img.ndim == 2:
+            return cvtColor(img, COLOR_GRAY2BGRA)
+        if img.shape[2] == 3:
+            return cvtColor(img, COLOR_BGR2BGRA)
+        return img
 # end ImageDownloader
+
+def bench_main (count:int=1000, rounds:int=3):
+    """Times `tint_batch` against `colour_image` on `count` random crops of a made up sheet, 32 to 256 pixels square,
+    reporting images per second and the peak memory either one allocated"""
+    from time import perf_counter
+    from tracemalloc import start, stop, get_traced_memory, reset_peak
+    from numpy.random import default_rng
+    sheet = default_rng(0).integers(0, 256, (1024, 1024, 4), uint8)
+    crops = [sheet[(n%4)*256:(n%4)*256+s, (n//4%4)*256:(n//4%4)*256+s] for n in range(count) for s in [32 << n%4]]
+    colour :Colour = (0.8, 0.5, 1.0)
+    def old () -> Iterator[MatLike]:
+        for c in crops:
+            yield clip(rint(colour_image(c, colour)), 0, 255).astype(uint8) # what imwrite did with it
+    def new () -> Iterator[MatLike]:
+        for batch in batch_pixels(crops, lambda c: c.shape[0]*c.shape[1], ImageDownloader.BATCH_PIXELS):
+            yield from tint_batch(batch, colour)
+    assert all((a == b).all() for a, b in zip(old(), new(), strict=True)), 'Error: tint_batch output changed'
+    for name, func in (("colour_image", old), ("tint_batch", new)):
+        start()
+        reset_peak()
+        t = perf_counter()
+        for _ in range(rounds):
+            for _ in func(): pass # Each one would be written out and dropped
+        took = perf_counter() - t
+        peak = get_traced_memory()[1]
+        stop()
+        print("%-12s %d images x %d: %6.3fs, %8.0f images/s, peak %6.1f MB" % (
+            name, count, rounds, took, count*rounds/took, peak/2**20
+        ))
+
+if __name__ == "__main__": bench_main()
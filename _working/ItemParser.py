@@ -1,21 +1,31 @@
 "This Epic file contains a bunch of classes and functions for parsing and manipulating Barotrauma Items"
 
-from os import makedirs
-from os.path import join as path_join, isdir, relpath, dirname
+from os import cpu_count
+from os.path import isdir, relpath, dirname, basename, expanduser
 from sys import platform
+from argparse import ArgumentParser
+from contextlib import nullcontext
 from glob import glob
-from json import load as json_load
-from tkinter import filedialog, messagebox
-from xml.etree.ElementTree import parse, Element
-# from scipy.sparse import csr_matrix # Can represent a directed graph, used for con or decon trees
+from itertools import repeat
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from json import loads as json_loads, dumps as json_dumps
+from re import sub as re_sub
+from typing import Callable, Collection, Final, Iterator
+from xml.etree.ElementTree import parse, iterparse, Element
 from BaroInterface import (
-    maybe, ContentPackage, Deconstructable, Item, PricingInfo, Recipe, Sprite,
-    DEFAULT_LISTING, LISTED_DEFAULT_LISTING, get_price_from_PricingInfo
+    maybe, expand_mod_dir, VariantResolver, ContentPackage, Provenance, Deconstructable, Item, Listing, PricingInfo, Recipe, Sprite,
+    DEFAULT_LISTING, LISTED_DEFAULT_LISTING, ITEM_CHILD_TAGS, get_price_from_PricingInfo
 )
 from ToJson import to_json
+from SearchIndex import build_index
+from ViewList import ViewRow, encode_viewlist
+from PathIndex import path_index, path_to
+from AssetWriter import AssetWriter, IncrementalWriter, BlobStore, BlobWriter, CompressingWriter, QueuedWriter
+from Profiler import Profiler, measure, profile_stage, profile_file
 
 
-def fetch_barotrauma_path ()->str|None:
+def fetch_barotrauma_path (prompt:bool=True)->str|None:
+    "Looks where Steam installs Barotrauma, then asks with a folder picker if `prompt`, needs a display for that"
     steamGame :str = "Steam/steamapps/common/Barotrauma"
     tryThese :list = {
         "win32": [
@@ -39,9 +49,11 @@ def fetch_barotrauma_path ()->str|None:
     }.get(platform, [])
     # Test the different places Steam can be
     for attempt in tryThese:
-        if isdir(attempt):
+        if isdir(attempt := expanduser(attempt)):
             return attempt
+    if not prompt: return None
     # If that didn't work, prompt the user to supply
+    from tkinter import filedialog, messagebox # Only here, so nothing else needs a display or Tk
     if messagebox.askokcancel(
         "Can't find Barotrauma",
         "Cannot find Barotrauma. Can you show me where it is?",
@@ -57,75 +69,235 @@ def fetch_content_package(rootDir:str, name:str)->ContentPackage:
     tree :Element = parse(fpath).getroot()
     return ContentPackage.from_Element(tree)
 
+def fetch_content_packages (rootDir:str, mods:list[str]=[], core:str="Vanilla") -> list[ContentPackage]:
+    """The `core` content package followed by each of `mods`, in load order.
+    A mod is given as the folder its filelist.xml is in, relative to `rootDir`, like 'LocalMods/MyMod'.
+    Their `%ModDir%` paths are expanded to be relative to `rootDir` too, so they work like any other path."""
+    roots :list[tuple[str,Element]] = [(dir.rstrip('/'), parse(path_to(f"{rootDir}/{dir}/filelist.xml")).getroot()) for dir in mods]
+    modDirs :dict[str,str] = {e.get("name","") : dir for dir, e in roots}
+    return [fetch_content_package(rootDir, core)] + [ContentPackage.from_Element(e, dir, modDirs) for dir, e in roots]
+
+def mod_dirs (packages:list[ContentPackage]) -> dict[str,str]:
+    "'package name' -> its folder, for every mod in `packages`, see `expand_mod_dir`"
+    return {p.name : p.dir for p in packages if p.dir != ""}
+
 def fetch_merchants (rootDir:str, URLs:list[str])->list[str]:
     "Fetches the different types of merchants, `URLs` should be the contentPackage.npc_sets"
     prefix = "merchant"
     return [
         id[len(prefix):] if id.startswith(prefix) else id
         for url in URLs
-        for npcset in parse(path_join(rootDir, url)).getroot()
+        for npcset in parse(path_index(rootDir).resolve(url)).getroot()
         for npc in npcset.findall("npc")
         if npc.get("campaigninteractiontype")=="Store"
         and (id := npc.get("identifier","")) != ""
         and id != "merchanttutorial"
     ]
 
-def fetch_xml_elements (rootDir:str, URLs :list[str]) -> dict[str, Element]:
+def __iter_top_level (filePath:str, keep:Callable[[Element],bool]=lambda e: True) -> Iterator[Element]:
+    """Streams the children of the root element of the given xml file as each one finishes parsing.
+    Only the grandchildren that `keep` accepts are left on each child, everything else is cleared as it goes,
+    and each child is dropped from the root once yielded, so only what the caller holds onto stays in memory.
+    Children of an `<Override>` are the items themselves, so those are always kept whole."""
+    stack :list[Element] = []
+    for event, elm in iterparse(filePath, events=("start", "end")):
+        if event == "start":
+            stack.append(elm)
+            continue
+        stack.pop()
+        if len(stack) == 2 and stack[1].tag.lower() != "override" and not keep(elm):
+            stack[1].remove(elm) # grandchild we'll never read
+        elif len(stack) == 1:
+            yield elm
+            del stack[0][:]
+
+def __unwrap (elms:Iterator[Element]|Element, inOverride:bool=False) -> Iterator[Element]:
+    "The elements of a file's root, looking inside the `<Override>` (and `<Items>` in those) mods wrap their replacements in"
+    for elm in elms:
+        tag = elm.tag.lower()
+        if tag == "override" or (inOverride and tag == "items"): yield from __unwrap(elm, True)
+        else: yield elm
+
+def __parse_xml_file (rootDir:str, filePath:str, stream:bool=False, modDirs:dict[str,str]={}) -> list[Element]:
+    """Parses a single xml resource for its contained elements, see `fetch_xml_elements`.
+    Lives at module level so it can be sent to worker processes."""
+    dir, file = filePath.rsplit("/", 1)
+    dir = relpath(dir, rootDir).replace('\\', '/')
+    file = file.rsplit(".",1)[0]
+    ownDir = max((d for d in modDirs.values() if (dir+'/').startswith(d+'/')), key=len, default="")
+    elms :list[Element] = []
+    for elm in __unwrap(
+        __iter_top_level(filePath, lambda e: e.tag.lower() in ITEM_CHILD_TAGS) if stream
+        else parse(filePath).getroot()
+    ):
+        if ownDir != "": # Only mods can use %ModDir%
+            for sub in elm.iter():
+                for k, v in sub.items():
+                    if "%" in v: sub.set(k, expand_mod_dir(v, ownDir, modDirs))
+        elm.set("dir", dir)
+        elm.set("file", file)
+        if elm.get("identifier","")!="": elms.append(elm)
+    return elms
+
+def __parse_xml_file_measured (rootDir:str, filePath:str, stream:bool=False, modDirs:dict[str,str]={}) -> tuple[list[Element], dict]:
+    "`__parse_xml_file` and how much it cost, for `Profiler.files`, measured in whichever process parsed it"
+    with measure() as m:
+        elms = __parse_xml_file(rootDir, filePath, stream, modDirs)
+    return elms, {"file" : relpath(filePath, rootDir).replace('\\', '/'), "elements" : len(elms)} | m
+
+def fetch_xml_files (rootDir:str, URLs :list[str], workers:int|None=1, stream:bool=False, modDirs:dict[str,str]={}, profiler:Profiler|None=None,
+                     pool:Executor|None=None) -> list[list[Element]]:
+    """Parses each given xml resource for its contained elements, giving one list per resource in the same order as `URLs`.
+    See `fetch_xml_elements` for the arguments, that merges these lists into one lookup.
+    `modDirs` is from `mod_dirs`, for expanding the `%ModDir%` paths inside files from mods.
+    Each file's cost goes in `profiler.files` if given.
+    `pool` is a process pool to parse in instead of starting one for `workers`, so it can be busy with other things too."""
+    paths = path_index(rootDir) # the xml doesn't always get the case right
+    filePathList :list[str] = [paths.resolve(p) for p in URLs]
+    parse :Callable = __parse_xml_file if profiler is None else __parse_xml_file_measured
+    if workers is None: workers = cpu_count() or 1
+    if pool is not None or (workers > 1 and len(filePathList) > 1):
+        with nullcontext(pool) if pool is not None else ProcessPoolExecutor(max_workers=min(workers, len(filePathList))) as pool:
+            files = list(pool.map(parse, repeat(rootDir), filePathList, repeat(stream), repeat(modDirs)))
+    else:
+        files = [parse(rootDir, filePath, stream, modDirs) for filePath in filePathList]
+    if profiler is None: return files
+    profiler.files.extend(m for _, m in files)
+    return [elms for elms, _ in files]
+
+def fetch_xml_elements (rootDir:str, URLs :list[str], workers:int|None=1, stream:bool=False, profiler:Profiler|None=None) -> dict[str, Element]:
     """Parses all given xml resources for their contained elements.
-    Also attaches the folder it was in, relative to Barotrauma, and attaches the file NAME."""
+    Also attaches the folder it was in, relative to Barotrauma, and attaches the file NAME.
+    `workers` is how many processes to parse with, 1 parses in this process and None uses every core.
+    Later files override earlier ones with the same identifier, whatever the worker count.
+    If `stream` is set, files are read with iterparse and only the parts of each item that `Item.from_Element` reads are kept.
+    `profiler` gets what each file cost, see `Profiler`."""
     allElms :dict[str, Element] = {}
-    filePathList :list[str] = [path_join(rootDir,p).replace('\\','/') for p in URLs]
-    for filePath in filePathList:
-        tree :Element = parse(filePath).getroot()
-        dir, file = filePath.rsplit("/", 1)
-        dir = relpath(dir, rootDir)
-        file = file.rsplit(".",1)[0]
-        for elm in tree:
-            elm.set("dir", dir)
-            elm.set("file", file)
-            id = elm.get("identifier","")
-            if id!="": allElms[id] = elm
+    for elms in fetch_xml_files(rootDir, URLs, workers, stream, {}, profiler): # in the same order as `URLs`, so the last one wins
+        for elm in elms:
+            allElms[elm.get("identifier","")] = elm
     print("Parsed out %4d elements" % len(allElms))
     return allElms
 
-def fetch_language (rootDir:str, langName:str) -> dict[str,str]:
-    "Returns a dictionary of 'text id' -> 'text' for the given language name"
-    files = glob(rootDir+"/Content/Texts/"+langName+"/*.xml")
-    textDict :dict[str,str] = {}
+def fetch_package_elements (rootDir:str, packages:list[ContentPackage], workers:int|None=1, stream:bool=False, profiler:Profiler|None=None,
+                            pool:Executor|None=None) -> tuple[dict[str,Element], dict[str,Provenance]]:
+    """Same as `fetch_xml_elements` over the items of every package in load order, see `fetch_content_packages`.
+    Every file of every package is parsed in one go and merged into one lookup, so a later package overrides an earlier one
+    with the same identifier and `variantof` finds whichever element won. Also returns where each one came from.
+    `pool` works like it does for `fetch_xml_files`."""
+    sources :list[tuple[str,str]] = [(p.name, url) for p in packages for url in p.items]
+    files = fetch_xml_files(rootDir, [url for _, url in sources], workers, stream, mod_dirs(packages), profiler, pool)
+    allElms :dict[str, Element] = {}
+    for elms in files:
+        for elm in elms:
+            allElms[elm.get("identifier","")] = elm
+    print("Parsed out %4d elements from %d packages" % (len(allElms), len(packages)))
+    return allElms, merge_provenance(sources, [[(e.get("identifier",""), e.get("variantof","")) for e in elms] for elms in files])
+
+def merge_provenance (sources:list[tuple[str,str]], defined:list[list[tuple[str,str]]]) -> dict[str,Provenance]:
+    """'identifier' -> where its winning element came from. `sources` is every (package name, url) in load order,
+    `defined` is the (identifier, variantof) of every element in each of them, in the same order"""
+    found :dict[str,Provenance] = {}
+    variantOf :dict[str,str] = {}
+    for (package, url), elms in zip(sources, defined, strict=True):
+        for id, pid in elms:
+            old = found.get(id)
+            found[id] = Provenance(package, url, [] if old is None else old.overrides + [old.url], None)
+            variantOf[id] = pid
+    return {
+        id : p._replace(parent=found[pid].url) if (pid := variantOf[id]) in found else p
+        for id, p in found.items()
+    }
+
+def fetch_language (rootDir:str, langName:str, stream:bool=False, modFiles:list[str]=[], profiler:Profiler|None=None) -> dict[str,list[str]]:
+    """Returns a dictionary of 'text id' -> 'texts' for the given language name.
+    A text id can be given multiple times, the game picks between them, so all of them are kept in file order.
+    `modFiles` are the `texts` of any mods, relative to `rootDir`, read after the game's own and only if they're in `langName`.
+    A text id given by a mod file replaces whatever was given before it, the same way mods override items.
+    If `stream` is set, files are read with iterparse and dropped entry by entry. `profiler` gets what each file cost."""
+    files = sorted(glob(rootDir+"/Content/Texts/"+langName+"/*.xml"))
+    textDict :dict[str,list[str]] = {}
     for filePath in files:
-        textDict.update({
-            str(branch.tag) : str(branch.text)
-            for branch in parse(filePath).getroot()
-        })
+        with profile_file(profiler, relpath(filePath, rootDir).replace('\\', '/')):
+            for branch in (__iter_top_level(filePath, lambda e: False) if stream else parse(filePath).getroot()):
+                textDict.setdefault(str(branch.tag), []).append(str(branch.text))
+    for url in modFiles: # Mods don't sort theirs into language folders, the root says which it is
+        with profile_file(profiler, url):
+            root = parse(path_index(rootDir).resolve(url)).getroot()
+            if root.get("language","").lower() != langName.lower(): continue
+            own :dict[str,list[str]] = {}
+            for branch in root:
+                own.setdefault(str(branch.tag), []).append(str(branch.text))
+            textDict.update(own)
     print("Parsed out %5d text resources" % len(textDict))
-    return dict(textDict) # remove default functionality
-        
-def fetch_items (xmlItems :dict[str,Element], texts :dict[str,str]) -> dict[str,Item]:
-    items0 :list[Item|None] = [
-        Item.from_Element(e, texts, xmlItems.get(e.get("variantof",''), None))
-        for e in xmlItems.values()
-    ]
+    return textDict
+
+def fetch_language_names (rootDir:str) -> list[str]:
+    "Every language the game has texts for, by their folder in Content/Texts"
+    return sorted(basename(dirname(d)) for d in glob(rootDir+"/Content/Texts/*/"))
+
+def __fetch_text_shard (rootDir:str, langName:str, stream:bool, modFiles:list[str], keys:list[str]) -> dict[str,list[str]]:
+    """`fetch_language` cut down to `keys`, see `fetch_languages`.
+    Lives at module level so it can be sent to worker processes, only what's kept gets sent back."""
+    texts = fetch_language(rootDir, langName, stream, modFiles)
+    return {k : texts[k] for k in keys if k in texts}
+
+def fetch_languages (rootDir:str, langNames:list[str], keys:list[str], workers:int|None=1, stream:bool=False, modFiles:list[str]=[]) -> dict[str,dict[str,list[str]]]:
+    """'language' -> `fetch_language` of it for each of `langNames`, only keeping the text ids in `keys`, see `text_keys`.
+    Each language is parsed in its own worker process, `workers` works like it does for `fetch_xml_files`."""
+    if workers is None: workers = cpu_count() or 1
+    if workers > 1 and len(langNames) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(langNames))) as pool:
+            shards = pool.map(__fetch_text_shard, repeat(rootDir), langNames, repeat(stream), repeat(modFiles), repeat(keys))
+            return dict(zip(langNames, shards))
+    return {lang : __fetch_text_shard(rootDir, lang, stream, modFiles, keys) for lang in langNames}
+
+def fetch_text_ids (xmlItems :dict[str,Element]) -> dict[str,list[str]]:
+    "'identifier' -> `Item.text_ids` for every element, what `ItemCache.fetch_package_items` gives as well"
+    variants = VariantResolver(xmlItems)
+    return {id : Item.text_ids(variants[id]) for id in xmlItems.keys()}
+
+def text_keys (items :dict[str,Item], textIds :dict[str,list[str]]) -> list[str]:
+    "Every text id the given `items` are shown with, sorted"
+    return sorted({k for id in items.keys() for k in textIds[id][:3] if k != ""})
+
+def fetch_items (xmlItems :dict[str,Element], texts :dict[str,list[str]], profiler:Profiler|None=None) -> dict[str,Item]:
+    """`Item.from_Element` of each element that makes a valid Item, `profiler` keeps the slowest ones.
+    Variants are merged with their whole `variantof` chain first, see `VariantResolver`, nothing in `xmlItems` is changed."""
+    variants = VariantResolver(xmlItems)
+    def build (e:Element) -> Item|None:
+        return Item.from_Element(variants[e.get("identifier","")], texts)
+    items0 :list[Item|None] = (
+        [build(e) for e in xmlItems.values()] if profiler is None
+        else [profiler.item(e, build) for e in xmlItems.values()]
+    )
     items :dict[str,Item] = { i.id : i for i in items0 if i is not None}
     print("Parsed out %4d Items" % len(items))
     return items
 
 def refetch_partial_items (folderPath:str) -> dict[str,Item]:
+    """Rebuilds Items from the files written by `export_items_to_json`, `folderPath` being its 'items' folder.
+    Textures aren't exported, so every Item gets a placeholder Sprite and no icon."""
     retr :dict[str,Item] = {}
-    for path in glob(folderPath+"/*.json"):
-        with open(path) as fin:
-            o = json_load(fin)
-            p = o['prices']
-            if p:
-                p['basePrice'] = p['default']
-                del p['default']
-            retr[o['id']] = Item(
-                o['id'], o['tags'], o['name'], o['desc'], o['category'],
-                PricingInfo(**p) if p else None,
-                Deconstructable(o['deconsTo'], 30) if o['deconsTo'] else None,
-                [Recipe(**r) for r in o['recipes']],
-                None,
-                Sprite("No", (0,0,0,0), (0,0,0))
-            )
+    for path in sorted(glob(folderPath+"/*.json")):
+        with open(path, 'rb') as fin:
+            raw = fin.read()
+        try:
+            o = json_loads(raw.decode('utf-8'))
+        except UnicodeDecodeError: # older exports were written with the Windows default encoding
+            o = json_loads(raw.decode('cp1252'))
+        p :dict[str,Listing] = o['priceInfo']
+        pinfo :PricingInfo|None = None
+        if p:
+            pinfo = PricingInfo(Listing(**p.pop('default', {})).copy, p)
+        retr[o['id']] = Item(
+            o['id'], o['tags'], o['name'], o['desc'], o['category'],
+            pinfo,
+            Deconstructable(**o['deconsTo']) if o['deconsTo'] else None,
+            [Recipe(**r) for r in o['recipes']],
+            None,
+            Sprite("No", (0,0,0,0), (0,0,0))
+        )
     return retr
 
 def filter_items (items :dict[str,Item]) -> dict[str,Item]:
@@ -139,100 +311,353 @@ def filter_items (items :dict[str,Item]) -> dict[str,Item]:
     ))
     return rest
 
-def export_items_to_json (items :dict[str,Item], targetDir:str):
-    makedirs(targetDir+'/items', exist_ok=True)
-    with open(targetDir+"/ItemList.json", 'w') as fout:
-        fout.write('['+','.join(f'"{i}"' for i in items.keys())+']')
+def export_items_to_json (items :dict[str,Item], targetDir:str, writer:AssetWriter|None=None):
+    writer = writer or AssetWriter()
+    writer.write(targetDir+"/ItemList.json", '['+','.join(f'"{i}"' for i in items.keys())+']')
     for id, item in items.items():
-        name :str = f"{targetDir}/items/{id}.json"
-        with open(name, 'w') as fout:
-            fout.write(to_json(item))
+        writer.write(f"{targetDir}/items/{id}.json", to_json(item))
 
-def export_items_to_searchDoc (items:dict[str,Item], targetPath:str):
-    "`others` is any filtered out items from `items`, as they may still be referenced to"
-    makedirs(dirname(targetPath), exist_ok=True)
-    with open(targetPath, 'w') as fout: fout.write(
-        "[%s]" % (
-            ",".join(
-                '{"id":"%s","name":"%s","category":"%s","desc":"%s","tags":"%s","price":"%s","deconsTo":"%s","recipes":"%s"}' % (
-                    id, item.name, item.category,
-                    item.desc.replace('"', '\\"'),
-                    ",".join(item.tags),
-                    get_price_from_PricingInfo(item.priceInfo) if item.priceInfo else 0,
+BUNDLE_BYTES :int = 64*1024
+"Roughly how big `export_item_bundles` lets a bundle get"
+
+def export_item_bundles (items :dict[str,Item], targetDir:str, writer:AssetWriter|None=None, maxBytes:int=BUNDLE_BYTES):
+    """Writes the same json as `export_items_to_json`, but as 'bundles/<category>-<n>.json' files of `{id: item}`.
+    Items are bundled by their first category, so the ingredients of a recipe, mostly materials, come in one or two requests.
+    Each bundle stays under `maxBytes` unless a single item is bigger than that.
+    Also writes 'bundles/index.json' of `{"bundles": [names], "items": {id: index into bundles}}`, see `fetch_item` in default.js."""
+    writer = writer or AssetWriter()
+    groups :dict[str,list[tuple[str,str]]] = {}
+    for id, item in items.items():
+        groups.setdefault(item.category.split(",")[0], []).append((id, to_json(item)))
+    names :list[str] = []
+    index :dict[str,int] = {}
+    for category, members in groups.items():
+        name = re_sub(r"[^A-Za-z0-9]+", "", category) or "None"
+        cuts = [0]
+        size = 1 # the braces, less the last comma
+        for n, (id, text) in enumerate(members):
+            entry = len(f'"{id}":{text},'.encode('utf-8'))
+            if n > cuts[-1] and size + entry > maxBytes:
+                cuts.append(n)
+                size = 1
+            size += entry
+        cuts.append(len(members))
+        for k, (start, end) in enumerate(zip(cuts, cuts[1:])):
+            names.append(f"{name}-{k}")
+            writer.write(f"{targetDir}/bundles/{name}-{k}.json", '{'+','.join(f'"{id}":{text}' for id, text in members[start:end])+'}')
+            index |= {id : len(names)-1 for id, _ in members[start:end]}
+    writer.write(f"{targetDir}/bundles/index.json", json_dumps({"bundles" : names, "items" : index}, separators=(',', ':')))
+
+SEARCH_FIELDS :list[str] = ["name", "desc", "category", "tags", "deconsTo", "recipes", "price"]
+"The fields Search.js indexes, in the order it adds them"
+
+def __searchDoc_text (items:dict[str,Item]) -> str:
+    "The contents of SearchDoc.json, see `export_items_to_searchDoc`"
+    return "[%s]" % (
+        ",".join(
+            '{"id":"%s","name":"%s","category":"%s","desc":"%s","tags":"%s","price":"%s","deconsTo":"%s","recipes":"%s"}' % (
+                id, item.name, item.category,
+                item.desc.replace('"', '\\"'),
+                ",".join(item.tags),
+                get_price_from_PricingInfo(item.priceInfo) if item.priceInfo else 0,
+                ",".join(
+                    items[i].name
+                    for i in (maybe(item.deconsTo).output.keys() or list[str]())
+                ),
+                ";".join(
                     ",".join(
                         items[i].name
-                        for i in (maybe(item.deconsTo).output.keys() or list[str]())
-                    ),
-                    ";".join(
-                        ",".join(
-                            items[i].name
-                            for i in r.required.keys()
-                        ) for r in item.recipes
-                    )
-                ) for id, item in items.items()
-            )
+                        for i in r.required.keys()
+                    ) for r in item.recipes
+                )
+            ) for id, item in items.items()
         )
     )
 
-def export_items_to_viewlist (items:dict[str,Item], targetPath:str):
-    lines :list[str] = []
-    for item in items.values():
-        craftable = 1 if len(item.recipes) > 0 else 0
-        deconable = 1 if item.deconsTo is not None else 0
-        bp = maybe(item.priceInfo)['default'].get('basePrice') or "\"\""
-        rep = f'["{item.id}","{item.name}",{bp},{craftable},{deconable}]'
-        lines.append(rep)
-    with open(targetPath, 'w') as fout:
-        fout.write(f'[{",".join(lines)}]')
-
-def export_default_price_info (targetPath:str, merchants:list[str]):
+def export_items_to_searchDoc (items:dict[str,Item], targetPath:str, writer:AssetWriter|None=None):
+    "`others` is any filtered out items from `items`, as they may still be referenced to"
+    (writer or AssetWriter()).write(targetPath, __searchDoc_text(items))
+
+def export_items_to_searchIndex (items:dict[str,Item], targetPath:str, writer:AssetWriter|None=None):
+    """The elasticlunr index Search.js would build from SearchDoc.json, ready for `elasticlunr.Index.load`.
+    It's built from the same documents the browser would parse out of SearchDoc.json, see `SearchIndex.build_index`"""
+    index = build_index(json_loads(__searchDoc_text(items)), SEARCH_FIELDS, "id")
+    (writer or AssetWriter()).write(targetPath, json_dumps(index, ensure_ascii=False, separators=(',', ':')))
+
+def viewlist_rows (items:dict[str,Item]) -> list[ViewRow]:
+    "The rows of the View Items table, one per item"
+    return [
+        ViewRow(item.id, item.name, maybe(item.priceInfo)['default'].get('basePrice') or 0, len(item.recipes) > 0, item.deconsTo is not None)
+        for item in items.values()
+    ]
+
+def viewlist_json (rows:list[ViewRow]) -> str:
+    "ViewItemsList.json, `[[id, name, basePrice or \"\", craftable, deconable]]` with the flags as 0/1"
+    return '[' + ",".join(
+        f'["{r.id}","{r.name}",{r.basePrice or '""'},{int(r.craftable)},{int(r.deconable)}]' for r in rows
+    ) + ']'
+
+def export_items_to_viewlist (items:dict[str,Item], targetPath:str, writer:AssetWriter|None=None):
+    (writer or AssetWriter()).write(targetPath, viewlist_json(viewlist_rows(items)))
+
+def export_items_to_viewbin (items:dict[str,Item], targetPath:str, writer:AssetWriter|None=None):
+    "The same rows as `export_items_to_viewlist`, in the binary layout described in ViewList.py"
+    (writer or AssetWriter()).write_bytes(targetPath, encode_viewlist(viewlist_rows(items)))
+
+def export_default_price_info (targetPath:str, merchants:list[str], writer:AssetWriter|None=None):
     global DEFAULT_LISTING
-    makedirs(dirname(targetPath), exist_ok=True)
-    with open(targetPath, 'w') as fout:
-        merchStr = ",".join([to_json(m) for m in merchants])
-        defStr = to_json(DEFAULT_LISTING)
-        LdefStr = to_json(LISTED_DEFAULT_LISTING)
-        fout.write(f'{{"merchants":[{merchStr}],"default":{defStr},"listedDefault":{LdefStr}}}')
-
-def export_texts_to_json (texts:dict[str,list[str]], targetFilePath:str):
-    makedirs(dirname(targetFilePath), exist_ok=True)
-    with open(targetFilePath, 'w', encoding='utf-8') as fout:
-        fout.write(f"{{{','.join(
-            f"\"{k}\":[{','.join(
-                f'"{i.replace('"', '\\"')}"'
-                for i in v
-            )}]"
-            for k,v in texts.items()
-        )}}}")
-
-
-
-def main ():
-    rootDir = fetch_barotrauma_path()
+    merchStr = ",".join([to_json(m) for m in merchants])
+    defStr = to_json(DEFAULT_LISTING)
+    LdefStr = to_json(LISTED_DEFAULT_LISTING)
+    (writer or AssetWriter()).write(targetPath, f'{{"merchants":[{merchStr}],"default":{defStr},"listedDefault":{LdefStr}}}')
+
+def export_texts_to_json (texts:dict[str,list[str]], targetFilePath:str, writer:AssetWriter|None=None):
+    (writer or AssetWriter()).write(targetFilePath, json_dumps(texts, ensure_ascii=False, separators=(',', ':')))
+
+def export_text_shards (items:dict[str,Item], textIds:dict[str,list[str]], shards:dict[str,dict[str,list[str]]], targetDir:str, writer:AssetWriter|None=None):
+    """Writes each of `shards`, from `fetch_languages`, as 'texts/<language>.json' in `targetDir`.
+    Also writes 'texts/TextIds.json' of `{id: Item.text_ids}` for the `items` that aren't just shown with
+    'entityname.<id>' and 'entitydescription.<id>', default.js's `item_texts` puts them together."""
+    for lang, texts in shards.items():
+        export_texts_to_json(texts, f"{targetDir}/texts/{lang}.json", writer)
+    (writer or AssetWriter()).write(f"{targetDir}/texts/TextIds.json", json_dumps({
+        id : ids for id in items.keys()
+        if (ids := textIds[id]) != [f"entityname.{id}", f"entitydescription.{id}"]
+    }, ensure_ascii=False, separators=(',', ':')))
+
+def export_provenance (items:dict[str,Item], provenance:dict[str,Provenance], targetPath:str, writer:AssetWriter|None=None):
+    "Writes `{id: [package, file]}` for every item in `items`, what each one was built from"
+    (writer or AssetWriter()).write(targetPath, json_dumps(
+        {id : [provenance[id].package, provenance[id].url] for id in items.keys()},
+        ensure_ascii=False, separators=(',', ':')
+    ))
+
+EXPORT_STAGES :Final[tuple[str,...]] = ("items", "bundles", "listing", "searchdoc", "searchindex", "viewlist", "trees", "prices")
+"What `export_version` can write, in the order it writes them"
+IMAGE_STAGES :Final[tuple[str,...]] = ("icons", "sprites", "atlas")
+"What `ImageDownloader` can make, these need numpy and OpenCV"
+STAGES :Final[tuple[str,...]] = EXPORT_STAGES + IMAGE_STAGES
+"Every stage `main` can run, the texts of other languages are up to its `languages`"
+STAGE_FILES :Final[dict[str,tuple[str,...]]] = {
+    "items" : ("ItemList.json", "items/"),
+    "bundles" : ("bundles/",),
+    "listing" : ("DefaultListing.json",),
+    "searchdoc" : ("SearchDoc.json",),
+    "searchindex" : ("SearchIndex.json",),
+    "viewlist" : ("ViewItemsList.json", "ViewItemsList.bin"),
+    "trees" : ("CraftingTrees.json",),
+    "prices" : ("PriceMatrix.json",),
+}
+"What each of `EXPORT_STAGES` writes, relative to the version's json folder, folders ending in '/'"
+
+def skipped_stage_files (stages:Collection[str], prefix:str="") -> Callable[[str],bool]:
+    """Whether a path, relative to the version's json folder with `prefix` in front, belongs to a stage not in `stages`.
+    The `keep` of `IncrementalWriter` and `BlobWriter`, so running a few stages doesn't delete what the others wrote before"""
+    skipped = tuple(prefix + f for stage, files in STAGE_FILES.items() if stage not in stages for f in files)
+    return lambda rel: rel.startswith(skipped)
+
+def export_version (items:dict[str,Item], merchants:list[str], targetDir:str, writer:AssetWriter|None=None, profiler:Profiler|None=None,
+                    stages:Collection[str]=EXPORT_STAGES):
+    """Writes the json files the site needs for one version into `targetDir`, only for the `stages` given, see `EXPORT_STAGES`.
+    Each exporter is its own stage of `profiler`. The numpy and scipy ones are only imported if they're run."""
+    def export_trees ():
+        from RecipeGraph import RecipeGraph
+        RecipeGraph(items).export_trees(f"{targetDir}/CraftingTrees.json", writer)
+    def export_prices ():
+        from PriceMatrix import PriceMatrix
+        PriceMatrix(items, merchants).export(f"{targetDir}/PriceMatrix.json", writer)
+    def export_viewlist ():
+        export_items_to_viewlist(items, f"{targetDir}/ViewItemsList.json", writer)
+        export_items_to_viewbin(items, f"{targetDir}/ViewItemsList.bin", writer)
+    exports :dict[str,tuple[str,Callable[[],None]]] = {
+        "items" : ("export_items_to_json", lambda: export_items_to_json(items, targetDir, writer)),
+        "bundles" : ("export_item_bundles", lambda: export_item_bundles(items, targetDir, writer)),
+        "listing" : ("export_default_price_info", lambda: export_default_price_info(f"{targetDir}/DefaultListing.json", merchants, writer)),
+        "searchdoc" : ("export_items_to_searchDoc", lambda: export_items_to_searchDoc(items, f"{targetDir}/SearchDoc.json", writer)),
+        "searchindex" : ("export_items_to_searchIndex", lambda: export_items_to_searchIndex(items, f"{targetDir}/SearchIndex.json", writer)),
+        "viewlist" : ("export_items_to_viewlist", export_viewlist),
+        "trees" : ("RecipeGraph.export_trees", export_trees),
+        "prices" : ("PriceMatrix.export", export_prices),
+    }
+    for stage, (name, export) in exports.items():
+        if stage in stages:
+            with profile_stage(profiler, name):
+                export()
+
+def main (workers:int|None=1, stream:bool=False, cacheDir:str|None=None, incremental:bool=False, mods:list[str]=[], allLanguages:bool=False, compress:bool=False, profile:int=0,
+          rootDir:str|None=None, outDir:str="assets", languages:list[str]=[], stages:Collection[str]=EXPORT_STAGES, prompt:bool=True, pipeline:bool=False):
+    """`rootDir` is the Barotrauma install to build, found with `fetch_barotrauma_path(prompt)` if not given.
+    Everything is written under `outDir`, 'json/<version>' and 'images/items/<version>'. Only `stages` are run, see `STAGES`,
+    and with `incremental` the files the other stages wrote last time are left alone, see `skipped_stage_files`.
+    `mods` are loaded on top of Vanilla in the order given, see `fetch_content_packages`.
+    The version is still Vanilla's, a modded build goes in the same folder as the plain one would.
+    `languages`, or every language with `allLanguages`, also writes the names and descriptions of the items in them, see `export_text_shards`.
+    `compress` also writes .gz and .br copies of the json, see `CompressingWriter`.
+    `profile` writes a `Profiler` report to Profile.json next to the json, keeping that many of the slowest items.
+    `pipeline` overlaps what doesn't wait on each other: the English texts are parsed in another process alongside
+    the item xml, in the same pool as it with `workers`, which leaves their files out of the profile, the images are made
+    on a thread alongside the json exports unless profiling, and every file is written on a thread through a `QueuedWriter`.
+    Items are still only built once every file is parsed, any later one could override them. The files written are the same either way"""
+    if rootDir is None: rootDir = fetch_barotrauma_path(prompt)
     if rootDir is None: raise IOError("Failed to find where Barotrauma is")
     print("Baro :", rootDir)
-    package = fetch_content_package(rootDir, "Vanilla")
+    profiler = Profiler(profile) if profile else None
+    with profile_stage(profiler, "fetch_content_packages"):
+        packages = fetch_content_packages(rootDir, mods)
+        package = packages[0]
     print("Version :", package.version)
-    merchants = fetch_merchants(rootDir, package.npc_sets)
-    xmlItems = fetch_xml_elements(rootDir, package.items)
-    texts = fetch_language(rootDir, "English")
-    items = fetch_items(xmlItems, texts)
+    with profile_stage(profiler, "fetch_merchants"):
+        merchants = fetch_merchants(rootDir, [url for p in packages for url in p.npc_sets])
+    if cacheDir is not None:
+        from ItemCache import ItemCache
+        with profile_stage(profiler, "ItemCache.fetch_package_items"):
+            items, provenance, textIds = ItemCache(cacheDir).fetch_package_items(rootDir, packages, "English", workers, stream, profiler)
+    else:
+        modTexts = [url for p in packages for url in p.texts]
+        # With workers the xml is parsed in the same pool, forking a second while the first one's thread runs can deadlock
+        parallel = workers is None or workers > 1
+        with ProcessPoolExecutor(workers if parallel else 1) if pipeline else nullcontext() as pool:
+            textsJob = None if pool is None else pool.submit(fetch_language, rootDir, "English", stream, modTexts)
+            with profile_stage(profiler, "fetch_package_elements") as stage:
+                xmlItems, provenance = fetch_package_elements(rootDir, packages, workers, stream, profiler, pool if parallel else None)
+                stage["elements"] = len(xmlItems)
+            with profile_stage(profiler, "fetch_language") as stage:
+                texts = fetch_language(rootDir, "English", stream, modTexts, profiler) if textsJob is None else textsJob.result()
+                stage["texts"] = len(texts)
+        with profile_stage(profiler, "fetch_items") as stage:
+            items = fetch_items(xmlItems, texts, profiler)
+            stage["items"] = len(items)
+        textIds = fetch_text_ids(xmlItems)
     filter_items(items)
 
-    # items = refetch_partial_items(f"assets/json/{package.version}/items")
+    # items = refetch_partial_items(f"{outDir}/json/{package.version}/items")
+
+    if allLanguages: languages = fetch_language_names(rootDir)
+    if languages: # before any writer starts a thread, these are parsed in processes of their own
+        with profile_stage(profiler, "fetch_languages"):
+            shards = fetch_languages(rootDir, languages, text_keys(items, textIds), workers, stream, [url for p in packages for url in p.texts])
+
+    targetDir = f"{outDir}/json/{package.version}"
+    imageDir = f"{outDir}/images/items/{package.version}"
+    skipped = skipped_stage_files(stages)
+    atlasJson = relpath(f"{imageDir}/atlas/atlas.json", targetDir).replace('\\', '/') # written through `writer` as well
+    keep = skipped if "atlas" in stages else lambda rel: skipped(rel) or rel == atlasJson
+    writer = IncrementalWriter(targetDir, keep) if incremental else AssetWriter()
+    if compress: writer = CompressingWriter(writer, targetDir)
+    if pipeline: writer = QueuedWriter(writer)
 
-    export_items_to_json(items, f"assets/json/{package.version}")
-    export_default_price_info(f"assets/json/{package.version}/DefaultListing.json", merchants)
-    export_items_to_searchDoc(items, f"assets/json/{package.version}/SearchDoc.json")
-    export_items_to_viewlist(items, f"assets/json/{package.version}/ViewItemsList.json")
+    def export_images ():
+        if not any(s in stages for s in IMAGE_STAGES): return
+        from ItemImageDownloader import ImageDownloader # numpy and OpenCV, only now they're needed
+        imgdl = ImageDownloader(rootDir, workers)
+        for stage, download in (("icons", imgdl.download_icons), ("sprites", imgdl.download_sprites), ("atlas", imgdl.download_icon_atlas)):
+            if stage in stages:
+                with profile_stage(profiler, f"ImageDownloader.{download.__name__}"):
+                    if stage == "atlas": imgdl.download_icon_atlas(items, f"{imageDir}/atlas", writer=writer)
+                    else: download(items, f"{imageDir}/{stage}")
+    # The profiler measures one stage at a time, so only overlap when there isn't one
+    with ThreadPoolExecutor(1) if pipeline and profiler is None else nullcontext() as imagePool:
+        imageJob = None if imagePool is None else imagePool.submit(export_images)
+        export_version(items, merchants, targetDir, writer, profiler, stages)
+        if mods: export_provenance(items, provenance, f"{targetDir}/Provenance.json", writer)
+        if languages:
+            with profile_stage(profiler, "export_text_shards"):
+                export_text_shards(items, textIds, shards, targetDir, writer)
+        if imageJob is None: export_images()
+        else: imageJob.result()
 
-    # from ItemImageDownloader import ImageDownloader
-    # imgdl = ImageDownloader(rootDir)
-    # imgdl.download_sprites(items, f"assets/images/items/{package.version}/sprites")
-    # imgdl.download_icons(items, f"assets/images/items/{package.version}/icons")
-    # del imgdl
+    with profile_stage(profiler, "finish"): # after the images, so a `QueuedWriter` has the while to write the json in
+        writer.finish()
+    if profiler is not None: profiler.export(f"{targetDir}/Profile.json")
+    print("Done!")
+    return 0
 
+def main_versions (rootDirs:list[str], workers:int|None=1, stream:bool=False, cacheDir:str=".cache/items", images:bool=False, compress:bool=False, profile:int=0,
+                   outDir:str="assets", stages:Collection[str]=EXPORT_STAGES):
+    """Builds every Barotrauma install in `rootDirs` in one run, each one usually being a different version.
+    Parsed items are cached by file contents in `cacheDir`, so files that didn't change between versions are parsed once.
+    Item json, and icons if `images`, are stored once in '<outDir>/blobs' by their contents, and each version gets a
+    BlobManifest.json of which blob each of its files is. Blobs no manifest uses anymore are deleted at the end.
+    `stages` is which of `EXPORT_STAGES` to write, same as `main`. The files and blobs of the others, and the icons
+    without `images`, are kept from the last run.
+    `compress` writes .gz and .br copies of the json like `main` does, for new blobs as well.
+    `profile` writes a Profile.json for each version like `main` does."""
+    from ItemCache import ItemCache
+    blobDir = f"{outDir}/blobs"
+    blobWriter = CompressingWriter(AssetWriter(), blobDir) if compress else AssetWriter()
+    store = BlobStore(blobDir, blobWriter)
+    cache = ItemCache(cacheDir)
+    for rootDir in rootDirs:
+        profiler = Profiler(profile) if profile else None
+        package = fetch_content_package(rootDir, "Vanilla")
+        print("Version :", package.version, "from", rootDir)
+        merchants = fetch_merchants(rootDir, package.npc_sets)
+        with profile_stage(profiler, "ItemCache.fetch_items") as stage:
+            items = cache.fetch_items(rootDir, package.items, "English", workers, stream, profiler)
+            stage["items"] = len(items)
+        filter_items(items)
+        targetDir = f"{outDir}/json/{package.version}"
+        inner = IncrementalWriter(targetDir, skipped_stage_files(stages))
+        skipped = skipped_stage_files(stages, f"json/{package.version}/")
+        icons = f"images/items/{package.version}/icons"
+        writer = BlobWriter(
+            store, outDir, f"{targetDir}/{BlobWriter.MANIFEST}",
+            [f"json/{package.version}/items", f"json/{package.version}/bundles", icons],
+            CompressingWriter(inner, targetDir) if compress else inner,
+            skipped if images else lambda rel: skipped(rel) or rel.startswith(icons+'/') # keeps last run's icons too
+        )
+        export_version(items, merchants, targetDir, writer, profiler, stages)
+        if images:
+            from ItemImageDownloader import ImageDownloader
+            with profile_stage(profiler, "ImageDownloader.store_icons"):
+                for id, hash in ImageDownloader(rootDir, workers).store_icons(items, store).items():
+                    writer.add(f"{outDir}/images/items/{package.version}/icons/{id}.png", hash)
+        with profile_stage(profiler, "finish"):
+            writer.finish()
+        if profiler is not None: profiler.export(f"{targetDir}/Profile.json")
+    store.save()
+    print("Deleted %d unused blobs" % store.prune(glob(f"{outDir}/json/*/{BlobWriter.MANIFEST}")))
+    blobWriter.finish()
     print("Done!")
     return 0
 
-if __name__=="__main__": exit(main())
+def cli (args:list[str]|None=None) -> int:
+    """The command line, `python _working/ItemParser.py --help`. One install, or none to look for the one Steam has, runs `main`,
+    several run `main_versions`. It never opens a window unless `--ask` is given, so it's safe on a machine without a display."""
+    parser = ArgumentParser(description="Exports the items of Barotrauma for the site, run from the repo root")
+    parser.add_argument("rootDirs", nargs="*", metavar="root",
+        help="Barotrauma installs to build. None looks where Steam puts it, several are built as separate versions with shared blobs")
+    parser.add_argument("--out", default="assets", help="Folder to write into, default 'assets'")
+    parser.add_argument("--mods", nargs="+", default=[], metavar="DIR",
+        help="Packages to load on top of Vanilla in this order, as their folder relative to the install like 'LocalMods/SomeMod'")
+    parser.add_argument("--languages", nargs="+", default=[], metavar="LANG",
+        help="Also export the item texts in these languages, by their folder in Content/Texts, or 'all'")
+    parser.add_argument("--stages", nargs="+", default=list(EXPORT_STAGES), choices=STAGES, metavar="STAGE",
+        help="What to make, any of %s. Default is every json one. Image stages need numpy and OpenCV" % ", ".join(STAGES))
+    parser.add_argument("--workers", type=int, default=1, help="Processes to parse with, 0 for every core")
+    parser.add_argument("--stream", action="store_true", help="Stream the xml, keeping only what's needed")
+    parser.add_argument("--cache", metavar="DIR", help="Cache parsed items here by file contents, always on for several installs")
+    parser.add_argument("--incremental", action="store_true", help="Only write files that changed, and delete the ones that are gone")
+    parser.add_argument("--compress", action="store_true", help="Also write .gz and .br copies of the json")
+    parser.add_argument("--profile", nargs="?", type=int, const=20, default=0, metavar="N",
+        help="Time every stage and source file, and keep the N slowest items (default 20), into Profile.json next to the json")
+    parser.add_argument("--pipeline", action="store_true",
+        help="Parse the texts alongside the items, make the images alongside the json and write files on a thread, a single install only")
+    parser.add_argument("--ask", action="store_true", help="Ask where Barotrauma is with a folder picker if it can't be found")
+    a = parser.parse_args(args)
+    workers = a.workers or None
+    if len(a.rootDirs) > 1:
+        if a.mods or a.languages or a.pipeline: parser.error("--mods, --languages and --pipeline only work with a single install")
+        unsupported = [s for s in a.stages if s not in EXPORT_STAGES + ("icons",)]
+        if unsupported: parser.error("only the json stages and icons work with several installs, not " + ", ".join(unsupported))
+        return main_versions(
+            a.rootDirs, workers, a.stream, a.cache or ".cache/items", "icons" in a.stages, a.compress, a.profile, a.out, a.stages
+        )
+    rootDir = a.rootDirs[0] if a.rootDirs else fetch_barotrauma_path(a.ask)
+    if rootDir is None: parser.error("couldn't find Barotrauma, give the folder it's installed in")
+    return main(
+        workers, a.stream, a.cache, a.incremental, a.mods, a.languages == ["all"], a.compress, a.profile,
+        rootDir, a.out, [] if a.languages == ["all"] else a.languages, a.stages, pipeline=a.pipeline
+    )
+
+if __name__=="__main__": exit(cli())
@@ -1,7 +1,649 @@
-
 from unittest import TestCase, main as unittest_main
+from tempfile import TemporaryDirectory
+from io import StringIO
+from hashlib import sha256
+from contextlib import redirect_stdout
+from os import makedirs
+from os.path import join as path_join, dirname, isfile
+from xml.etree.ElementTree import tostring
+from glob import glob
+from ItemParser import (
+    fetch_xml_elements, fetch_language, fetch_items, refetch_partial_items, fetch_content_packages, fetch_package_elements,
+    fetch_language_names, fetch_languages, fetch_text_ids, text_keys, export_item_bundles, fetch_content_package, fetch_merchants, cli, STAGES
+)
+from ToJson import to_json, dispatch_to_json
+from ItemCache import ItemCache
+from AssetWriter import IncrementalWriter, WriteReport, BlobStore, BlobWriter, CompressingWriter, QueuedWriter
+from gzip import decompress as gzip_decompress
+from json import load as json_load, loads as json_loads
+from AtlasPacker import pack_rects
+from SearchIndex import build_index, tokenize, run_pipeline
+from RecipeGraph import RecipeGraph
+from PriceMatrix import PriceMatrix
+from ItemTable import ItemTable
+from ViewList import ViewRow, encode_viewlist, decode_viewlist
+from Benchmark import SyntheticSpec, write_synthetic_install, bench_stages
+from Profiler import Profiler, profile_stage
+from tracemalloc import stop as tracemalloc_stop
+from cv2 import imread, IMREAD_UNCHANGED
+from pickle import dumps, loads
+from BaroInterface import Item, Recipe, Deconstructable, Sprite, Listing, PricingInfo, VariantResolver, find_child
+from xml.etree.ElementTree import fromstring
+
+def write_files (rootDir:str, files:dict[str,str]):
+    "Writes out `files` as 'relative path' -> 'contents' under `rootDir`"
+    for rel, text in files.items():
+        makedirs(dirname(path_join(rootDir, rel)), exist_ok=True)
+        with open(path_join(rootDir, rel), 'w', encoding='utf-8') as fout:
+            fout.write(text)
+
+ITEM_FILES :dict[str,str] = {
+    "Content/Items/Tools/tools.xml": """<Items>
+        <Item identifier="wrench" category="Equipment" tags="smallitem,tool">
+            <Sprite texture="tools.png" sourcerect="0,0,64,32"/>
+            <Price baseprice="20"><Price storeidentifier="merchantoutpost" multiplier="1.1"/></Price>
+            <Deconstruct time="10"><Item identifier="steel"/></Deconstruct>
+            <Fabricate suitablefabricators="fabricator" requiredtime="10"><RequiredItem identifier="steel"/></Fabricate>
+        </Item>
+        <Item identifier="screwdriver" category="Equipment">
+            <Sprite texture="tools.png" sourcerect="64,0,32,32"/>
+            <StatusEffect type="OnUse" target="This"><Affliction identifier="bleeding" amount="1"/></StatusEffect>
+        </Item>
+        <Item category="Nameless"/>
+    </Items>""",
+    "Content/Items/Materials/materials.xml": """<Items>
+        <Item identifier="steel" category="Material"><Sprite texture="mats.png" sourcerect="0,0,32,32"/></Item>
+        <Item identifier="screwdriver" category="Override"><Sprite texture="mats.png" sourcerect="32,0,32,32"/></Item>
+    </Items>""",
+}
+
+TEXT_FILES :dict[str,str] = {
+    "Content/Texts/English/items.xml": """<infotexts language="English">
+        <entityname.wrench>Wrench</entityname.wrench>
+        <entitydescription.wrench>Tightens things.</entitydescription.wrench>
+        <entityname.steel>Steel Bar</entityname.steel>
+        <entityname.steel>Steel</entityname.steel>
+    </infotexts>""",
+}
+
+class FetchXmlElements_test (TestCase):
+
+    def setUp (self):
+        self.tmp = TemporaryDirectory()
+        write_files(self.tmp.name, ITEM_FILES)
+        self.urls = list(ITEM_FILES.keys())
+
+    def tearDown (self):
+        self.tmp.cleanup()
+
+    def test_attaches_dir_and_file (self):
+        elms = fetch_xml_elements(self.tmp.name, self.urls)
+        self.assertEqual(elms['wrench'].get('dir'), 'Content/Items/Tools')
+        self.assertEqual(elms['wrench'].get('file'), 'tools')
+
+    def test_last_one_wins (self):
+        elms = fetch_xml_elements(self.tmp.name, self.urls)
+        self.assertEqual(list(elms.keys()), ['wrench', 'screwdriver', 'steel'])
+        self.assertEqual(elms['screwdriver'].get('category'), 'Override')
+
+    def test_parallel_matches_serial (self):
+        serial = fetch_xml_elements(self.tmp.name, self.urls, workers=1)
+        parallel = fetch_xml_elements(self.tmp.name, self.urls, workers=2)
+        self.assertEqual(list(serial.keys()), list(parallel.keys()))
+        for id, elm in serial.items():
+            self.assertEqual(tostring(elm), tostring(parallel[id]))
+
+    def test_case_insensitive_paths (self):
+        elms = fetch_xml_elements(self.tmp.name, [u.upper().replace("CONTENT/", "Content/") for u in self.urls])
+        self.assertEqual(list(elms.keys()), ['wrench', 'screwdriver', 'steel'])
+        self.assertEqual(elms['wrench'].get('dir'), 'Content/Items/Tools')
+
+    def test_stream_builds_same_items (self):
+        write_files(self.tmp.name, TEXT_FILES)
+        texts = fetch_language(self.tmp.name, "English")
+        self.assertEqual(texts, fetch_language(self.tmp.name, "English", stream=True))
+        self.assertEqual(texts['entityname.steel'], ['Steel Bar', 'Steel'])
+        full = fetch_items(fetch_xml_elements(self.tmp.name, self.urls), texts)
+        streamed = fetch_xml_elements(self.tmp.name, self.urls, stream=True)
+        self.assertIsNone(streamed['screwdriver'].find('StatusEffect'))
+        self.assertEqual(
+            {k: (v.name, v.recipes, v.deconsTo, v.sprite) for k,v in full.items()},
+            {k: (v.name, v.recipes, v.deconsTo, v.sprite) for k,v in fetch_items(streamed, texts).items()}
+        )
+        self.assertEqual(full['wrench'].name, 'Wrench')
+
+class ItemCache_test (TestCase):
+
+    def setUp (self):
+        self.tmp = TemporaryDirectory()
+        write_files(self.tmp.name, ITEM_FILES | TEXT_FILES | {
+            "Content/Items/Variants/variants.xml": """<Items>
+                <Item identifier="heavywrench" variantof="wrench"><Sprite texture="heavy.png" sourcerect="0,0,64,64"/></Item>
+            </Items>""",
+        })
+        self.urls = list(ITEM_FILES.keys()) + ["Content/Items/Variants/variants.xml"]
+        self.cache = ItemCache(path_join(self.tmp.name, "cache"))
+
+    def tearDown (self):
+        self.tmp.cleanup()
+
+    def fresh (self) -> dict:
+        return fetch_items(fetch_xml_elements(self.tmp.name, self.urls), fetch_language(self.tmp.name, "English"))
+
+    def test_matches_uncached (self):
+        cold = self.cache.fetch_items(self.tmp.name, self.urls, "English")
+        warm = self.cache.fetch_items(self.tmp.name, self.urls, "English")
+        self.assertEqual(cold, self.fresh())
+        self.assertEqual(warm, cold)
+        self.assertEqual(list(warm.keys()), list(self.fresh().keys()))
+
+    def test_parent_in_other_file (self):
+        self.cache.fetch_items(self.tmp.name, self.urls, "English")
+        write_files(self.tmp.name, {"Content/Items/Tools/tools.xml": ITEM_FILES["Content/Items/Tools/tools.xml"].replace(
+            'category="Equipment" tags', 'category="Heavy" tags'
+        )})
+        items = self.cache.fetch_items(self.tmp.name, self.urls, "English")
+        self.assertEqual(items['heavywrench'].category, 'Heavy')
+        self.assertEqual(items, self.fresh())
+
+    def test_parent_overridden_by_new_file (self):
+        self.cache.fetch_items(self.tmp.name, self.urls, "English")
+        write_files(self.tmp.name, {"Content/Items/Mod/mod.xml": """<Items>
+            <Item identifier="wrench" category="Modded"><Sprite texture="mod.png" sourcerect="0,0,8,8"/></Item>
+        </Items>"""})
+        self.urls.insert(2, "Content/Items/Mod/mod.xml")
+        items = self.cache.fetch_items(self.tmp.name, self.urls, "English")
+        self.assertEqual(items['heavywrench'].category, 'Modded')
+        self.assertEqual(items, self.fresh())
+
+    def test_grandparent_changed (self):
+        write_files(self.tmp.name, {"Content/Items/Variants/more.xml": """<Items>
+            <Item identifier="heavierwrench" variantof="heavywrench" tags="heavy"/>
+        </Items>"""})
+        self.urls.append("Content/Items/Variants/more.xml")
+        self.cache.fetch_items(self.tmp.name, self.urls, "English")
+        write_files(self.tmp.name, {"Content/Items/Tools/tools.xml": ITEM_FILES["Content/Items/Tools/tools.xml"].replace(
+            'category="Equipment" tags', 'category="Heavy" tags'
+        )})
+        items = self.cache.fetch_items(self.tmp.name, self.urls, "English")
+        self.assertEqual(items['heavierwrench'].category, 'Heavy')
+        self.assertEqual(items, self.fresh())
+
+    def test_texts_only_their_own (self):
+        self.cache.fetch_items(self.tmp.name, self.urls, "English")
+        write_files(self.tmp.name, {"Content/Texts/English/other.xml":
+            '<infotexts language="English"><entityname.other>Other</entityname.other></infotexts>'})
+        with redirect_stdout(out := StringIO()): self.cache.fetch_items(self.tmp.name, self.urls, "English")
+        self.assertIn("Loaded all", out.getvalue())
+        write_files(self.tmp.name, {"Content/Texts/English/items.xml": TEXT_FILES["Content/Texts/English/items.xml"].replace(">Wrench<", ">Spanner<")})
+        with redirect_stdout(out := StringIO()): items = self.cache.fetch_items(self.tmp.name, self.urls, "English")
+        self.assertIn("Rebuilding", out.getvalue())
+        self.assertEqual(items['wrench'].name, 'Spanner')
+        self.assertEqual(items, self.fresh())
+
+class VariantResolver_test (TestCase):
+    XML = """<Items>
+        <Item identifier="a" category="Material" tags="a" dir="Content/A" file="a">
+            <Sprite texture="a.png" sourcerect="0,0,8,8"/><Price baseprice="10"><Price storeidentifier="merchantx"/></Price>
+        </Item>
+        <Item identifier="b" variantof="a" dir="Content/B" file="b"><Price baseprice="20"/></Item>
+        <Item identifier="c" variantof="b" tags="c" dir="Content/C" file="c"/>
+        <Item identifier="x" variantof="y" dir="Content/X" file="x"><Sprite texture="x.png" sourcerect="0,0,8,8"/></Item>
+        <Item identifier="y" variantof="x" tags="y" dir="Content/X" file="x"/>
+    </Items>"""
+
+    def elements (self) -> dict:
+        return {e.get("identifier","") : e for e in fromstring(VariantResolver_test.XML)}
+
+    def test_chain (self):
+        elements = self.elements()
+        before = {id : tostring(e) for id, e in elements.items()}
+        items = fetch_items(elements, {})
+        self.assertEqual({id : tostring(e) for id, e in elements.items()}, before) # nothing changed
+        self.assertEqual((items['c'].category, items['c'].tags), ("Material", ["c"]))
+        self.assertEqual(items['c'].sprite.path, "Content/A/a.png")
+        price = items['c'].priceInfo
+        self.assertEqual(price.default_factory()['basePrice'], 20) # type: ignore , from b
+        self.assertIn('x', price) # b had no merchants, so a's
+        self.assertEqual(items, fetch_items(dict(reversed(elements.items())), {}))
+
+    def test_loop (self):
+        resolver = VariantResolver(self.elements())
+        self.assertEqual(resolver.ancestors('c'), ['b', 'a'])
+        self.assertEqual(resolver.ancestors('x'), ['y'])
+        self.assertIs(resolver['y'], resolver.elements['y'])
+        self.assertIs(resolver['x'], resolver.elements['x'])
+
+class FindChild_test (TestCase):
+
+    def test_last_then_lowercase (self):
+        e = fromstring('<Item identifier="a" dir="D" file="f"><Sprite texture="1.png" sourcerect="0,0,1,1"/>'
+            '<Sprite texture="2.png" sourcerect="0,0,1,1"/><deconstruct time="5"><Item identifier="b"/></deconstruct></Item>')
+        self.assertEqual(find_child(e, "Sprite").get("texture"), "2.png") # type: ignore
+        self.assertIsNone(find_child(e, "Price"))
+        item = Item.from_Element(e, {})
+        self.assertEqual((item.sprite.path, item.deconsTo), ("D/2.png", Deconstructable({"b" : 1}, 5.0))) # type: ignore
+
+class ContentPackages_test (TestCase):
+
+    def setUp (self):
+        self.tmp = TemporaryDirectory()
+        write_files(self.tmp.name, ITEM_FILES | TEXT_FILES | {
+            "Content/ContentPackages/Vanilla.xml": '<contentpackage name="Vanilla" gameversion="1.0.0.0">'
+                + "".join(f'<Item file="{url}"/>' for url in ITEM_FILES) + '</contentpackage>',
+            "LocalMods/Bigger/filelist.xml": """<contentpackage name="Bigger" gameversion="1.0.0.0">
+                <Item file="%ModDir%/Items/bigger.xml"/><Text file="%ModDir%/english.xml"/>
+            </contentpackage>""",
+            "LocalMods/Bigger/Items/bigger.xml": """<Items><Override>
+                <Item identifier="wrench" category="Bigger"><Sprite texture="%ModDir%/wrench.png" sourcerect="0,0,128,64"/></Item>
+            </Override></Items>""",
+            "LocalMods/Bigger/english.xml": '<infotexts language="English"><entityname.wrench>Big Wrench</entityname.wrench></infotexts>',
+            "LocalMods/Heavy/filelist.xml": """<contentpackage name="Heavy" gameversion="1.0.0.0">
+                <Item file="%ModDir%/heavy.xml"/>
+            </contentpackage>""",
+            "LocalMods/Heavy/heavy.xml": """<Items>
+                <Item identifier="heavywrench" variantof="wrench"><Sprite texture="%ModDir:Bigger%/heavy.png" sourcerect="0,0,64,64"/></Item>
+            </Items>""",
+        })
+        self.packages = fetch_content_packages(self.tmp.name, ["LocalMods/Bigger", "LocalMods/Heavy"])
+
+    def tearDown (self):
+        self.tmp.cleanup()
+
+    def test_overrides_in_load_order (self):
+        elms, provenance = fetch_package_elements(self.tmp.name, self.packages)
+        texts = fetch_language(self.tmp.name, "English", modFiles=self.packages[1].texts)
+        items = fetch_items(elms, texts)
+        self.assertEqual(items['wrench'].category, 'Bigger')
+        self.assertEqual(items['wrench'].name, 'Big Wrench')
+        self.assertEqual(items['wrench'].sprite.path, 'LocalMods/Bigger/wrench.png')
+        self.assertEqual(items['heavywrench'].sprite.path, 'LocalMods/Bigger/heavy.png')
+        self.assertEqual(items['heavywrench'].priceInfo, items['wrench'].priceInfo)
+        self.assertEqual(provenance['wrench'].package, 'Bigger')
+        self.assertEqual(provenance['wrench'].overrides, ['Content/Items/Tools/tools.xml'])
+        self.assertEqual(provenance['heavywrench'].files, ['LocalMods/Heavy/heavy.xml', 'LocalMods/Bigger/Items/bigger.xml'])
+        cached, cachedProvenance, _ = ItemCache(path_join(self.tmp.name, "cache")).fetch_package_items(self.tmp.name, self.packages, "English")
+        self.assertEqual(cached, items)
+        self.assertEqual(cachedProvenance, {id : provenance[id] for id in items})
+
+class TextShards_test (TestCase):
+
+    def test_only_used_texts (self):
+        with TemporaryDirectory() as tmp:
+            write_files(tmp, ITEM_FILES | TEXT_FILES | {
+                "Content/Texts/German/items.xml": """<infotexts language="German">
+                    <entityname.wrench>Schraubenschlüssel</entityname.wrench>
+                    <entityname.unused>Nichts</entityname.unused>
+                    <entityname.geneticmaterialhusk>Husk</entityname.geneticmaterialhusk>
+                </infotexts>""",
+                "Content/Items/Genetic/genetic.xml": """<Items>
+                    <Item identifier="huskgenes" nameidentifier="geneticmaterial" category="Material">
+                        <Sprite texture="genes.png" sourcerect="0,0,32,32"/>
+                        <GeneticMaterial nameidentifier="entityname.geneticmaterialhusk" tooltipvaluemin="5" tooltipvaluemax="10">
+                            <StatValue stattype="MaximumHealthMultiplier" value="0.1"/>
+                        </GeneticMaterial>
+                    </Item>
+                </Items>""",
+            })
+            elms = fetch_xml_elements(tmp, list(ITEM_FILES.keys()) + ["Content/Items/Genetic/genetic.xml"])
+            items = fetch_items(elms, fetch_language(tmp, "English"))
+            textIds = fetch_text_ids(elms)
+            self.assertEqual(textIds['huskgenes'], [
+                "entityname.geneticmaterial", "entitydescription.huskgenes", "entityname.geneticmaterialhusk", "5-10"
+            ])
+            langs = fetch_language_names(tmp)
+            self.assertEqual(langs, ["English", "German"])
+            shards = fetch_languages(tmp, langs, text_keys(items, textIds), workers=2)
+            self.assertEqual(shards, fetch_languages(tmp, langs, text_keys(items, textIds)))
+            self.assertEqual(shards["German"], {
+                "entityname.geneticmaterialhusk": ["Husk"], "entityname.wrench": ["Schraubenschlüssel"]
+            })
+            self.assertEqual(shards["English"]["entityname.steel"], ["Steel Bar", "Steel"])
+
+class IncrementalWriter_test (TestCase):
+
+    def test_only_writes_changes (self):
+        with TemporaryDirectory() as tmp:
+            w = IncrementalWriter(tmp)
+            for name in "abc": w.write(f"{tmp}/items/{name}.json", f'"{name}"')
+            self.assertEqual(w.finish(), WriteReport(3, 0, 0, 0))
+            w = IncrementalWriter(tmp)
+            w.write(f"{tmp}/items/a.json", '"a"')
+            w.write(f"{tmp}/items/b.json", '"B"')
+            w.write(f"{tmp}/items/d.json", '"d"')
+            self.assertEqual(w.finish(), WriteReport(1, 1, 1, 1))
+            with open(f"{tmp}/items/b.json") as fin: self.assertEqual(fin.read(), '"B"')
+            self.assertFalse(isfile(f"{tmp}/items/c.json"))
+
+class CompressingWriter_test (TestCase):
+
+    def test_compresses_changes (self):
+        with TemporaryDirectory() as tmp:
+            text = '{"desc":"%s"}' % ("A very compressible description. " * 50)
+            w = CompressingWriter(IncrementalWriter(tmp), tmp)
+            w.write(f"{tmp}/items/a.json", text)
+            w.write(f"{tmp}/items/b.json", '"b"') # too small to be worth it
+            w.write(f"{tmp}/items/c.json", text)
+            w.finish()
+            with open(f"{tmp}/items/a.json.gz", 'rb') as fin: self.assertEqual(gzip_decompress(fin.read()).decode(), text)
+            self.assertFalse(isfile(f"{tmp}/items/b.json.gz"))
+            self.assertEqual(w.report["json"].files, 2)
+            w = CompressingWriter(IncrementalWriter(tmp), tmp)
+            w.write(f"{tmp}/items/a.json", text)
+            w.write(f"{tmp}/items/b.json", text)
+            w.finish()
+            self.assertEqual(w.report["json"].files, 1) # only b, a didn't change
+            self.assertFalse(isfile(f"{tmp}/items/c.json.gz"))
+
+    def test_remembers_skipped (self):
+        with TemporaryDirectory() as tmp:
+            noise = b"".join(sha256(bytes([n])).digest() for n in range(16)) # doesn't get any smaller
+            for _ in range(2):
+                w = CompressingWriter(IncrementalWriter(tmp), tmp)
+                w.write_bytes(f"{tmp}/a.bin", noise)
+                w.finish()
+                self.assertFalse(isfile(f"{tmp}/a.bin.gz"))
+            self.assertEqual(w.report, {}) # not compressed again just because there's no copy
+
+class QueuedWriter_test (TestCase):
+
+    def test_writes_in_order_then_raises (self):
+        with TemporaryDirectory() as tmp:
+            w = QueuedWriter(IncrementalWriter(tmp), maxQueued=2)
+            for n in range(20): w.write(f"{tmp}/items/{n % 5}.json", str(n))
+            self.assertEqual(w.finish(), WriteReport(5, 15, 0, 0))
+            with open(f"{tmp}/items/4.json") as fin: self.assertEqual(fin.read(), "19") # the last write of it won
+            w = QueuedWriter(IncrementalWriter(f"{tmp}/items/0.json")) # a file, so no folder can go in it
+            w.write(f"{tmp}/items/0.json/a.json", "a")
+            self.assertRaises(OSError, w.finish)
+
+class BlobWriter_test (TestCase):
+
+    def test_versions_share_blobs (self):
+        with TemporaryDirectory() as tmp:
+            store = BlobStore(f"{tmp}/blobs")
+            for version, b in (("v1", '"b"'), ("v2", '"B"')):
+                w = BlobWriter(store, tmp, f"{tmp}/json/{version}/{BlobWriter.MANIFEST}", [f"json/{version}/items"])
+                w.write(f"{tmp}/json/{version}/items/a.json", '"a"')
+                w.write(f"{tmp}/json/{version}/items/b.json", b)
+                w.write(f"{tmp}/json/{version}/ItemList.json", '["a","b"]')
+                w.finish()
+            manifests = [f"{tmp}/json/{v}/{BlobWriter.MANIFEST}" for v in ("v1", "v2")]
+            v1, v2 = (json_load(open(p))["files"] for p in manifests)
+            self.assertEqual(v1["json/v1/items/a.json"], v2["json/v2/items/a.json"])
+            self.assertNotEqual(v1["json/v1/items/b.json"], v2["json/v2/items/b.json"])
+            self.assertEqual(len(glob(f"{tmp}/blobs/*/*.json")), 3)
+            self.assertTrue(isfile(f"{tmp}/json/v2/ItemList.json"))
+            self.assertEqual(store.prune(manifests[1:]), 1)
+
+class ToJson_test (TestCase):
+
+    def test_matches_exported_items (self):
+        "Every item already exported should come back out exactly the same"
+        folder = sorted(glob(path_join(dirname(__file__), "../assets/json/*/items")))[-1]
+        for id, item in refetch_partial_items(folder).items():
+            with open(f"{folder}/{id}.json", 'rb') as fin:
+                raw = fin.read()
+            try: text = raw.decode('utf-8')
+            except UnicodeDecodeError: text = raw.decode('cp1252') # older exports
+            self.assertEqual(to_json(item), text)
+            self.assertEqual(to_json(item), dispatch_to_json(item))
+
+    def test_bundles_match_items (self):
+        folder = sorted(glob(path_join(dirname(__file__), "../assets/json/*/items")))[-1]
+        items = refetch_partial_items(folder)
+        with TemporaryDirectory() as tmp:
+            export_item_bundles(items, tmp, maxBytes=16*1024)
+            with open(f"{tmp}/bundles/index.json") as fin: index = json_load(fin)
+            self.assertEqual(index["items"].keys(), items.keys())
+            for n, name in enumerate(index["bundles"]):
+                with open(f"{tmp}/bundles/{name}.json", encoding='utf-8') as fin: text = fin.read()
+                bundle = json_loads(text)
+                self.assertTrue(len(text) <= 16*1024 or len(bundle) == 1)
+                for id, item in bundle.items():
+                    self.assertEqual(index["items"][id], n)
+                    self.assertEqual(item, json_loads(to_json(items[id])))
+
+    def test_escapes_strings (self):
+        self.assertEqual(to_json({"a": 'say "hi"\n', "b": ['x', 1, 2.5, None, True]}), '{"a":"say \\"hi\\"\\n","b":["x",1,2.5,null,true]}')
+
+class AtlasPacker_test (TestCase):
+
+    def test_no_overlaps (self):
+        sizes = {f"i{n}" : (64 if n%3 else 40, 64 if n%2 else 30) for n in range(120)}
+        placed = pack_rects(sizes, 256, padding=1)
+        self.assertEqual(list(placed.keys()), list(sizes.keys()))
+        for id, p in placed.items():
+            self.assertEqual((p.w, p.h), sizes[id])
+            self.assertTrue(0 <= p.x and p.x+p.w < 256 and 0 <= p.y and p.y+p.h < 256)
+        pixels :set[tuple[int,int,int]] = set()
+        for p in placed.values():
+            covered = {(p.sheet, x, y) for x in range(p.x, p.x+p.w+1) for y in range(p.y, p.y+p.h+1)}
+            self.assertFalse(pixels & covered)
+            pixels |= covered
+        self.assertLessEqual(max(p.sheet for p in placed.values()), 6)
+
+    def test_too_big (self):
+        with self.assertRaises(ValueError): pack_rects({"huge": (300, 10)}, 256)
+
+class SearchIndex_test (TestCase):
+
+    def test_pipeline (self):
+        "Compared against elasticlunr.js 0.9.5"
+        self.assertEqual(tokenize(" -Heavy-duty  Wrench "), ['', 'heavy', 'duty', 'wrench'])
+        self.assertEqual(run_pipeline(tokenize("(Explosive) ammunition, hopefully; relational 'y'")),
+            ['explos', 'ammunit', 'hopefulli', 'relat', 'y'])
+
+    def test_index_shape (self):
+        index = build_index([
+            {"id": "wrench", "name": "Wrench", "desc": "wrench wrench wrench wrench"},
+            {"id": "screw", "name": "Screwdriver", "desc": ""},
+        ], ["name", "desc"])
+        self.assertEqual(index["documentStore"]["length"], 2)
+        self.assertEqual(index["documentStore"]["docInfo"], {"wrench": {"name": 1, "desc": 4}, "screw": {"name": 1, "desc": 0}})
+        node = index["index"]["desc"]["root"]
+        for ch in "wrench": node = node[ch]
+        self.assertEqual(node["df"], 1)
+        self.assertEqual(node["docs"], {"wrench": {"tf": 2}})
+        self.assertEqual(index["pipeline"], ["trimmer", "stopWordFilter", "stemmer"])
+
+    def test_js_key_order (self):
+        "Integer-like keys come first, same as JSON.stringify"
+        index = build_index([{"id": "a", "name": "b2 12 1x 10"}], ["name"])
+        self.assertEqual(list(index["index"]["name"]["root"].keys()), ["1", "docs", "df", "b"])
+        self.assertEqual(list(index["index"]["name"]["root"]["1"].keys()), ["0", "2", "docs", "df", "x"])
+
+class RecipeGraph_test (TestCase):
+
+    def setUp (self):
+        def item (id:str, required:dict[str,int]|None=None, output:int=1, decon:dict[str,int]|None=None) -> Item:
+            return Item(id, [], id, "", "", None,
+                Deconstructable(decon, 10.0) if decon else None,
+                [Recipe(required, output, "fabricator", 10.0, {}, 0)] if required else [],
+                None, Sprite("", (0,0,1,1), (1.0,1.0,1.0)))
+        self.graph = RecipeGraph({
+            "steel": item("steel", {"iron": 2}, output=2, decon={"iron": 1}),
+            "wrench": item("wrench", {"steel": 1, "plastic": 1}, decon={"steel": 1}),
+            "heavywrench": item("heavywrench", {"wrench": 2, "steel": 1}),
+            "goop": item("goop", {"slime": 1}), "slime": item("slime", {"goop": 1}),
+        })
+
+    def test_raw_materials (self):
+        self.assertEqual(self.graph.raw_materials("heavywrench"), {"iron": 3.0, "plastic": 2.0})
+        self.assertEqual(self.graph.raw_materials("iron"), {"iron": 1.0})
+        self.assertEqual(self.graph.salvage("wrench"), {"iron": 1.0})
+        self.assertEqual(self.graph.used_in("steel"), ["wrench", "heavywrench"])
+
+    def test_cycles (self):
+        self.assertEqual(self.graph.fabrication.cycles(), [["goop", "slime"]])
+        self.assertEqual(self.graph.raw_materials("goop"), {"goop": 1.0})
+        self.assertEqual(self.graph.deconstruction.cycles(), [])
+
+class ItemTable_test (TestCase):
+
+    def test_round_trip (self):
+        with TemporaryDirectory() as tmp:
+            write_files(tmp, ITEM_FILES | TEXT_FILES)
+            items = fetch_items(fetch_xml_elements(tmp, list(ITEM_FILES.keys())), fetch_language(tmp, "English"))
+        table = loads(dumps(ItemTable(items)))
+        self.assertEqual(list(table.keys()), list(items.keys()))
+        self.assertEqual(table.to_items(), items)
+        row = table['wrench']
+        self.assertEqual((row.name, row.tags, row.sprite), (items['wrench'].name, items['wrench'].tags, items['wrench'].sprite))
+        self.assertEqual(row.priceInfo['clown'], items['wrench'].priceInfo['clown']) # type: ignore , has a price
+        self.assertIsNone(table['steel'].deconsTo)
+
+class ViewList_test (TestCase):
+
+    def test_round_trip (self):
+        rows = [ViewRow("wrench", "Wrench", 30, True, False), ViewRow("dürr", "Dürr ✓", 0, False, True), ViewRow("odd", "", 7, True, True)]
+        data = encode_viewlist(rows)
+        self.assertEqual(len(data) % 4, 0)
+        self.assertEqual(decode_viewlist(data), rows)
+        self.assertEqual(decode_viewlist(encode_viewlist([])), [])
+        with self.assertRaises(ValueError): decode_viewlist(b"JSON" + data[4:])
+
+class Synthetic_test (TestCase):
+    SPEC = SyntheticSpec(items=40, itemsPerFile=15, sheets=2, sheetSize=256, languages=2)
+
+    def test_install_parses (self):
+        with TemporaryDirectory() as tmp:
+            ids = write_synthetic_install(tmp, Synthetic_test.SPEC)
+            package = fetch_content_package(tmp, "Vanilla")
+            self.assertEqual(len(package.items), 3)
+            self.assertEqual(fetch_merchants(tmp, package.npc_sets), [str(m) for m in range(8)])
+            self.assertEqual(fetch_language_names(tmp), ["English", "German"])
+            items = fetch_items(fetch_xml_elements(tmp, package.items), fetch_language(tmp, "English"))
+            self.assertEqual(list(items.keys()), ids)
+            self.assertEqual(items['synth9'].sprite, items['synth8'].sprite) # a variant
+            self.assertEqual(items['synth3'].name, "English Item 3")
+            self.assertEqual(imread(f"{tmp}/{items['synth0'].sprite.path}", IMREAD_UNCHANGED).shape, (256, 256, 4))
+            with open(f"{tmp}/{package.items[0]}", 'rb') as fin: first = fin.read()
+        with TemporaryDirectory() as tmp:
+            write_synthetic_install(tmp, Synthetic_test.SPEC)
+            with open(f"{tmp}/{package.items[0]}", 'rb') as fin: self.assertEqual(fin.read(), first)
+
+    def test_bench_stages (self):
+        with TemporaryDirectory() as tmp:
+            write_synthetic_install(f"{tmp}/Barotrauma", Synthetic_test.SPEC)
+            results = bench_stages(f"{tmp}/Barotrauma", f"{tmp}/assets", images=False, memory=False)
+        self.assertEqual([r.stage for r in results][:3], ["fetch_xml_elements", "fetch_language", "fetch_items"])
+        self.assertIn("fetch_languages", [r.stage for r in results])
+        self.assertTrue(all(r.peakBytes == -1 and r.seconds >= 0 for r in results))
+
+    def test_sheets_held_within_budget (self):
+        from ItemImageDownloader import ImageDownloader
+        with TemporaryDirectory() as tmp:
+            write_synthetic_install(tmp, Synthetic_test.SPEC._replace(sheets=8))
+            package = fetch_content_package(tmp, "Vanilla")
+            items = fetch_items(fetch_xml_elements(tmp, package.items), fetch_language(tmp, "English"))
+            sheet = 256*256*4
+            downloader = ImageDownloader(tmp, workers=16, cacheBytes=sheet)
+            self.assertTrue(downloader.download_sprites(items, f"{tmp}/sprites"))
+            self.assertEqual(len(glob(f"{tmp}/sprites/*.png")), len(items))
+            self.assertLessEqual(downloader.peakBytes, 2*sheet) # the cache's budget, and the sheet just decoded
+
+class Cli_test (TestCase):
+
+    def test_only_runs_given_stages (self):
+        with TemporaryDirectory() as tmp:
+            write_synthetic_install(f"{tmp}/Barotrauma", Synthetic_test.SPEC)
+            self.assertEqual(cli([f"{tmp}/Barotrauma", "--out", f"{tmp}/out", "--stages", "items", "viewlist", "--languages", "German"]), 0)
+            out = f"{tmp}/out/json/1-0-0-0"
+            self.assertTrue(isfile(f"{out}/items/synth0.json"))
+            self.assertTrue(isfile(f"{out}/ViewItemsList.bin"))
+            self.assertTrue(isfile(f"{out}/texts/German.json"))
+            self.assertFalse(isfile(f"{out}/CraftingTrees.json"))
+            self.assertFalse(isfile(f"{out}/SearchIndex.json"))
+
+    def test_stages_keep_other_files (self):
+        with TemporaryDirectory() as tmp:
+            write_synthetic_install(f"{tmp}/Barotrauma", Synthetic_test.SPEC)
+            args = [f"{tmp}/Barotrauma", "--out", f"{tmp}/out", "--incremental"]
+            self.assertEqual(cli(args), 0)
+            out = f"{tmp}/out/json/1-0-0-0"
+            before = {p for p in glob(f"{out}/**/*.*", recursive=True)}
+            self.assertEqual(cli(args + ["--stages", "items"]), 0)
+            self.assertEqual(cli(args + ["--stages", "searchdoc"]), 0)
+            self.assertEqual({p for p in glob(f"{out}/**/*.*", recursive=True)}, before)
+            with open(f"{out}/.manifest.json") as fin: self.assertIn("SearchIndex.json", json_load(fin))
+
+    def test_atlas_json_goes_through_writer (self):
+        with TemporaryDirectory() as tmp:
+            write_synthetic_install(f"{tmp}/Barotrauma", Synthetic_test.SPEC)
+            args = [f"{tmp}/Barotrauma", "--out", f"{tmp}/out", "--incremental"]
+            self.assertEqual(cli(args + ["--stages", "items", "atlas"]), 0)
+            with open(f"{tmp}/out/json/1-0-0-0/.manifest.json") as fin:
+                self.assertIn("../../images/items/1-0-0-0/atlas/atlas.json", json_load(fin))
+            self.assertEqual(cli(args + ["--stages", "items"]), 0)
+            with open(f"{tmp}/out/images/items/1-0-0-0/atlas/atlas.json") as fin: atlas = json_load(fin)
+            self.assertEqual(atlas["sheets"], ["atlas0.png"])
+            self.assertIn("synth0", atlas["icons"])
+
+    def test_stages_keep_other_blobs (self):
+        with TemporaryDirectory() as tmp:
+            for v in ("1.0.0.0", "1.1.0.0"):
+                write_synthetic_install(f"{tmp}/{v}", Synthetic_test.SPEC._replace(version=v))
+            args = [f"{tmp}/1.0.0.0", f"{tmp}/1.1.0.0", "--out", f"{tmp}/out"]
+            self.assertEqual(cli(args), 0)
+            before = {p for p in glob(f"{tmp}/out/**/*.*", recursive=True)}
+            self.assertEqual(cli(args + ["--stages", "searchdoc"]), 0)
+            self.assertEqual({p for p in glob(f"{tmp}/out/**/*.*", recursive=True)}, before)
+            with open(f"{tmp}/out/json/1-1-0-0/{BlobWriter.MANIFEST}") as fin:
+                self.assertIn("json/1-1-0-0/items/synth0.json", json_load(fin)["files"])
+
+    def test_pipeline_writes_the_same (self):
+        with TemporaryDirectory() as tmp:
+            write_synthetic_install(f"{tmp}/Barotrauma", Synthetic_test.SPEC)
+            for out, extra in (("a", []), ("b", ["--pipeline", "--workers", "2"])):
+                self.assertEqual(cli([f"{tmp}/Barotrauma", "--out", f"{tmp}/{out}", "--stages", *STAGES] + extra), 0)
+            files = {p.removeprefix(f"{tmp}/a") for p in glob(f"{tmp}/a/**/*.*", recursive=True)}
+            self.assertEqual(files, {p.removeprefix(f"{tmp}/b") for p in glob(f"{tmp}/b/**/*.*", recursive=True)})
+            for f in files:
+                with open(f"{tmp}/a{f}", 'rb') as a, open(f"{tmp}/b{f}", 'rb') as b: self.assertEqual(a.read(), b.read(), f)
+
+class Profiler_test (TestCase):
+
+    def test_records_stages_files_and_items (self):
+        profiler = Profiler(slowest=2)
+        self.addCleanup(tracemalloc_stop)
+        with TemporaryDirectory() as tmp:
+            write_files(tmp, ITEM_FILES | TEXT_FILES)
+            with profile_stage(profiler, "parse") as stage:
+                xml = fetch_xml_elements(tmp, list(ITEM_FILES.keys()), profiler=profiler)
+                texts = fetch_language(tmp, "English", profiler=profiler)
+                stage["elements"] = len(xml)
+                with profile_stage(profiler, "inner"):
+                    kept = [bytes(2**20)] # a peak inside a nested stage still counts for the outer one
+                del kept
+            items = fetch_items(xml, texts, profiler)
+        self.assertEqual(items, fetch_items(xml, texts))
+        report = profiler.report()
+        self.assertEqual([s["stage"] for s in report["stages"]], ["inner", "parse"])
+        self.assertEqual(report["stages"][1]["elements"], 3)
+        self.assertGreaterEqual(report["stages"][1]["peakBytes"], 2**20)
+        self.assertEqual(sorted(f["file"] for f in report["files"]), sorted(ITEM_FILES.keys() | TEXT_FILES.keys()))
+        self.assertEqual(len(report["slowestItems"]), 2)
+        self.assertGreaterEqual(report["slowestItems"][0]["wall"], report["slowestItems"][1]["wall"])
+        with profile_stage(None, "off") as stage: stage["x"] = 1 # nothing to record it
 
 class PriceAndListings_test (TestCase):
-    pass
+
+    def test_price_matrix (self):
+        def item (id:str, p:PricingInfo|None) -> Item:
+            return Item(id, [], id, "", "", p, None, [], None, Sprite("", (0,0,1,1), (1.0,1.0,1.0)))
+        wrench = PricingInfo(Listing(basePrice=100, minLevelDifficulty=10).copy, {
+            "outpost": Listing(multiplier=1.5, sold=False),
+            "city": Listing(minAvailable=1, multiplier=1.25, maxAvailable=3),
+            "mine": Listing(multiplier=0.8, buyingPriceModifier=1.5),
+        })
+        pm = PriceMatrix({"wrench": item("wrench", wrench), "rock": item("rock", None)}, ["outpost", "city", "mine", "clown"])
+        self.assertEqual(pm.minAvailable[0].tolist(), [0, 1, 5, 0])
+        self.assertEqual(pm.maxAvailable[0].tolist(), [0, 3, 5, 0])
+        self.assertEqual(pm.minLevelDifficulty[0].tolist(), [10, 10, 10, 0])
+        self.assertEqual([round(p, 2) for p in pm.buy_prices()[0].tolist()[1:3]], [125.0, 120.0])
+        self.assertEqual(pm.cheapest_merchant(), {"wrench": "mine"})
+        self.assertEqual(pm.best_buyer(), {"wrench": "outpost"})
+        self.assertNotIn("clown", wrench)
 
 if __name__ == "__main__": unittest_main()
@@ -0,0 +1,271 @@
+"""Contains `ItemTable`, a compact column by column copy of a `dict[str,Item]` for holding lots of items at once,
+like several game versions or mod sets being compared. Rows come back out as `ItemRow` views or as plain Items."""
+
+from array import array
+from typing import Any, Iterator
+from BaroInterface import (
+    Item, Listing, PricingInfo, Deconstructable, Recipe, Texture, InventoryIcon, Sprite, Colour
+)
+
+class StringPool:
+    "Every distinct string once, each one referred to by its index"
+
+    def __init__(self) -> None:
+        self.strings :list[str] = []
+        self.__index :dict[str,int]|None = {}
+
+    def __getitem__(self, n:int) -> str:
+        return self.strings[n]
+
+    def intern (self, s:str) -> int:
+        "The index of `s`, adding it if it's new"
+        if self.__index is None:
+            self.__index = {s : n for n, s in enumerate(self.strings)}
+        if (n := self.__index.get(s)) is None:
+            n = self.__index[s] = len(self.strings)
+            self.strings.append(s)
+        return n
+
+    def freeze (self):
+        "Drops the index `intern` uses, it's rebuilt if `intern` is ever called again"
+        self.__index = None
+
+    def __getstate__ (self) -> list[str]:
+        return self.strings
+
+    def __setstate__ (self, strings:list[str]):
+        self.strings = strings
+        self.__index = None
+# end StringPool
+
+class ItemRow:
+    """A read-only view of a single row of an `ItemTable`, with the same attributes as `Item`.
+    Each attribute is rebuilt from the table when read, use `to_Item` when reading lots of them."""
+    __slots__ = ("table", "row")
+
+    def __init__(self, table:"ItemTable", row:int) -> None:
+        self.table = table
+        self.row = row
+
+    def __repr__ (self) -> str:
+        return f"ItemRow({self.id!r})"
+
+    @property
+    def id (self) -> str: return self.table.strings[self.table.id[self.row]]
+    @property
+    def name (self) -> str: return self.table.strings[self.table.name[self.row]]
+    @property
+    def desc (self) -> str: return self.table.strings[self.table.desc[self.row]]
+    @property
+    def category (self) -> str: return self.table.strings[self.table.category[self.row]]
+    @property
+    def tags (self) -> list[str]: return self.table.tags_of(self.row)
+    @property
+    def priceInfo (self) -> PricingInfo|None: return self.table.priceInfo_of(self.row)
+    @property
+    def deconsTo (self) -> Deconstructable|None: return self.table.deconsTo_of(self.row)
+    @property
+    def recipes (self) -> list[Recipe]: return self.table.recipes_of(self.row)
+    @property
+    def icon (self) -> InventoryIcon|None: return self.table.texture_of(self.row, InventoryIcon)
+    @property
+    def sprite (self) -> Sprite: return self.table.texture_of(self.row, Sprite) # type: ignore , sprites always exist
+
+    def to_Item (self) -> Item:
+        return Item(self.id, self.tags, self.name, self.desc, self.category,
+            self.priceInfo, self.deconsTo, self.recipes, self.icon, self.sprite)
+# end ItemRow
+
+class ItemTable:
+    """Construct me with the output of `fetch_items`. Every string is interned into `strings`,
+    everything else goes into flat `array` columns, lists per item being a `*Start` column of offsets into another.
+    Pricing listings are deduplicated too, most items share the same few.
+    Acts like a read-only `dict[str,ItemRow]`, and `to_items` gives back the original `dict[str,Item]`."""
+
+    def __init__(self, items:dict[str,Item]) -> None:
+        self.strings = StringPool()
+        S = self.strings.intern # shorthand
+        self.listings :list[tuple[tuple[str,Any],...]] = []
+        "Distinct `Listing`s as (key, value) pairs in their original order, repRequired as pairs too"
+        listingIndex :dict[tuple[tuple[str,Any],...],int] = {}
+        def L (l:Listing) -> int:
+            key = tuple((k, tuple(v.items()) if isinstance(v, dict) else v) for k, v in l.items())
+            if (n := listingIndex.get(key)) is None:
+                n = listingIndex[key] = len(self.listings)
+                self.listings.append(key)
+            return n
+        i = lambda: array('i') # shorthand
+        self.id, self.name, self.desc, self.category = i(), i(), i(), i()
+        self.tagStart, self.tag = i(), i()
+        self.priceDefault, self.priceStart, self.priceMerchant, self.priceListing = i(), i(), i(), i()
+        "`priceDefault` is -1 for no price"
+        self.deconTime, self.deconStart, self.deconItem, self.deconAmount = array('d'), i(), i(), i()
+        "`deconTime` is NaN when it can't be deconstructed"
+        self.recipeStart, self.recipeOutput, self.recipeMachine, self.recipeTime, self.recipeMoney = i(), i(), i(), array('d'), i()
+        self.requiredStart, self.requiredItem, self.requiredAmount = i(), i(), i()
+        self.skillStart, self.skill, self.skillLevel = i(), i(), i()
+        self.colours :list[Colour] = []
+        "Distinct texture colours, there's only a handful"
+        colourIndex :dict[Colour,int] = {}
+        def C (c:Colour) -> int:
+            if (n := colourIndex.get(c)) is None:
+                n = colourIndex[c] = len(self.colours)
+                self.colours.append(c)
+            return n
+        self.iconPath, self.iconRect, self.iconColour = i(), i(), i()
+        "`iconPath` is -1 when it has no icon, `*Rect` holds 4 values per item"
+        self.spritePath, self.spriteRect, self.spriteColour = i(), i(), i()
+        for item in items.values():
+            self.id.append(S(item.id)); self.name.append(S(item.name))
+            self.desc.append(S(item.desc)); self.category.append(S(item.category))
+            self.tagStart.append(len(self.tag))
+            self.tag.extend(S(t) for t in item.tags)
+            self.priceStart.append(len(self.priceMerchant))
+            p = item.priceInfo
+            if p is None:
+                self.priceDefault.append(-1)
+            else:
+                self.priceDefault.append(L(p.default_factory() if p.default_factory is not None else Listing()))
+                for merchant, listing in p.items():
+                    self.priceMerchant.append(S(merchant)); self.priceListing.append(L(listing))
+            self.deconStart.append(len(self.deconItem))
+            self.deconTime.append(float('nan') if item.deconsTo is None else item.deconsTo.time)
+            for out, amount in (item.deconsTo.output.items() if item.deconsTo is not None else ()):
+                self.deconItem.append(S(out)); self.deconAmount.append(amount)
+            self.recipeStart.append(len(self.recipeOutput))
+            for r in item.recipes:
+                self.recipeOutput.append(r.output); self.recipeMachine.append(S(r.machine))
+                self.recipeTime.append(r.time); self.recipeMoney.append(r.requiredMoney)
+                self.requiredStart.append(len(self.requiredItem))
+                for req, amount in r.required.items():
+                    self.requiredItem.append(S(req)); self.requiredAmount.append(amount)
+                self.skillStart.append(len(self.skill))
+                for skill, level in r.skills.items():
+                    self.skill.append(S(skill)); self.skillLevel.append(level)
+            for tex, path, rect, colour in (
+                (item.icon, self.iconPath, self.iconRect, self.iconColour),
+                (item.sprite, self.spritePath, self.spriteRect, self.spriteColour),
+            ):
+                path.append(-1 if tex is None else S(tex.path))
+                rect.extend((0,0,0,0) if tex is None else tex.rect)
+                colour.append(-1 if tex is None else C(tex.colour))
+        # Close off every offset column, so rows `n` runs from `start[n]` to `start[n+1]`
+        self.tagStart.append(len(self.tag))
+        self.priceStart.append(len(self.priceMerchant))
+        self.deconStart.append(len(self.deconItem))
+        self.recipeStart.append(len(self.recipeOutput))
+        self.requiredStart.append(len(self.requiredItem))
+        self.skillStart.append(len(self.skill))
+        self.strings.freeze()
+        self.__rows :dict[str,int] = {self.strings[s] : n for n, s in enumerate(self.id)}
+
+    def __getstate__ (self) -> dict[str,Any]:
+        state = self.__dict__.copy()
+        del state["_ItemTable__rows"] # rebuilt on load
+        return state
+
+    def __setstate__ (self, state:dict[str,Any]):
+        self.__dict__.update(state)
+        self.__rows = {self.strings[s] : n for n, s in enumerate(self.id)}
+
+    def __len__ (self) -> int:
+        return len(self.id)
+
+    def __iter__ (self) -> Iterator[str]:
+        return iter(self.__rows)
+
+    def __contains__ (self, id:object) -> bool:
+        return id in self.__rows
+
+    def __getitem__ (self, id:str) -> ItemRow:
+        return ItemRow(self, self.__rows[id])
+
+    def keys (self):
+        return self.__rows.keys()
+
+    def values (self) -> Iterator[ItemRow]:
+        return (ItemRow(self, n) for n in range(len(self)))
+
+    def items (self) -> Iterator[tuple[str,ItemRow]]:
+        return ((id, ItemRow(self, n)) for id, n in self.__rows.items())
+
+    def to_items (self) -> dict[str,Item]:
+        "Rebuilds the `dict[str,Item]` this was made from"
+        return {id : row.to_Item() for id, row in self.items()}
+
+    def tags_of (self, n:int) -> list[str]:
+        return [self.strings[t] for t in self.tag[self.tagStart[n]:self.tagStart[n+1]]]
+
+    def __listing (self, n:int) -> Listing:
+        return Listing(**{k : dict(v) if k == "repRequired" else v for k, v in self.listings[n]}) # type: ignore , keys come from a Listing
+
+    def priceInfo_of (self, n:int) -> PricingInfo|None:
+        if self.priceDefault[n] == -1: return None
+        return PricingInfo(self.__listing(self.priceDefault[n]).copy, {
+            self.strings[self.priceMerchant[p]] : self.__listing(self.priceListing[p])
+            for p in range(self.priceStart[n], self.priceStart[n+1])
+        })
+
+    def deconsTo_of (self, n:int) -> Deconstructable|None:
+        if self.deconTime[n] != self.deconTime[n]: return None # NaN
+        return Deconstructable({
+            self.strings[self.deconItem[d]] : self.deconAmount[d]
+            for d in range(self.deconStart[n], self.deconStart[n+1])
+        }, self.deconTime[n])
+
+    def recipes_of (self, n:int) -> list[Recipe]:
+        return [
+            Recipe(
+                {self.strings[self.requiredItem[q]] : self.requiredAmount[q] for q in range(self.requiredStart[r], self.requiredStart[r+1])},
+                self.recipeOutput[r], self.strings[self.recipeMachine[r]], self.recipeTime[r],
+                {self.strings[self.skill[k]] : self.skillLevel[k] for k in range(self.skillStart[r], self.skillStart[r+1])},
+                self.recipeMoney[r]
+            ) for r in range(self.recipeStart[n], self.recipeStart[n+1])
+        ]
+
+    def texture_of (self, n:int, cls:type[Texture]) -> Texture|None:
+        "`cls` being either InventoryIcon or Sprite"
+        path, rect, colour = (
+            (self.iconPath, self.iconRect, self.iconColour) if cls is InventoryIcon
+            else (self.spritePath, self.spriteRect, self.spriteColour)
+        )
+        if path[n] == -1: return None
+        return cls(self.strings[path[n]], tuple(rect[4*n:4*n+4]), self.colours[colour[n]]) # type: ignore , always 4 long
+# end ItemTable
+
+def bench_main (synthetic:int=20000):
+    """Compares how much memory the exported items take as a `dict[str,Item]` against an `ItemTable`,
+    then again for a `write_synthetic_install` of `synthetic` items, like a pile of mods would be. Run from the repo root like `ItemParser.py`"""
+    from gc import collect
+    from glob import glob
+    from pickle import dumps, loads
+    from tempfile import TemporaryDirectory
+    from tracemalloc import start, stop, get_traced_memory
+    from Benchmark import SyntheticSpec, write_synthetic_install
+    from ItemParser import refetch_partial_items, fetch_content_package, fetch_xml_elements, fetch_language, fetch_items
+    items = refetch_partial_items(sorted(glob("assets/json/*/items"))[-1])
+    with TemporaryDirectory() as tmp:
+        write_synthetic_install(tmp, SyntheticSpec(items=synthetic, sheets=1, sheetSize=256)) # the sheets aren't read
+        package = fetch_content_package(tmp, "Vanilla")
+        many = fetch_items(fetch_xml_elements(tmp, package.items), fetch_language(tmp, "English"))
+    for its in (items, many):
+        assert ItemTable(its).to_items() == its, 'Error: ItemTable changed the items'
+    def held (obj:object) -> int:
+        "Bytes still allocated after unpickling a fresh copy of `obj`, so nothing is shared with what's already loaded"
+        blob = dumps(obj)
+        collect()
+        start()
+        copy = loads(blob)
+        size = get_traced_memory()[0]
+        stop()
+        del copy
+        return size
+    for name, its in (("vanilla", items), ("synthetic", many)):
+        a, b = held(its), held(ItemTable(its))
+        print("%-14s %6d items: dict[str,Item] %7.2f MB, ItemTable %7.2f MB, %4.1fx smaller" % (
+            name, len(its), a/2**20, b/2**20, a/b
+        ))
+
+if __name__ == "__main__":
+    from sys import argv
+    bench_main(*(int(a) for a in argv[1:2]))
@@ -0,0 +1,66 @@
+"Contains `PathIndex` and `path_to`, for finding game files when the xml doesn't get the case of their path right."
+
+from functools import cache
+from os import listdir, walk
+from os.path import split as path_split, isdir, isfile, join as path_join, relpath
+from posixpath import normpath
+
+def __validate_path (target:str) -> str:
+    "recursive helper function for `path_to`"
+    if isdir(target): return target
+    head, tail = path_split(target)
+    if head=='':
+        raise IOError(f"Invalid directory '{target}'")
+    head = __validate_path(head)
+    for test in listdir(head):
+        if test.lower() == tail.lower():
+            return head+'/'+test
+    raise IOError(f"Invalid directory '{tail}' at '{head}'")
+
+def path_to (targetPath:str) -> str:
+    """Will attempt to find the file at the given path. Checks for case-sensitivity.
+    Lists every folder along the way, use a `PathIndex` when looking up lots of files."""
+    targetPath = targetPath.replace('\\', '/') # modern windows is fine with forward-slashes
+    if isfile(targetPath): return targetPath
+    head, tail = path_split(targetPath)
+    head = __validate_path(head)
+    for test in listdir(head):
+        if test.lower() == tail.lower():
+            return head + '/' + test
+    raise IOError(f"Invalid file name '{tail}' at '{head}'")
+
+class PathIndex:
+    """Case-insensitive lookup of every file under `rootDir`/`subDir`, 'Content' by default.
+    The index is only built the first time a path doesn't exist as written, after that every lookup is a dict lookup.
+    Use `path_index` to get the one shared by everything working on the same `rootDir`."""
+
+    def __init__(self, rootDir:str, subDir:str="Content") -> None:
+        self.__rootDir = rootDir
+        self.__subDir = subDir
+        self.__index :dict[str,str]|None = None
+
+    def __build (self) -> dict[str,str]:
+        "Walks `subDir` for 'lowercased relative path' -> 'real relative path'"
+        index :dict[str,str] = {}
+        for dir, _, files in walk(path_join(self.__rootDir, self.__subDir)):
+            relDir = relpath(dir, self.__rootDir).replace('\\', '/')
+            for f in files:
+                index[f"{relDir}/{f}".lower()] = f"{relDir}/{f}"
+        return index
+
+    def resolve (self, relPath:str) -> str:
+        """Returns the real path of `relPath`, which is relative to `rootDir`, joined onto `rootDir`.
+        Paths outside of `subDir` fall back to `path_to`. Raises IOError if it can't be found."""
+        rel = normpath(relPath.replace('\\', '/'))
+        if self.__index is None:
+            if isfile(full := path_join(self.__rootDir, rel)): return full.replace('\\', '/')
+            if not rel.lower().startswith(self.__subDir.lower()+'/'): return path_to(full)
+            self.__index = self.__build()
+        if (real := self.__index.get(rel.lower())) is not None:
+            return path_join(self.__rootDir, real).replace('\\', '/')
+        return path_to(path_join(self.__rootDir, rel)) # Not under subDir, or added since we walked
+
+@cache
+def path_index (rootDir:str) -> PathIndex:
+    "The `PathIndex` shared by everything looking up files under `rootDir`"
+    return PathIndex(rootDir)
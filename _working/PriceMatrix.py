@@ -0,0 +1,111 @@
+"Contains `PriceMatrix`, every item's `PricingInfo` resolved once into items x merchants numpy arrays."
+
+from json import dumps as json_dumps
+from typing import Any, Final
+from numpy import array, where, nan, inf, isfinite, argmin, argmax, float64, int32, bool_
+from numpy.typing import NDArray
+from BaroInterface import Item, Listing, PricingInfo, DEFAULT_LISTING, LISTED_DEFAULT_LISTING
+from AssetWriter import AssetWriter
+
+class PriceMatrix:
+    """Construct me with the output of `fetch_items` and `fetch_merchants`.
+    Row `n` is `ids[n]`, column `m` is `merchants[m]`. Listings resolve the same way PriceInfo.js does it:
+    a merchant listing the item falls back to the item's own default listing then to `LISTED_DEFAULT_LISTING`,
+    a merchant that doesn't list it uses `DEFAULT_LISTING`. Items without a price get a `basePrice` of 0."""
+    SELL_MULTIPLIER :Final[float] = 0.3
+    "What merchants pay for an item, as a fraction of its (multiplied) base price"
+    FIELDS :Final[dict[str,type]] = {
+        "sold": bool_, "minAvailable": int32, "maxAvailable": int32, "multiplier": float64,
+        "buyingPriceModifier": float64, "minLevelDifficulty": int32, "canBeSpecial": bool_, "requiresUnlock": bool_,
+    }
+    "The per merchant arrays, by the `Listing` key they come from"
+
+    @staticmethod
+    def __item_default (p:PricingInfo|None) -> Listing:
+        "The listing an item's own `Price` element gives, what its merchants fall back to"
+        return p.default_factory() if p is not None and p.default_factory is not None else Listing()
+
+    def __init__(self, items:dict[str,Item], merchants:list[str]) -> None:
+        self.ids :list[str] = list(items.keys())
+        self.merchants :list[str] = list(merchants)
+        self.basePrice :NDArray[float64] = array([
+            PriceMatrix.__item_default(i.priceInfo).get("basePrice") or 0 for i in items.values()
+        ], float64)
+        columns :dict[str,list[list[Any]]] = {k : [] for k in PriceMatrix.FIELDS}
+        for item in items.values():
+            p = item.priceInfo
+            default = PriceMatrix.__item_default(p)
+            rows :dict[str,list[Any]] = {k : [] for k in PriceMatrix.FIELDS}
+            for merchant in self.merchants:
+                listing = p.get(merchant) if p is not None else None # not p[merchant], that would add it
+                def get (key:str) -> Any:
+                    if listing is None: return DEFAULT_LISTING[key]
+                    for l in (listing, default, LISTED_DEFAULT_LISTING):
+                        if l.get(key) is not None: return l[key]
+                    return None
+                sold = bool(get("sold"))
+                minA = get("minAvailable") if sold else 0
+                maxA = get("maxAvailable") if sold else 0
+                rows["sold"].append(sold)
+                rows["minAvailable"].append(minA)
+                rows["maxAvailable"].append(minA if maxA is None else maxA) # None means the same as min
+                for k in ("multiplier", "buyingPriceModifier", "minLevelDifficulty", "canBeSpecial", "requiresUnlock"):
+                    rows[k].append(get(k))
+            for k in PriceMatrix.FIELDS:
+                columns[k].append(rows[k])
+        shape = (len(self.ids), len(self.merchants))
+        def column (k:str) -> NDArray[Any]:
+            return array(columns[k], PriceMatrix.FIELDS[k]).reshape(shape) # reshape for when there are no items
+        self.sold :NDArray[bool_] = column("sold")
+        self.minAvailable :NDArray[int32] = column("minAvailable")
+        self.maxAvailable :NDArray[int32] = column("maxAvailable")
+        self.multiplier :NDArray[float64] = column("multiplier")
+        self.buyingPriceModifier :NDArray[float64] = column("buyingPriceModifier")
+        self.minLevelDifficulty :NDArray[int32] = column("minLevelDifficulty")
+        self.canBeSpecial :NDArray[bool_] = column("canBeSpecial")
+        self.requiresUnlock :NDArray[bool_] = column("requiresUnlock")
+
+    @property
+    def offered (self) -> NDArray[bool_]:
+        "Whether each merchant can have each item in stock, same test as Item.js"
+        return (self.basePrice[:,None] > 0) & (self.sold | (self.minAvailable != 0) | (self.maxAvailable != 0))
+
+    def buy_prices (self) -> NDArray[float64]:
+        "What each merchant charges for each item, NaN where they don't offer it"
+        return where(self.offered, self.basePrice[:,None] * self.multiplier * self.buyingPriceModifier, nan)
+
+    def sell_prices (self) -> NDArray[float64]:
+        "What each merchant pays for each item, they'll buy anything with a price"
+        return self.basePrice[:,None] * self.multiplier * PriceMatrix.SELL_MULTIPLIER
+
+    def spread (self) -> NDArray[float64]:
+        "Buy price minus sell price at the same merchant, NaN where they don't offer it"
+        return self.buy_prices() - self.sell_prices()
+
+    def cheapest_merchant (self) -> dict[str,str]:
+        "'item id' -> the merchant selling it for the least, only for items someone sells"
+        if not self.merchants: return {}
+        buy = self.buy_prices()
+        best = argmin(where(isfinite(buy), buy, inf), axis=1)
+        return {self.ids[n] : self.merchants[m] for n, m in enumerate(best.tolist()) if isfinite(buy[n, m])}
+
+    def best_buyer (self) -> dict[str,str]:
+        "'item id' -> the merchant paying the most for it, only for items with a price"
+        if not self.merchants: return {}
+        best = argmax(self.sell_prices(), axis=1)
+        return {self.ids[n] : self.merchants[m] for n, m in enumerate(best.tolist()) if self.basePrice[n] > 0}
+
+    def export (self, targetPath:str, writer:AssetWriter|None=None):
+        """Writes `{"merchants": [...], "ids": [...], "basePrice": [...], <field>: [...]}` for every item with a price.
+        Each field is its items x merchants array flattened row by row, booleans as 0/1, so item `n` and merchant `m` is
+        at `n*merchants.length + m`"""
+        rows = (self.basePrice > 0).nonzero()[0]
+        def flat (a:NDArray[Any]) -> list[Any]:
+            a = a[rows].ravel()
+            return (a.astype(int32) if a.dtype == bool_ else a).tolist()
+        (writer or AssetWriter()).write(targetPath, json_dumps({
+            "merchants" : self.merchants,
+            "ids" : [self.ids[n] for n in rows.tolist()],
+            "basePrice" : [int(b) if b.is_integer() else b for b in self.basePrice[rows].tolist()],
+        } | {k : flat(getattr(self, k)) for k in PriceMatrix.FIELDS}, ensure_ascii=False, separators=(',', ':')))
+# end PriceMatrix
@@ -0,0 +1,102 @@
+"""Contains `Profiler`, which records where a build spends its time and memory, stage by stage and file by file.
+Everything taking a `profiler` skips all of it when given None, which is the default."""
+
+from contextlib import contextmanager, nullcontext
+from heapq import heappush, heappushpop
+from json import dumps as json_dumps
+from time import perf_counter, process_time
+from tracemalloc import start, is_tracing, get_traced_memory, reset_peak
+from typing import Any, Callable, ContextManager, Iterator, TypeVar
+from xml.etree.ElementTree import Element
+from AssetWriter import AssetWriter
+
+_T = TypeVar("_T")
+
+__open :list[list[int]] = []
+"[traced bytes when it started, highest peak seen inside it] of every `measure` not done yet, innermost last"
+
+@contextmanager
+def measure () -> Iterator[dict[str,Any]]:
+    """Gives a dict that gets the `wall` and `cpu` seconds of the block, and its `peakBytes`, the most memory it
+    had allocated at once on top of what was there before it. Starts tracemalloc if it isn't already, can be nested.
+    `cpu` only counts this process, not any workers it waits on"""
+    if not is_tracing(): start()
+    current, peak = get_traced_memory()
+    if __open: __open[-1][1] = max(__open[-1][1], peak) # resetting the peak below would lose it otherwise
+    __open.append([current, 0])
+    reset_peak()
+    out :dict[str,Any] = {}
+    wall, cpu = perf_counter(), process_time()
+    try:
+        yield out
+    finally:
+        out["wall"] = perf_counter() - wall
+        out["cpu"] = process_time() - cpu
+        before, highest = __open.pop()
+        peak = max(highest, get_traced_memory()[1])
+        if __open: __open[-1][1] = max(__open[-1][1], peak)
+        out["peakBytes"] = peak - before
+
+class Profiler:
+    """Collects `stages`, `files` and the `slowest` items to build, see `report`.
+    Tracing memory slows Python down, so only make one when profiling was asked for"""
+
+    def __init__(self, slowest:int=20) -> None:
+        self.slowest = slowest
+        self.stages :list[dict[str,Any]] = []
+        self.files :list[dict[str,Any]] = []
+        self.__items :list[tuple[float,str,str]] = [] # a min heap, so the fastest of the slowest is the one dropped
+        self.__wall, self.__cpu = perf_counter(), process_time()
+        if not is_tracing(): start()
+
+    @contextmanager
+    def stage (self, name:str) -> Iterator[dict[str,Any]]:
+        "Measures the block as the stage `name`, anything put in the dict it gives ends up in the report too, like counts"
+        with measure() as m:
+            yield m
+        self.stages.append({"stage" : name} | m)
+
+    @contextmanager
+    def file (self, path:str) -> Iterator[dict[str,Any]]:
+        "Same as `stage` for a single source file, for files read in this process"
+        with measure() as m:
+            yield m
+        self.files.append({"file" : path} | m)
+
+    def item (self, e:Element, build:Callable[[Element],_T]) -> _T:
+        "Returns `build(e)`, keeping how long it took if it's one of the `slowest`"
+        t = perf_counter()
+        out = build(e)
+        took = perf_counter() - t
+        entry = (took, e.get("identifier",""), f"{e.get('dir','')}/{e.get('file','')}.xml")
+        if len(self.__items) < self.slowest: heappush(self.__items, entry)
+        elif took > self.__items[0][0]: heappushpop(self.__items, entry)
+        return out
+
+    def report (self) -> dict[str,Any]:
+        "Everything recorded so far, files and items slowest first"
+        return {
+            "wall" : perf_counter() - self.__wall,
+            "cpu" : process_time() - self.__cpu,
+            "stages" : self.stages,
+            "files" : sorted(self.files, key=lambda f: f["wall"], reverse=True),
+            "slowestItems" : [{"id" : id, "file" : file, "wall" : took} for took, id, file in sorted(self.__items, reverse=True)],
+        }
+
+    def export (self, targetPath:str, writer:AssetWriter|None=None):
+        "Writes `report` as json, and prints the stages"
+        report = self.report()
+        print("%-32s %9s %9s %9s" % ("stage", "wall s", "cpu s", "peak MB"))
+        for s in report["stages"]:
+            print("%-32s %9.3f %9.3f %9.1f" % (s["stage"], s["wall"], s["cpu"], s["peakBytes"]/2**20))
+        print("%-32s %9.3f %9.3f" % ("total", report["wall"], report["cpu"]))
+        (writer or AssetWriter()).write(targetPath, json_dumps(report, ensure_ascii=False, indent=1))
+# end Profiler
+
+def profile_stage (profiler:Profiler|None, name:str) -> ContextManager[dict[str,Any]]:
+    "`profiler.stage(name)`, or nothing at all if `profiler` is None"
+    return nullcontext({}) if profiler is None else profiler.stage(name)
+
+def profile_file (profiler:Profiler|None, path:str) -> ContextManager[dict[str,Any]]:
+    "`profiler.file(path)`, or nothing at all if `profiler` is None"
+    return nullcontext({}) if profiler is None else profiler.file(path)
@@ -0,0 +1,127 @@
+"Contains `RecipeGraph`, the fabrication and deconstruction trees of every item as sparse graphs, fully expanded down to their raw materials."
+
+from functools import cached_property
+from json import dumps as json_dumps
+from typing import Final
+from numpy import array, int32, float64, flatnonzero
+from scipy.sparse import csr_matrix, diags # Can represent a directed graph, used for con or decon trees
+from scipy.sparse.csgraph import connected_components, breadth_first_order
+from BaroInterface import Item
+from AssetWriter import AssetWriter
+
+class Expansion:
+    """One kind of edge between items, see `RecipeGraph`. Row 'a' column 'b' of `adjacency` is how many 'b' go into,
+    or come out of, a single 'a'. Items on a cycle aren't expanded any further, they count as raw materials."""
+
+    def __init__(self, ids:list[str], adjacency:csr_matrix) -> None:
+        self.ids = ids
+        self.index :dict[str,int] = {id : n for n, id in enumerate(ids)}
+        self.adjacency = adjacency
+
+    @cached_property
+    def __components (self) -> tuple[int, list[int]]:
+        "Strongly connected components of `adjacency`, as (count, component of each item)"
+        n, labels = connected_components(self.adjacency, directed=True, connection='strong')
+        return n, labels.tolist()
+
+    @cached_property
+    def cyclic (self) -> list[bool]:
+        "Whether each item is on a cycle, including needing itself"
+        n, labels = self.__components
+        sizes = [0] * n
+        for l in labels: sizes[l] += 1
+        loops = self.adjacency.diagonal()
+        return [sizes[l] > 1 or loops[i] != 0 for i, l in enumerate(labels)]
+
+    def cycles (self) -> list[list[str]]:
+        "Every group of items that (indirectly) make each other, in the order `ids` has them"
+        _, labels = self.__components
+        groups :dict[int,list[str]] = {}
+        for id, l, c in zip(self.ids, labels, self.cyclic):
+            if c: groups.setdefault(l, []).append(id)
+        return list(groups.values())
+
+    @cached_property
+    def totals (self) -> csr_matrix:
+        """Row 'a' column 'b' is how many of raw material 'b' a single 'a' comes down to, following every edge down.
+        Worked out for all items at once, one layer of the tree per sparse multiply."""
+        cut = array([not c for c in self.cyclic], dtype=float64)
+        edges :csr_matrix = csr_matrix(diags(cut) @ self.adjacency) # Cycles stop here
+        leaves = diags((edges.getnnz(axis=1) == 0).astype(float64), format='csr')
+        totals = leaves
+        for _ in range(len(self.ids)): # Always done well before, the tree can't be deeper than every item
+            more :csr_matrix = csr_matrix(leaves + edges @ totals)
+            if (more != totals).nnz == 0: break
+            totals = more
+        totals.eliminate_zeros()
+        return totals
+
+    def expand (self, id:str) -> dict[str,float]:
+        "The raw materials of a single `id`, as 'item id' -> 'amount', or just itself if it has none"
+        if id not in self.index: return {id : 1.0}
+        row = self.totals.getrow(self.index[id])
+        return {self.ids[c] : float(v) for c, v in zip(row.indices, row.data)}
+# end Expansion
+
+class RecipeGraph:
+    """Construct me with the output of `fetch_items`, items that are only referenced to get a node as well.
+    `fabrication` goes from an item to what it's made of, using its first recipe and scaled down to a single item made,
+    `deconstruction` goes from an item to what deconstructing it gives back."""
+    PRECISION :Final[int] = 4
+    "Decimal places kept by `export_trees`, recipes that make several at once give fractions"
+
+    def __init__(self, items:dict[str,Item]) -> None:
+        ids :dict[str,int] = {id : n for n, id in enumerate(items.keys())}
+        def node (id:str) -> int:
+            return ids.setdefault(id, len(ids))
+        fab :tuple[list[int],list[int],list[float]] = ([], [], [])
+        dec :tuple[list[int],list[int],list[float]] = ([], [], [])
+        for id, item in items.items():
+            if item.recipes:
+                r = item.recipes[0]
+                for req, amount in r.required.items():
+                    fab[0].append(ids[id]); fab[1].append(node(req)); fab[2].append(amount / r.output)
+            if item.deconsTo is not None:
+                for out, amount in item.deconsTo.output.items():
+                    dec[0].append(ids[id]); dec[1].append(node(out)); dec[2].append(float(amount))
+        self.ids :list[str] = list(ids.keys())
+        def adjacency (rows:list[int], cols:list[int], data:list[float]) -> csr_matrix:
+            n = len(self.ids)
+            return csr_matrix((array(data, float64), (array(rows, int32), array(cols, int32))), shape=(n, n))
+        self.fabrication = Expansion(self.ids, adjacency(*fab))
+        self.deconstruction = Expansion(self.ids, adjacency(*dec))
+
+    def raw_materials (self, id:str) -> dict[str,float]:
+        "What it takes to fabricate one `id` from scratch"
+        return self.fabrication.expand(id)
+
+    def salvage (self, id:str) -> dict[str,float]:
+        "What deconstructing one `id`, and everything that gives, all the way down gets you"
+        return self.deconstruction.expand(id)
+
+    def used_in (self, id:str) -> list[str]:
+        "Every item whose first recipe needs `id`, directly or further down, nearest first"
+        if id not in self.fabrication.index: return []
+        found = breadth_first_order(self.fabrication.adjacency.T, self.fabrication.index[id], directed=True, return_predecessors=False)
+        return [self.ids[n] for n in found.tolist()[1:]]
+
+    def export_trees (self, targetPath:str, writer:AssetWriter|None=None):
+        """Writes `{"raw": {id: {material: amount}}, "salvage": {...}, "cycles": {"raw": [[id]], "salvage": [[id]]}}`
+        for the Item page. Only items that have a recipe or can be deconstructed are included"""
+        P = RecipeGraph.PRECISION # shorthand
+        def tree (e:Expansion) -> dict[str,dict[str,float|int]]:
+            totals = e.totals
+            return {
+                id : {
+                    self.ids[c] : int(v) if float(v).is_integer() else round(float(v), P)
+                    for c, v in zip(totals.indices[totals.indptr[n]:totals.indptr[n+1]], totals.data[totals.indptr[n]:totals.indptr[n+1]])
+                }
+                for n in flatnonzero(e.adjacency.getnnz(axis=1)).tolist()
+                for id in [self.ids[n]]
+            }
+        (writer or AssetWriter()).write(targetPath, json_dumps({
+            "raw" : tree(self.fabrication),
+            "salvage" : tree(self.deconstruction),
+            "cycles" : {"raw" : self.fabrication.cycles(), "salvage" : self.deconstruction.cycles()},
+        }, ensure_ascii=False, separators=(',', ':')))
+# end RecipeGraph
@@ -0,0 +1,140 @@
+"""Contains `build_index`, a port of the parts of elasticlunr.js (0.9.5) needed to build the search index ahead of time.
+Its output is what `elasticlunr.Index.toJSON` gives, so Search.js can `elasticlunr.Index.load` it instead of building it on every visit."""
+
+from math import sqrt
+from re import compile as re_compile, ASCII
+from typing import Any, Final
+
+VERSION :Final[str] = "0.9.5"
+"elasticlunr version this was ported from, `Index.load` warns if it doesn't match"
+
+PIPELINE :Final[list[str]] = ["trimmer", "stopWordFilter", "stemmer"]
+"The pipeline `elasticlunr()` sets up, by their registered names"
+
+__JS_SPACE = r"\t\n\v\f\r \u00a0\u1680\u2000-\u200a\u2028\u2029\u202f\u205f\u3000\ufeff"
+"JavaScript's `\\s`, written out since Python's differs"
+__SEPARATOR = re_compile(f"[{__JS_SPACE}\\-]+")
+"`elasticlunr.tokenizer.defaultSeperator`, spelling theirs"
+__TRIM = re_compile(f"^[{__JS_SPACE}]+|[{__JS_SPACE}]+$")
+
+def tokenize (text:str) -> list[str]:
+    "`elasticlunr.tokenizer`, for a single string"
+    return __SEPARATOR.split(__TRIM.sub("", text).lower())
+
+__LEADING = re_compile(r"^\W+", ASCII)
+__TRAILING = re_compile(r"\W+$", ASCII)
+
+def trim (token:str) -> str:
+    "`elasticlunr.trimmer`, JavaScript's `\\W` is ASCII only"
+    return __TRAILING.sub("", __LEADING.sub("", token, count=1), count=1)
+
+# The Porter stemmer as elasticlunr.js writes it, regexes and all
+__STEP2 :Final[dict[str,str]] = {
+    "ational":"ate", "tional":"tion", "enci":"ence", "anci":"ance", "izer":"ize", "bli":"ble", "alli":"al",
+    "entli":"ent", "eli":"e", "ousli":"ous", "ization":"ize", "ation":"ate", "ator":"ate", "alism":"al",
+    "iveness":"ive", "fulness":"ful", "ousness":"ous", "aliti":"al", "iviti":"ive", "biliti":"ble", "logi":"log",
+}
+__STEP3 :Final[dict[str,str]] = {"icate":"ic", "ative":"", "alize":"al", "iciti":"ic", "ical":"ic", "ful":"", "ness":""}
+__C = "[^aeiou][^aeiouy]*" # consonant sequence
+__V = "[aeiouy][aeiou]*" # vowel sequence
+__MGR0 = re_compile(f"^({__C})?{__V}{__C}")
+__MEQ1 = re_compile(f"^({__C})?{__V}{__C}({__V})?$")
+__MGR1 = re_compile(f"^({__C})?{__V}{__C}{__V}{__C}")
+__S_V = re_compile(f"^({__C})?[aeiouy]")
+__CVC = re_compile(f"^{__C}[aeiouy][^aeiouwxy]$")
+__RE_1A = re_compile(r"^(.+?)(ss|i)es$")
+__RE2_1A = re_compile(r"^(.+?)([^s])s$")
+__RE_1B = re_compile(r"^(.+?)eed$")
+__RE2_1B = re_compile(r"^(.+?)(ed|ing)$")
+__RE3_1B = re_compile(r"(at|bl|iz)$")
+__RE4_1B = re_compile(r"([^aeiouylsz])\1$")
+__RE_1C = re_compile(r"^(.+?[^aeiou])y$")
+__RE_2 = re_compile("^(.+?)(" + "|".join(__STEP2) + ")$")
+__RE_3 = re_compile("^(.+?)(" + "|".join(__STEP3) + ")$")
+__RE_4 = re_compile(r"^(.+?)(al|ance|ence|er|ic|able|ible|ant|ement|ment|ent|ou|ism|ate|iti|ous|ive|ize)$")
+__RE2_4 = re_compile(r"^(.+?)(s|t)(ion)$")
+__RE_5 = re_compile(r"^(.+?)e$")
+__RE_5_1 = re_compile(r"ll$")
+
+def stem (w:str) -> str:
+    "`elasticlunr.stemmer`"
+    if len(w) < 3: return w
+    first = w[0]
+    if first == "y": w = "Y" + w[1:]
+    # Step 1a
+    if __RE_1A.search(w): w = __RE_1A.sub(r"\1\2", w, count=1)
+    elif __RE2_1A.search(w): w = __RE2_1A.sub(r"\1\2", w, count=1)
+    # Step 1b
+    if (m := __RE_1B.search(w)):
+        if __MGR0.search(m[1]): w = w[:-1]
+    elif (m := __RE2_1B.search(w)):
+        if __S_V.search(m[1]):
+            w = m[1]
+            if __RE3_1B.search(w): w += "e"
+            elif __RE4_1B.search(w): w = w[:-1]
+            elif __CVC.search(w): w += "e"
+    # Step 1c
+    if (m := __RE_1C.search(w)): w = m[1] + "i"
+    # Step 2
+    if (m := __RE_2.search(w)) and __MGR0.search(m[1]): w = m[1] + __STEP2[m[2]]
+    # Step 3
+    if (m := __RE_3.search(w)) and __MGR0.search(m[1]): w = m[1] + __STEP3[m[2]]
+    # Step 4
+    if (m := __RE_4.search(w)):
+        if __MGR1.search(m[1]): w = m[1]
+    elif (m := __RE2_4.search(w)):
+        if __MGR1.search(m[1]+m[2]): w = m[1]+m[2]
+    # Step 5
+    if (m := __RE_5.search(w)):
+        if __MGR1.search(m[1]) or (__MEQ1.search(m[1]) and not __CVC.search(m[1])): w = m[1]
+    if __RE_5_1.search(w) and __MGR1.search(w): w = w[:-1]
+    if first == "y": w = "y" + w[1:]
+    return w
+
+def run_pipeline (tokens:list[str]) -> list[str]:
+    """`PIPELINE` over `tokens`, with `elasticlunr.clearStopWords()` already called like Search.js does.
+    That leaves the stop word filter only dropping tokens the trimmer emptied."""
+    return [stem(t) for t in map(trim, tokens) if t != ""]
+
+def js_key_order (value:Any) -> Any:
+    """`value` with every dict in the order JavaScript iterates objects, and so `JSON.stringify` writes them.
+    That's integer-like keys first, in numeric order, then the rest in insertion order."""
+    if isinstance(value, list): return [js_key_order(v) for v in value]
+    if not isinstance(value, dict): return value
+    def is_index (k:str) -> bool: return k.isdigit() and k.isascii() and str(int(k)) == k and int(k) < 2**32-1
+    ints = sorted((k for k in value if is_index(k)), key=int)
+    return {k : js_key_order(value[k]) for k in ints + [k for k in value if not is_index(k)]}
+
+def build_index (docs:list[dict[str,str]], fields:list[str], ref:str="id") -> dict[str,Any]:
+    """Adds each of `docs` to a new index like `elasticlunr.Index.addDoc` would, with `saveDocument(true)`.
+    Returns what `Index.toJSON` would, in the same key order, see `js_key_order`, so ties in search results come out the same."""
+    roots :dict[str,dict[str,Any]] = {f : {"docs":{}, "df":0} for f in fields}
+    docInfo :dict[str,dict[str,int]] = {}
+    for doc in docs:
+        id = doc[ref]
+        for f in fields:
+            tokens = run_pipeline(tokenize(str(doc[f])) if doc.get(f) is not None else [])
+            docInfo.setdefault(id, {})[f] = len(tokens)
+            counts :dict[str,int] = {}
+            for t in tokens:
+                counts[t] = counts.get(t, 0) + 1
+            for t, n in counts.items():
+                node = roots[f]
+                for ch in t:
+                    node = node.setdefault(ch, {"docs":{}, "df":0})
+                if id not in node["docs"]: node["df"] += 1
+                tf = sqrt(n)
+                node["docs"][id] = {"tf" : int(tf) if tf.is_integer() else tf} # JS writes 1 for 1.0
+    return js_key_order({
+        "version" : VERSION,
+        "fields" : fields,
+        "ref" : ref,
+        "documentStore" : {
+            "docs" : {doc[ref] : doc for doc in docs},
+            "docInfo" : docInfo,
+            "length" : len({doc[ref] for doc in docs}),
+            "save" : True,
+        },
+        "index" : {f : {"root" : roots[f]} for f in fields},
+        "pipeline" : PIPELINE,
+    })
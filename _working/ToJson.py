@@ -1,63 +1,175 @@
+"Contains `to_json` for turning any of the Barotrauma objects into json text, see `JsonEncoder` for how"
 
 from functools import singledispatch
-from typing import Any, NamedTuple, cast
+from json.encoder import JSONEncoder, c_make_encoder, encode_basestring # type: ignore , c_make_encoder isn't in the stubs
+from time import perf_counter
+from glob import glob
+from sys import argv
+from types import UnionType
+from typing import Any, Callable, NamedTuple, TextIO, Union, cast, get_args, get_origin, get_type_hints, is_typeddict
 from collections import defaultdict
 from BaroInterface import maybe, Item, Listing, PricingInfo, Sprite
+try:
+    from orjson import dumps as orjson_dumps # Optional, writes the same text as the json module but a lot faster
+except ImportError:
+    orjson_dumps = None
+
+_SCALARS :frozenset[type] = frozenset({str, int, float, bool, type(None)})
+"Types the json module already writes exactly like `dispatch_to_json` did"
+
+def _is_plain (hint:Any) -> bool:
+    "Whether values annotated as `hint` can only be made of dicts, lists and scalars, so never need converting"
+    if hint in _SCALARS or hint is None: return True
+    if is_typeddict(hint): return all(_is_plain(h) for h in get_type_hints(hint).values())
+    if get_origin(hint) in (dict, list, Union, UnionType): return all(_is_plain(a) for a in get_args(hint))
+    return False
+
+class JsonEncoder:
+    """Turns objects into json text, compact and with strings properly escaped.
+    The first time a class is seen, works out a converter for it and caches that for the class,
+    NamedTuples whose annotations say they only hold plain values are turned straight into dicts.
+    Converters turn our objects into plain dicts and lists, then orjson writes the text if it's installed,
+    otherwise the C encoder from the `json` module does, or always without `orjson`."""
+
+    def __init__ (self, orjson:bool=True) -> None:
+        self.__converters :dict[type, Callable[[Any], Any]] = {}
+        self.__encoder = JSONEncoder(ensure_ascii=False, check_circular=False, allow_nan=False, separators=(',', ':'))
+        self.__write :Callable[[Any], str] = self.__encoder.encode
+        if orjson and orjson_dumps is not None:
+            self.__write = lambda obj: orjson_dumps(obj).decode('utf-8')
+        elif c_make_encoder is not None: # the same thing `JSONEncoder.encode` builds on every call, only built once
+            chunks = c_make_encoder(None, None, encode_basestring, None, ':', ',', False, False, False)
+            self.__write = lambda obj: "".join(chunks(obj, 0))
+
+    def register (self, cls:type, converter:Callable[[Any], Any]):
+        "Use `converter` for `cls` instead of working one out, it should return something made of dicts, lists and scalars"
+        self.__converters[cls] = converter
+
+    def __converter (self, cls:type) -> Callable[[Any], Any]:
+        "Works out how to convert objects of type `cls`, see `plain`"
+        conv = self.plain
+        S = _SCALARS
+        if issubclass(cls, Item):
+            def item (obj:Item) -> dict[str,Any]:
+                return {
+                    "id": obj.id, "name": obj.name, "category": obj.category, "desc": obj.desc,
+                    "tags": obj.tags,
+                    "priceInfo": conv(obj.priceInfo) if obj.priceInfo else {},
+                    "deconsTo": conv(obj.deconsTo) if obj.deconsTo is not None else {},
+                    "recipes": [conv(r) for r in obj.recipes]
+                }
+            return item
+        if issubclass(cls, defaultdict): # a `PricingInfo`, the default listing goes in as 'default'
+            def pricinginfo (obj:defaultdict) -> dict[str,Any]:
+                dic = dict(obj) # `Listing`s are already plain
+                dic['default'] = maybe(obj.default_factory)() or {}
+                return dic
+            return pricinginfo
+        if issubclass(cls, dict):
+            def mapping (obj:dict) -> dict[str,Any]:
+                for v in obj.values():
+                    if type(v) not in S:
+                        return {k : v if type(v) in S else conv(v) for k,v in obj.items()}
+                return obj # nothing to convert, let the json module have it as is
+            return mapping
+        if issubclass(cls, tuple) and hasattr(cls, '_fields'): # a `NamedTuple`
+            fields :tuple[str,...] = cast(Any, cls)._fields
+            hints = get_type_hints(cls)
+            if all(_is_plain(hints.get(f, Any)) for f in fields):
+                def plain_namedtuple (obj:tuple) -> dict[str,Any]:
+                    return dict(zip(fields, obj))
+                return plain_namedtuple
+            def namedtuple (obj:tuple) -> dict[str,Any]:
+                return {k : v if type(v) in S else conv(v) for k,v in zip(fields, obj)}
+            return namedtuple
+        if issubclass(cls, (list, tuple)):
+            def sequence (obj:list|tuple) -> list[Any]:
+                return [v if type(v) in S else conv(v) for v in obj]
+            return sequence
+        raise NotImplementedError(f"Type '{cls}' not supported for `to_json`")
+
+    def plain (self, obj:Any) -> Any:
+        "Converts `obj` into dicts, lists and scalars that the json module can write"
+        cls = type(obj)
+        if cls in _SCALARS: return obj
+        conv = self.__converters.get(cls)
+        if conv is None:
+            conv = self.__converters[cls] = self.__converter(cls)
+        return conv(obj)
+
+    def encode (self, obj:Any) -> str:
+        "Returns `obj` as json text"
+        return self.__write(self.plain(obj))
+
+    def dump (self, obj:Any, fout:TextIO):
+        "Writes `obj` as json text to `fout` chunk by chunk, instead of building the whole string first"
+        for chunk in self.__encoder.iterencode(self.plain(obj)):
+            fout.write(chunk)
+# end JsonEncoder
+
+ENCODER = JsonEncoder()
+"The shared encoder `to_json` uses, register any extra converters on this"
 
-@singledispatch
 def to_json (obj:Any) -> str:
+    "Returns `obj` as json text, raises NotImplementedError for anything it can't handle"
+    return ENCODER.encode(obj)
+
+@singledispatch
+def dispatch_to_json (obj:Any) -> str:
+    """The original encoder, dispatching and concatenating strings value by value. Doesn't escape strings.
+    Kept so `test_main` and `bench_main` have something to check `to_json` against, use `to_json` instead."""
     raise NotImplementedError(f"Type '{type(obj)}' not supported for `to_json`")
 
-@to_json.register
+@dispatch_to_json.register
 def __none (obj:None) -> str:
     return 'null'
 
-@to_json.register
+@dispatch_to_json.register
 def __str (obj:str) -> str:
     return '"' + obj + '"'
 
-@to_json.register
+@dispatch_to_json.register
 def __number (obj:int|float) -> str:
     return str(obj)
 
-@to_json.register
+@dispatch_to_json.register
 def __bool (obj:bool) -> str:
     return str(obj).lower()
 
-@to_json.register
+@dispatch_to_json.register
 def __dict (obj:dict) -> str:
     return '{' + ",".join([
-        f"{to_json(k)}:{to_json(v)}"
+        f"{dispatch_to_json(k)}:{dispatch_to_json(v)}"
         for k,v in obj.items()
     ]) + '}'
 
-@to_json.register
+@dispatch_to_json.register
 def __pricinginfo (obj:defaultdict) -> str:
     dic = dict(obj)
     dic['default'] = maybe(obj.default_factory)() or {}
-    return to_json(dic)
+    return dispatch_to_json(dic)
 
-@to_json.register
+@dispatch_to_json.register
 def __list (obj:list) -> str:
     return f'[{",".join(obj)}]'
 
-@to_json.register
+@dispatch_to_json.register
 def __tuple (obj:tuple) -> str:
     if hasattr(obj, '_fields'): # If obj is a `NamedTuple`
         obj = cast(NamedTuple, obj)  # for pylance
-        return to_json(obj._asdict())
+        return dispatch_to_json(obj._asdict())
     else:
-        return to_json(list(obj))
+        return dispatch_to_json(list(obj))
 
-@to_json.register
+@dispatch_to_json.register
 def __item (obj:Item) -> str:
     return '{"id":"%s","name":"%s","category":"%s","desc":"%s","tags":[%s],"priceInfo":%s,"deconsTo":%s,"recipes":[%s]}' % (
         obj.id, obj.name, obj.category,
         obj.desc.replace('"', '\\"'),
         ",".join(f'"{s}"' for s in obj.tags),
-        to_json(obj.priceInfo) if obj.priceInfo else r"{}",
-        to_json(obj.deconsTo) if obj.deconsTo is not None else r"{}",
-        ",".join(to_json(r) for r in obj.recipes)
+        dispatch_to_json(obj.priceInfo) if obj.priceInfo else r"{}",
+        dispatch_to_json(obj.deconsTo) if obj.deconsTo is not None else r"{}",
+        ",".join(dispatch_to_json(r) for r in obj.recipes)
     )
 
 def test_main ():
@@ -86,16 +198,43 @@ def test_main ():
         'idtag', ['misc', 'fuck'], 'ID Tag', 'this is a desc', 'Category',
         None, None, [], None, Sprite('path', (1,2,3,4), (255,200,155))
     )
-    assert '__dict' in str(to_json.dispatch(type(test1))), 'Error: dictionary object not dispatching to __dict() when it should'
-    assert '__dict' in str(to_json.dispatch(type(test2))), 'Error: Listing object not dispatching to __dict() when it should'
-    assert '__pricinginfo' in str(to_json.dispatch(type(test3))), 'Error: PricingInfo object not dispatching to __pricinginfo() when it should'
-    assert '__item' in str(to_json.dispatch(type(test4))), 'Error: Item object not dispatching to __item() when it should'
+    assert '__dict' in str(dispatch_to_json.dispatch(type(test1))), 'Error: dictionary object not dispatching to __dict() when it should'
+    assert '__dict' in str(dispatch_to_json.dispatch(type(test2))), 'Error: Listing object not dispatching to __dict() when it should'
+    assert '__pricinginfo' in str(dispatch_to_json.dispatch(type(test3))), 'Error: PricingInfo object not dispatching to __pricinginfo() when it should'
+    assert '__item' in str(dispatch_to_json.dispatch(type(test4))), 'Error: Item object not dispatching to __item() when it should'
+    for test in (test1, test2, test3, test4, True, False, 1.23, 15_000_000, 'thingy', None):
+        assert to_json(test) == dispatch_to_json(test), f'Error: to_json and dispatch_to_json disagree on {test!r}'
     assert to_json(True) == 'true'
     assert to_json(False) == 'false'
     assert to_json(1.23) == '1.23'
     assert to_json(15_000_000) == '15000000'
     assert to_json('thingy') == '"thingy"'
     assert to_json(None) == 'null'
+    assert to_json('say "hi"\\n') == '"say \\"hi\\"\\\\n"'
+    assert to_json(['a', 1]) == '["a",1]'
     print(to_json(test3))
 
-if __name__ == "__main__": test_main()
+def bench_main (folderPath:str|None=None, rounds:int=20):
+    """Times `to_json` against `dispatch_to_json` over every exported item in `folderPath`,
+    defaults to the newest version under 'assets/json'. Run from the repo root like `ItemParser.py`.
+    The json module is always timed, orjson as well if it's installed, with how many times faster each is"""
+    from ItemParser import refetch_partial_items
+    folderPath = folderPath or sorted(glob("assets/json/*/items"))[-1]
+    items = list(refetch_partial_items(folderPath).values())
+    assert all(to_json(i) == dispatch_to_json(i) for i in items), 'Error: to_json output changed'
+    size = sum(len(to_json(i)) for i in items) * rounds
+    if orjson_dumps is None: print("orjson isn't installed, to_json is using the json module")
+    funcs :list[tuple[str,Callable[[Any],str]]] = [("dispatch_to_json", dispatch_to_json), ("to_json json", JsonEncoder(orjson=False).encode)]
+    if orjson_dumps is not None: funcs.append(("to_json orjson", to_json))
+    base = 0.0
+    for name, func in funcs:
+        start = perf_counter()
+        for _ in range(rounds):
+            for i in items: func(i)
+        took = perf_counter() - start
+        base = base or took
+        print("%-16s %4d items x %d: %6.3fs, %7.0f items/s, %6.1f MB/s, %4.1fx" % (
+            name, len(items), rounds, took, len(items)*rounds/took, size/took/1e6, base/took
+        ))
+
+if __name__ == "__main__": bench_main() if "bench" in argv[1:] else test_main()
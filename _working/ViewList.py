@@ -0,0 +1,90 @@
+"""Contains `encode_viewlist` and `decode_viewlist`, a compact columnar form of ViewItemsList.json that ViewItems.js reads without parsing json.
+Every number is little-endian and every section starts on a multiple of 4 bytes, padded with zeros:
+
+| Section      | Type                  | What                                                                    |
+|--------------|-----------------------|-------------------------------------------------------------------------|
+| magic        | 4 bytes               | `MAGIC`                                                                 |
+| version      | uint16                | `VERSION`                                                               |
+| reserved     | uint16                | 0                                                                       |
+| rows         | uint32                | Number of items                                                         |
+| stringBytes  | uint32                | Length of `strings`                                                     |
+| strings      | bytes[stringBytes]    | UTF-8, each row's id then its name, each one ending in a NUL            |
+| basePrice    | uint32[rows]          | 0 where the item has no price                                           |
+| flags        | uint8[rows]           | Bit 0 craftable, bit 1 deconstructable                                  |
+
+Ids and names can't hold a NUL since xml can't, so the strings come back with a single decode and split.
+An id is followed by its name since they're usually alike, which gzip makes the most of."""
+
+from array import array
+from sys import byteorder
+from typing import Final, NamedTuple
+
+MAGIC :Final[bytes] = b"SVIL"
+VERSION :Final[int] = 1
+HEADER :Final[int] = 16
+"Bytes before `strings`"
+
+class ViewRow (NamedTuple):
+    "One row of the View Items table"
+    id : str
+    name : str
+    basePrice : int
+    "0 if it doesn't have one"
+    craftable : bool
+    deconable : bool
+
+def __padded (data:bytes) -> bytes:
+    return data + bytes(-len(data) % 4)
+
+def __le (a:array) -> bytes:
+    "The little-endian bytes of `a`, padded to a multiple of 4"
+    if byteorder == "big": a = array(a.typecode, a); a.byteswap()
+    return __padded(a.tobytes())
+
+def encode_viewlist (rows:list[ViewRow]) -> bytes:
+    "The rows in the layout described at the top of this file"
+    strings = "".join(f"{r.id}\0{r.name}\0" for r in rows)
+    data = strings.encode('utf-8')
+    return b"".join([
+        MAGIC, VERSION.to_bytes(2, 'little'), bytes(2), len(rows).to_bytes(4, 'little'), len(data).to_bytes(4, 'little'),
+        __padded(data),
+        __le(array('I', [r.basePrice for r in rows])),
+        __le(array('B', [r.craftable | r.deconable << 1 for r in rows])),
+    ])
+
+def decode_viewlist (data:bytes) -> list[ViewRow]:
+    "The rows `encode_viewlist` encoded, the same way `decode_viewlist` in ViewItems.js does it"
+    if data[:4] != MAGIC: raise ValueError("Not a ViewItemsList")
+    if (version := int.from_bytes(data[4:6], 'little')) != VERSION: raise ValueError(f"Unknown ViewItemsList version {version}")
+    rows, stringBytes = int.from_bytes(data[8:12], 'little'), int.from_bytes(data[12:16], 'little')
+    strings = data[HEADER : HEADER+stringBytes].decode('utf-8').split("\0")
+    at = HEADER + stringBytes + (-stringBytes % 4)
+    prices = array('I', data[at : at + 4*rows])
+    if byteorder == "big": prices.byteswap()
+    flags = data[at + 4*rows : at + 5*rows]
+    return [
+        ViewRow(strings[2*n], strings[2*n+1], prices[n], bool(flags[n] & 1), bool(flags[n] & 2))
+        for n in range(rows)
+    ]
+
+def bench_main (rounds:int=50):
+    "Compares the size and parse time of ViewItemsList.json and the binary form, for the newest exported version"
+    from glob import glob
+    from gzip import compress
+    from json import loads as json_loads
+    from timeit import timeit
+    from ItemParser import refetch_partial_items, viewlist_rows, viewlist_json
+    items = refetch_partial_items(sorted(glob("assets/json/*/items"))[-1])
+    rows = viewlist_rows(items)
+    text = viewlist_json(rows).encode('utf-8')
+    data = encode_viewlist(rows)
+    assert decode_viewlist(data) == rows
+    print("%d rows" % len(rows))
+    print("json   : %7d bytes, %6d gzipped, parsed in %.3f ms" % (
+        len(text), len(compress(text, 9)), 1000*timeit(lambda: json_loads(text), number=rounds)/rounds
+    ))
+    print("binary : %7d bytes, %6d gzipped, parsed in %.3f ms" % (
+        len(data), len(compress(data, 9)), 1000*timeit(lambda: decode_viewlist(data), number=rounds)/rounds
+    ))
+
+if __name__ == "__main__": bench_main()
@@ -6,8 +6,9 @@ function quickTitleCase (str) {
 
 $(async function main() {
     let item_id = URL_params.id;
+    await assetManifestLoaded;
 
-    $("#item-icon img").attr("src", url_to(`items/${gameVersion}/icons/${item_id}`, 'png'));
+    $("#item-icon img").attr("src", asset_url(`items/${gameVersion}/icons/${item_id}`, 'png'));
     $("#item-icon img").ready(() => {
         $("#item-icon span").hide();
         $("#item-icon img").removeClass("d-none");
@@ -19,12 +20,15 @@ $(async function main() {
         $("#item-sprite img").removeClass("d-none");
     });
 
-    let item = await $.getJSON(url_to(`${gameVersion}/items/${item_id}`, 'json'));
+    let item = await fetch_item(item_id);
 
-    $("#item-name").html(item.name);
+    await itemTextsLoaded;
+    const texts = item_texts(item_id, item.name, item.desc);
+
+    $("#item-name").html(texts.name);
     $("#item-name").attr('title', (t) => `In game ID: ${item_id}`);
     $("#item-categories").html('- ' + item.category.replace(',', ' - ') + ' -');
-    $("#item-desc").html(item.desc);
+    $("#item-desc").html(texts.desc);
     $("#item-tags").html(item.tags.join(", "));
     
     let pi = new PriceInfo(item.priceInfo);
@@ -65,10 +69,16 @@ $(async function main() {
 
     if (item.recipes.length) {
         let rows = [];
+        // Ingredients mostly share a bundle, so this is usually one request
+        let names = {};
+        let fetch_names = (ids) => Promise.all(ids.filter((id) => !(id in names)).map((id) =>
+            fetch_item(id).then((i) => names[id] = item_texts(id, i.name, i.desc).name, () => {})
+        ));
+        await fetch_names(item.recipes.flatMap((r) => Object.keys(r.required)));
 
         let recipeCard = (recipe) => {
             let requiredItems = Object.entries(recipe.required)
-                .map(([k,v]) => `${v} x ${k}`)
+                .map(([k,v]) => `${v} x ${names[k] ?? k}`)
                 .join('\n');
             return `
                 <div class="card d-flex flex-row p-2 w-fit">
@@ -102,6 +112,22 @@ $(async function main() {
         };
         item.recipes.forEach((recipe) => rows.push(recipeCard(recipe)));
         $("#recipe-body").html(`${rows.join('')}`);
+        // Raw materials of the first recipe, from RecipeGraph, older versions don't have them
+        $.getJSON(url_to(`${gameVersion}/CraftingTrees`, 'json')).then(async (trees) => {
+            let raw = trees.raw[item_id];
+            if (!raw || trees.cycles.raw.some((c) => c.includes(item_id))) return;
+            await fetch_names(Object.keys(raw));
+            let lines = Object.entries(raw)
+                .map(([k,v]) => `${+v.toFixed(2)} x ${names[k] ?? k}`)
+                .join('\n');
+            $("#recipe-body").append(`
+                <div class="card d-flex flex-row p-2 w-fit">
+                    <div class="p-1" style="white-space:pre-wrap;">${lines}</div>
+                    <div class="vr m-1"></div>
+                    <div class="p-1">${icon('layers')} <span>Raw materials</span></div>
+                </div>
+            `);
+        });
     } else {
         $("#recipe-section").hide();
     }
@@ -1,16 +1,18 @@
-
-// Create search index
-var searchIndex = elasticlunr(function(){
-    this.setRef("id");
-    this.addField("name");
-    this.addField("desc");
-    this.addField("category");
-    this.addField("tags");
-    this.addField("deconsTo");
-    this.addField("recipes");
-    this.addField("price");
-    this.saveDocument(true);
-});
+// Search index, loaded prebuilt from SearchIndex.json, see `export_items_to_searchIndex`
+var searchIndex;
+function newSearchIndex () {
+    return elasticlunr(function(){
+        this.setRef("id");
+        this.addField("name");
+        this.addField("desc");
+        this.addField("category");
+        this.addField("tags");
+        this.addField("deconsTo");
+        this.addField("recipes");
+        this.addField("price");
+        this.saveDocument(true);
+    });
+}
 elasticlunr.clearStopWords();
 
 var lastBg = "warning";
@@ -27,18 +29,19 @@ function viewItem (id) {
     window.location = `${baseURL}/Item.html?id=${id}`;
 }
 
-function card (item) {
-    let imageUrl = url_to(`items/${gameVersion}/icons/${item.id}`, 'png');
+function card (item, atlas) {
+    let imageUrl = asset_url(`items/${gameVersion}/icons/${item.id}`, 'png');
+    let sprite = atlas_icon_style(atlas, item.id);
     // let imageUrl = `{{ site.baseurl }}/assets/images/items/{{ page.version }}/icons/${item.id}.png`;
     let price = item.price!='0' ? Math.ceil(item.price) +" mk" : "∅";
     let con = !!item.recipes? 'success' : 'danger';
     let dec = !!item.deconsTo? 'success' : 'danger';
     return `
     <a class="card" href="${baseURL}/Item.html?id=${item.id}">
-        <text>${item.name}</text>
+        <text>${item_texts(item.id, item.name, item.desc).name}</text>
         <div>
             <div class="item-icon">
-                <img alt="MyItem" src="${imageUrl}">
+                ${sprite === null ? `<img alt="MyItem" src="${imageUrl}">` : `<div role="img" aria-label="MyItem" style="${sprite}"></div>`}
             </div>
             <div class="icons">
                 <i class="fas fa-hammer text-${con}" aria-hidden="true"></i>
@@ -57,10 +60,17 @@ function onError (args) {
 $(async function main () {
     // Populate search index
     updateProgressBar(20, 'info', 'Fetching');
-    let docUrl = url_to(`${gameVersion}/SearchDoc`, 'json');
-    // let docUrl = "{{site.baseurl}}/assets/json/{{ page.version }}/SearchDoc.json";
-    let searchDoc = await $.getJSON(docUrl);
-    searchDoc.forEach(elm => searchIndex.addDoc(elm)); // console.log(elm)
+    try {
+        searchIndex = elasticlunr.Index.load(await $.getJSON(url_to(`${gameVersion}/SearchIndex`, 'json')));
+    } catch (e) {
+        // Older versions only exported the documents, so build it here
+        updateProgressBar(30, 'warning', 'Indexing');
+        let docUrl = url_to(`${gameVersion}/SearchDoc`, 'json');
+        // let docUrl = "{{site.baseurl}}/assets/json/{{ page.version }}/SearchDoc.json";
+        let searchDoc = await $.getJSON(docUrl);
+        searchIndex = newSearchIndex();
+        searchDoc.forEach(elm => searchIndex.addDoc(elm)); // console.log(elm)
+    }
     // Execute search
     updateProgressBar(50, 'success', 'Searching');
     const params = new Proxy(new URLSearchParams(window.location.search), {
@@ -85,10 +95,13 @@ $(async function main () {
     }
     // Populate table
     updateProgressBar(90, 'info', 'Populating');
+    await assetManifestLoaded;
+    await itemTextsLoaded;
+    const atlas = await iconAtlasLoaded;
     let imagePromises = [];
     results.forEach(elm => {
-        $('.search-grid').append(card(elm.doc));
-        imagePromises.push(new Promise(res => {
+        $('.search-grid').append(card(elm.doc, atlas));
+        if (atlas?.icons[elm.doc.id] === undefined) imagePromises.push(new Promise(res => {
             $(".search-grid:last-child img").on("load", res);
         }));
     });
@@ -4,15 +4,48 @@ function viewItem (id) {
 }
 
 
+/**
+ * Reads ViewItemsList.bin, the layout is described at the top of ViewList.py
+ * @param {ArrayBuffer} buffer
+ * @return {Array<Array>} The same rows ViewItemsList.json has, `[id, name, basePrice or "", craftable, deconable]`
+ */
+function decode_viewlist (buffer) {
+    const view = new DataView(buffer);
+    if (view.getUint32(0, true) != 0x4C495653) throw new Error("Not a ViewItemsList"); // "SVIL"
+    if (view.getUint16(4, true) != 1) throw new Error("Unknown ViewItemsList version");
+    const rows = view.getUint32(8, true);
+    const stringBytes = view.getUint32(12, true);
+    const strings = new TextDecoder().decode(new Uint8Array(buffer, 16, stringBytes)).split('\0');
+    const at = 16 + stringBytes + (-stringBytes & 3);
+    const flags = new Uint8Array(buffer, at + 4*rows, rows);
+    const out = new Array(rows);
+    for (let n = 0; n < rows; n++) {
+        const price = view.getUint32(at + 4*n, true);
+        out[n] = [strings[2*n], strings[2*n+1], price || "", flags[n] & 1, (flags[n] >> 1) & 1];
+    }
+    return out;
+}
+
+/**
+ * The rows of this version's ViewItemsList, from the binary form if there is one
+ * @return {Promise<Array<Array>>}
+ */
+async function fetch_viewlist () {
+    try {
+        const response = await fetch(url_to(`${gameVersion}/ViewItemsList`, 'bin'));
+        if (response.ok) return decode_viewlist(await response.arrayBuffer());
+    } catch (e) { console.warn(e); }
+    return await $.getJSON(url_to(`${gameVersion}/ViewItemsList`, 'json'));
+}
+
 let yes = () => '<i class="fa-solid fa-check" style="color: #1aea59;"></i>';
 let no = () => '<i class="fa-solid fa-xmark" style="color: #eb250f;"></i>';
 let NA = () => '<span style="color: grey">N/A</span>'
 
 $(async function main () {
     $('#AllItems').DataTable({
-        ajax: {
-            url: url_to(`${gameVersion}/ViewItemsList`, 'json'),
-            dataSrc: ''
+        ajax: function (data, callback, settings) {
+            fetch_viewlist().then((rows) => callback({data: rows}));
         },
         columns: [
             {   data: 0, // id
@@ -24,10 +24,120 @@ const URL_params = new Proxy(new URLSearchParams(window.location.search), {
 function url_to (path, extension) {
     let dir;
     if (extension == 'png' || extension == 'jpg' || extension=='svg') dir = 'images'
+    else if (extension == 'bin') dir = 'json'
     else dir = extension;
     return `{{ site.baseurl }}/assets/${dir}/${path}.${extension}`
 }
 
+/**
+ * @type {?{blobs: string, files: Object<string, string>}} This version's BlobManifest.json once `assetManifestLoaded` is done,
+ * null if the version was built without one, see `asset_url`
+ */
+let assetManifest = null;
+const assetManifestLoaded = $.getJSON(url_to(`${gameVersion}/BlobManifest`, 'json'))
+    .then((m) => assetManifest = m, () => null);
+
+/**
+ * Same as `url_to`, but for versions built by `main_versions` files shared between versions are stored once by their contents,
+ * so this looks up which one `path` is in `assetManifest`. Wait on `assetManifestLoaded` first
+ * @param {String} path
+ * @param {String} extension
+ * @return {String}
+ */
+function asset_url (path, extension) {
+    const url = url_to(path, extension);
+    const hash = assetManifest?.files[url.substring(`{{ site.baseurl }}/assets/`.length)];
+    if (hash === undefined) return url;
+    return `{{ site.baseurl }}/assets/${assetManifest.blobs}/${hash.substring(0, 2)}/${hash}.${extension}`;
+}
+
+/**
+ * @type {Promise<?{sheets: string[], icons: Object<string, number[]>}>} This version's icon atlas.json, see `atlas_icon_style`.
+ * Null if the version was built without the atlas stage
+ */
+const iconAtlasLoaded = Promise.resolve($.getJSON(`{{ site.baseurl }}/assets/images/items/${gameVersion}/atlas/atlas.json`))
+    .catch(() => null);
+
+/**
+ * Inline css showing the icon of item `id` off `atlas` as a css sprite, scaled to fit a `size` pixel square the way
+ * an img with `object-fit: contain` would be. Null if it isn't on the atlas, use its own png then
+ * @param {?{sheets: string[], icons: Object<string, number[]>}} atlas What `iconAtlasLoaded` gave
+ * @param {string} id
+ * @param {number} [size=64]
+ * @returns {?string}
+ */
+function atlas_icon_style (atlas, id, size=64) {
+    const entry = atlas?.icons[id];
+    if (entry === undefined) return null;
+    const [sheet, x, y, w, h] = entry;
+    const scale = Math.min(size / w, size / h);
+    const url = url_to(`items/${gameVersion}/atlas/${atlas.sheets[sheet].replace(/\.png$/, '')}`, 'png');
+    return `width: ${w}px; height: ${h}px; padding: 0; background: url('${url}') -${x}px -${y}px no-repeat;`
+        + ` transform-origin: 0 0; transform: translate(${(size - w*scale) / 2}px, ${(size - h*scale) / 2}px) scale(${scale});`;
+}
+
+/**
+ * @type {Object<string, Promise<Object>>} Bundles already asked for by `fetch_item`, by name
+ */
+const itemBundles = {};
+/**
+ * @type {?Promise<?{bundles: string[], items: Object<string, number>}>} This version's bundles/index.json, see `fetch_item`
+ */
+let itemBundleIndex = null;
+
+/**
+ * Fetches the item json of `id`. Versions exported with bundles get it from the bundle it's in, so asking for several items
+ * that share a bundle, like the ingredients of a recipe, only takes the one request. Others get it from its own file
+ * @param {string} id
+ * @returns {Promise<Object>}
+ */
+async function fetch_item (id) {
+    await assetManifestLoaded;
+    itemBundleIndex ??= Promise.resolve($.getJSON(asset_url(`${gameVersion}/bundles/index`, 'json'))).catch(() => null);
+    const index = await itemBundleIndex;
+    const n = index?.items[id];
+    if (n === undefined) return $.getJSON(asset_url(`${gameVersion}/items/${id}`, 'json'));
+    const name = index.bundles[n];
+    itemBundles[name] ??= Promise.resolve($.getJSON(asset_url(`${gameVersion}/bundles/${name}`, 'json')));
+    return (await itemBundles[name])[id];
+}
+
+/**
+ * @type {string} Language item names and descriptions are shown in, from the `lang` url parameter, or the last one given
+ */
+const language = URL_params.lang ?? localStorage.getItem('language') ?? 'English';
+if (URL_params.lang) localStorage.setItem('language', URL_params.lang);
+
+/**
+ * @type {?{texts: Object<string, string[]>, ids: Object<string, string[]>}} This version's texts/<language>.json and
+ * texts/TextIds.json once `itemTextsLoaded` is done, null for English or if the version was built without them
+ */
+let itemTexts = null;
+const itemTextsLoaded = (language == 'English' ? Promise.reject() : Promise.all([
+    $.getJSON(url_to(`${gameVersion}/texts/${language}`, 'json')),
+    $.getJSON(url_to(`${gameVersion}/texts/TextIds`, 'json')),
+])).then(([texts, ids]) => itemTexts = {texts, ids}, () => null);
+
+/**
+ * The name and description of item `id` in `language`, the same way `Item.from_Element` puts them together.
+ * Falls back to the given English ones for anything the language doesn't have. Wait on `itemTextsLoaded` first
+ * @param {string} id
+ * @param {string} name
+ * @param {string} desc
+ * @returns {{name: string, desc: string}}
+ */
+function item_texts (id, name, desc) {
+    if (itemTexts === null) return {name, desc};
+    const [nameId, descId, typeId, value] = itemTexts.ids[id] ?? [`entityname.${id}`, `entitydescription.${id}`];
+    const get = (textId) => itemTexts.texts[textId]?.[0];
+    let n = get(nameId), d = get(descId);
+    if (typeId !== undefined) {
+        n = n?.replace("[type]", get(typeId) ?? '');
+        d = d?.replace("[value]", value);
+    }
+    return {name: n ?? name, desc: d ?? desc};
+}
+
 /**
  * Returns an html element for displaying the icon with the given `name`
  * @param {string} name File name for the svg to use, stored in assets/images/icons